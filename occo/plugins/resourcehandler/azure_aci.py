@@ -23,7 +23,6 @@ from __future__ import absolute_import
 import os
 import traceback
 
-from azure.common.credentials import ServicePrincipalCredentials
 from azure.mgmt.resource import ResourceManagementClient
 from azure.mgmt.network import NetworkManagementClient
 from azure.mgmt.network.models import (
@@ -53,7 +52,9 @@ from msrestazure.azure_exceptions import CloudError
 
 import occo.util.factory as factory
 from occo.util import wet_method, coalesce, unique_vmname
-from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker
+from occo.plugins.resourcehandler.azure_common import get_clients
+from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker, \
+    translates_not_found
 import itertools as it
 import logging
 import occo.constants.status as status
@@ -74,17 +75,14 @@ STATE_MAPPING = {
 log = logging.getLogger('occo.resourcehandler.azureaci')
 
 
+def is_not_found(ex):
+    return isinstance(ex, CloudError) and ex.status_code == 404
+
+
 def setup_connection(endpoint, auth_data):
-    subscription_id = auth_data['subscription_id']
-    credentials = ServicePrincipalCredentials(
-        client_id = auth_data['client_id'],
-        secret = auth_data['client_secret'],
-        tenant = auth_data['tenant_id']
-    )
-    resource_client = ResourceManagementClient(credentials, subscription_id)
-    network_client = NetworkManagementClient(credentials, subscription_id)
-    aci_client = ContainerInstanceManagementClient(credentials, subscription_id)
-    return (subscription_id, resource_client, network_client, aci_client)
+    return get_clients(auth_data, ResourceManagementClient,
+                       NetworkManagementClient,
+                       ContainerInstanceManagementClient)
 
 
 def needs_connection(f):
@@ -322,6 +320,7 @@ class GetState(Command):
         self.instance_data = instance_data
 
     @wet_method('ready')
+    @translates_not_found(is_not_found)
     @needs_connection
     def perform(self, resource_handler):
         container_group_name = self.instance_data['instance_id']['instance_id']
@@ -346,6 +345,7 @@ class GetIpAddress(Command):
         self.instance_data = instance_data
 
     @wet_method('127.0.0.1')
+    @translates_not_found(is_not_found)
     @needs_connection
     def perform(self, resource_handler):
         """
@@ -367,6 +367,7 @@ class GetAddress(Command):
         self.instance_data = instance_data
 
     @wet_method('127.0.0.1')
+    @translates_not_found(is_not_found)
     @needs_connection
     def perform(self, resource_handler):
         """
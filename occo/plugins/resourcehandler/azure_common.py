@@ -0,0 +1,106 @@
+### Copyright 2019, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+
+""" Credentials and management clients shared by the Azure resource handler
+plugins.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import logging
+import threading
+import time
+
+from azure.common.credentials import ServicePrincipalCredentials
+
+__all__ = ['get_clients']
+
+log = logging.getLogger('occo.resourcehandler.azure')
+
+# Seconds before its expiry a token is renewed
+token_refresh_margin = 300
+
+class AzureConnection(object):
+    """
+    The credentials of a service principal in a subscription and the
+    management clients built on them.
+
+    Clients keep a reference to the credentials object, so renewing its
+    token in place renews it for every client.
+    """
+    def __init__(self, auth_data):
+        self.subscription_id = auth_data['subscription_id']
+        self.lock = threading.Lock()
+        self.credentials = ServicePrincipalCredentials(
+            client_id = auth_data['client_id'],
+            secret = auth_data['client_secret'],
+            tenant = auth_data['tenant_id']
+        )
+        self.clients = dict()
+
+    def token_expires(self):
+        try:
+            return float(self.credentials.token['expires_on'])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return None
+
+    def refresh_token(self):
+        expires = self.token_expires()
+        if expires is not None and expires - token_refresh_margin < time.time():
+            log.debug('Renewing Azure token of subscription %r',
+                      self.subscription_id)
+            self.credentials.set_token()
+
+    def get_client(self, client_class):
+        client = self.clients.get(client_class)
+        if client is None:
+            client = client_class(self.credentials, self.subscription_id)
+            self.clients[client_class] = client
+        return client
+
+    def get_clients(self, client_classes):
+        with self.lock:
+            self.refresh_token()
+            return [self.get_client(cls) for cls in client_classes]
+
+connections = dict()
+connections_lock = threading.Lock()
+
+def get_connection(auth_data):
+    """
+    Return the shared :class:`AzureConnection` of a service principal and
+    subscription, creating it (and fetching a token) on first use.
+    """
+    key = (auth_data['tenant_id'], auth_data['client_id'],
+           auth_data['subscription_id'],
+           hashlib.sha256(auth_data['client_secret'].encode('utf-8')).hexdigest())
+    with connections_lock:
+        connection = connections.get(key)
+        if connection is None:
+            log.debug('Creating Azure credentials for client %r in '
+                      'subscription %r', auth_data['client_id'],
+                      auth_data['subscription_id'])
+            connection = AzureConnection(auth_data)
+            connections[key] = connection
+        return connection
+
+def get_clients(auth_data, *client_classes):
+    """
+    Return the subscription id and the shared management clients of the
+    given classes, with a token that is valid for a while.
+    """
+    connection = get_connection(auth_data)
+    return tuple([connection.subscription_id] +
+                 connection.get_clients(client_classes))
@@ -23,7 +23,6 @@ from __future__ import absolute_import
 import os
 import traceback
 
-from azure.common.credentials import ServicePrincipalCredentials
 from azure.mgmt.resource import ResourceManagementClient
 from azure.mgmt.network import NetworkManagementClient
 from azure.mgmt.compute import ComputeManagementClient
@@ -33,7 +32,9 @@ from msrestazure.azure_exceptions import CloudError
 
 import occo.util.factory as factory
 from occo.util import wet_method, coalesce, unique_vmname
-from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker
+from occo.plugins.resourcehandler.azure_common import get_clients
+from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker, \
+    translates_not_found
 import itertools as it
 import logging
 import occo.constants.status as status
@@ -60,17 +61,13 @@ STATE_MAPPING = {
 log = logging.getLogger('occo.resourcehandler.azure')
 
 
+def is_not_found(ex):
+    return isinstance(ex, CloudError) and ex.status_code == 404
+
+
 def setup_connection(endpoint, auth_data):
-    subscription_id = auth_data['subscription_id']
-    credentials = ServicePrincipalCredentials(
-        client_id = auth_data['client_id'],
-        secret = auth_data['client_secret'],
-        tenant = auth_data['tenant_id']
-    )
-    resource_client = ResourceManagementClient(credentials, subscription_id)
-    compute_client = ComputeManagementClient(credentials, subscription_id)
-    network_client = NetworkManagementClient(credentials, subscription_id)
-    return (subscription_id, resource_client, compute_client, network_client)
+    return get_clients(auth_data, ResourceManagementClient,
+                       ComputeManagementClient, NetworkManagementClient)
 
 
 def needs_connection(f):
@@ -273,7 +270,14 @@ class DropNode(Command):
     def _delete_vm(self, resource_handler, vm_name, resource_group):
         log.debug("[%s] Deleting VM: %s",
               resource_handler.name, vm_name)
-        disks = self._get_vm_disk(vm_name, resource_group)
+        try:
+            disks = self._get_vm_disk(vm_name, resource_group)
+        except CloudError as ex:
+            if not is_not_found(ex):
+                raise
+            # The VM is gone already; its network resources may still exist
+            log.debug("[%s] VM not found: %s", resource_handler.name, vm_name)
+            return
         vm_del_cmd = self.compute_client.virtual_machines.delete(
             resource_group,
             vm_name
@@ -338,6 +342,7 @@ class GetState(Command):
         self.instance_data = instance_data
 
     @wet_method('ready')
+    @translates_not_found(is_not_found)
     @needs_connection
     def perform(self, resource_handler):
         vm_name = self.instance_data['instance_id']['instance_id']
@@ -364,6 +369,7 @@ class GetIpAddress(Command):
         self.instance_data = instance_data
 
     @wet_method('127.0.0.1')
+    @translates_not_found(is_not_found)
     @needs_connection
     def perform(self, resource_handler):
         """
@@ -380,7 +386,7 @@ class GetIpAddress(Command):
         ni_group = ni_reference[4]
         ni_name = ni_reference[8]
 
-        net_interface = network_client.network_interfaces.get(ni_group, ni_name)
+        net_interface = self.network_client.network_interfaces.get(ni_group, ni_name)
         ip_reference = net_interface.ip_configurations[0].public_ip_address
         if ip_reference == None:
             return net_interface.ip_configurations[0].private_ip_address
@@ -393,6 +399,7 @@ class GetAddress(Command):
         self.instance_data = instance_data
 
     @wet_method('127.0.0.1')
+    @translates_not_found(is_not_found)
     @needs_connection
     def perform(self, resource_handler):
         """
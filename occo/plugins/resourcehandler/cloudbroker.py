@@ -21,20 +21,21 @@
 from urllib.parse import urlparse
 import occo.util.factory as factory
 from occo.util import wet_method, coalesce
-from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker
+from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker, \
+    InstanceNotFound
 import itertools as it
 import logging
 import occo.constants.status as status
-import requests, json, uuid, base64
-import xml.dom.minidom
-from xml.dom.minidom import parseString
+import requests, json, uuid, base64, io
 from xml.etree import ElementTree
 from xml.etree.ElementTree import Element, SubElement, tostring
 from time import sleep
+import time
+import threading
 import xml.etree.ElementTree as ET
 from occo.exceptions import SchemaError, NodeCreationError
 from dicttoxml import dicttoxml
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 
 __all__ = ['CloudBrokerResourceHandler']
 
@@ -45,20 +46,65 @@ log = logging.getLogger('occo.resourcehandler.cloudbroker')
 def get_auth(auth_data):
     return (auth_data['email'], auth_data['password'])
 
+# Fields of an instance document we use, and their names in InstanceRecord
+INSTANCE_FIELDS = {
+    'id': 'id',
+    'status': 'status',
+    'internal-ip-address': 'internal_ip',
+    'external-ip-address': 'external_ip',
+    'internal-hostname': 'internal_hostname',
+    'external-hostname': 'external_hostname',
+}
+
+InstanceRecord = namedtuple('InstanceRecord',
+    ['id', 'status', 'internal_ip', 'external_ip',
+     'internal_hostname', 'external_hostname'])
+
+def parse_instances(document):
+    """
+    Parse a single ``<instance>`` or an ``<instances>`` list response in one
+    streaming pass.
+
+    Only the fields in ``INSTANCE_FIELDS`` of each instance are kept; the
+    parsed elements are freed as the parser goes.
+
+    :param bytes document: The XML response.
+    :returns: List of :class:`InstanceRecord`; missing fields are ``''``.
+    """
+    records, fields, depth, instance_depth = list(), None, 0, None
+    for event, elem in ElementTree.iterparse(io.BytesIO(document),
+                                             events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if elem.tag == 'instance' and fields is None:
+                fields, instance_depth = dict(), depth
+            continue
+        if fields is not None:
+            if depth == instance_depth + 1 and elem.tag in INSTANCE_FIELDS:
+                fields[INSTANCE_FIELDS[elem.tag]] = (elem.text or '').strip()
+            elif depth == instance_depth:
+                records.append(InstanceRecord(
+                    *[fields.get(f, '') for f in InstanceRecord._fields]))
+                fields = None
+                elem.clear()
+        depth -= 1
+    return records
+
 def get_instance(resource_handler, instanceid):
     attempt = 0
     stime = 1
     while attempt < 5:
         query_str = resource_handler.endpoint + '/instances/' + instanceid + '.xml'
         r = requests.get(query_str, auth=get_auth(resource_handler.auth_data))
+        if r.status_code == 404:
+            raise InstanceNotFound(instanceid, 'CloudBroker API returned 404')
         if (r.status_code != 200):
             log.debug('[%s] CloudBroker API call failed! query: %s, status code %d, response: %s',
                       resource_handler.name, query_str, r.status_code, r.text)
         else:
-            DOMTree = xml.dom.minidom.parseString(r.text)
-            instance = DOMTree.documentElement
-            if 0 != instance.getElementsByTagName('id').length:
-                return instance
+            instances = parse_instances(r.content)
+            if instances and instances[0].id:
+                return instances[0]
             else:
                 log.debug('[%s] CloudBroker API returned incorrect answer! No instance id is found.',
                           resource_handler.name, query_str, r.status_code, r.text)
@@ -72,12 +118,99 @@ def get_instance(resource_handler, instanceid):
     log.debug(errormsg)
     raise Exception(errormsg)
 
-def getTagText(nodelist):
-    rc = []
-    for node in nodelist:
-        if node.nodeType == node.TEXT_NODE:
-            rc.append(node.data)
-    return ''.join(rc)
+sweep_page_size = 500
+sweep_max_pages = 100
+# (connect, read) timeouts of the listing requests
+sweep_timeout = (10, 60)
+
+class InstanceSweeper(object):
+    """
+    Snapshot of the instances of an account, taken from the paginated
+    ``/instances.xml`` listing.
+
+    Per-node state and address queries are answered from the snapshot,
+    which is retaken when it gets older than the sweep interval. The
+    listing stops at a short page, at a page bringing no new instances (the
+    API may ignore ``page``) or after ``sweep_max_pages`` pages.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.instances = dict()
+        self.swept_at = None
+
+    def _sweep(self, resource_handler):
+        instances = dict()
+        for page in range(1, sweep_max_pages + 1):
+            query_str = resource_handler.endpoint + '/instances.xml'
+            r = requests.get(query_str, auth=get_auth(resource_handler.auth_data),
+                             params={'page': page, 'per_page': sweep_page_size},
+                             timeout=sweep_timeout)
+            if r.status_code != 200:
+                log.debug('[%s] CloudBroker API call failed! query: %s, status code %d, response: %s',
+                          resource_handler.name, query_str, r.status_code, r.text)
+                return
+            records = parse_instances(r.content)
+            known = len(instances)
+            for instance in records:
+                instances[instance.id] = instance
+            if len(records) < sweep_page_size or len(instances) == known:
+                break
+        else:
+            log.warning('[%s] Listing CloudBroker instances stopped after %d pages',
+                        resource_handler.name, sweep_max_pages)
+        self.instances = instances
+        self.swept_at = time.time()
+
+    def get(self, resource_handler, instance_id, interval):
+        """
+        Return the instance from the snapshot, or ``None`` if the last sweep
+        did not see it.
+        """
+        with self.lock:
+            if self.swept_at is None or time.time() - self.swept_at > interval:
+                self._sweep(resource_handler)
+            return self.instances.get(instance_id)
+
+    def forget(self, instance_id):
+        """
+        Remove an instance from the snapshot, so a stopped instance is not
+        reported from it until the next sweep.
+        """
+        with self.lock:
+            self.instances.pop(instance_id, None)
+
+instance_sweepers = dict()
+instance_sweepers_lock = threading.Lock()
+
+def get_instance_sweeper(endpoint, email):
+    """
+    Return the shared :class:`InstanceSweeper` of an account.
+    """
+    with instance_sweepers_lock:
+        sweeper = instance_sweepers.get((endpoint, email))
+        if sweeper is None:
+            sweeper = instance_sweepers[(endpoint, email)] = InstanceSweeper()
+        return sweeper
+
+def get_node_instance(resource_handler, instance_id):
+    """
+    Return an instance, from the status sweep snapshot if enabled.
+    """
+    if resource_handler.status_sweep_interval:
+        instance = get_instance_sweeper(
+            resource_handler.endpoint, resource_handler.auth_data['email']).get(
+                resource_handler, instance_id, resource_handler.status_sweep_interval)
+        if instance is not None:
+            return instance
+    return get_instance(resource_handler, instance_id)
+
+def forget_node_instance(resource_handler, instance_id):
+    """
+    Remove a dropped instance from the status sweep snapshot.
+    """
+    if resource_handler.status_sweep_interval:
+        get_instance_sweeper(resource_handler.endpoint,
+                             resource_handler.auth_data['email']).forget(instance_id)
 
 class CreateNode(Command):
     def __init__(self, resolved_node_definition):
@@ -110,9 +243,7 @@ class CreateNode(Command):
         log.debug('[%s] CloudBroker instance create response status code %d, response: %s',
                   resource_handler.name, r.status_code, r.text)
         if (r.status_code == 201):
-            DOMTree = xml.dom.minidom.parseString(r.text)
-            instance = DOMTree.documentElement
-            instanceID = instance.getElementsByTagName('id')[0].childNodes[0].data
+            instanceID = parse_instances(r.content)[0].id
             log.debug("[%s] CloudBroker instance started, internal id: %s", resource_handler.name, instanceID)
             return instanceID
         else:
@@ -148,6 +279,8 @@ class DropNode(Command):
         for instance_id in instance_ids:
             r = requests.put(resource_handler.endpoint + '/instances/' + instance_id + '/stop',
                 auth=get_auth(resource_handler.auth_data))
+            if r.status_code == 404:
+                raise InstanceNotFound(instance_id, 'CloudBroker API returned 404')
 
     def perform(self, resource_handler):
         """
@@ -163,7 +296,10 @@ class DropNode(Command):
         log.debug("[%s] Dropping node %r", resource_handler.name,
                 self.instance_data['node_id'])
 
-        self._delete_vms(resource_handler, instance_id)
+        try:
+            self._delete_vms(resource_handler, instance_id)
+        finally:
+            forget_node_instance(resource_handler, instance_id)
 
         log.debug("[%s] Done", resource_handler.name)
 
@@ -174,8 +310,8 @@ class GetState(Command):
 
     @wet_method(status.READY)
     def perform(self, resource_handler):
-        instance = get_instance(resource_handler, self.instance_data['instance_id'])
-        stat = getTagText(instance.getElementsByTagName('status').item(0).childNodes)
+        instance = get_node_instance(resource_handler, self.instance_data['instance_id'])
+        stat = instance.status
         statusMap = {
             'starting': status.PENDING,
             'initializing': status.PENDING,
@@ -196,9 +332,8 @@ class GetIpAddress(Command):
 
     @wet_method('127.0.0.1')
     def perform(self, resource_handler):
-        instance = get_instance(resource_handler, self.instance_data['instance_id'])
-        int_ip = getTagText(instance.getElementsByTagName('internal-ip-address').item(0).childNodes)
-        ext_ip = getTagText(instance.getElementsByTagName('external-ip-address').item(0).childNodes)
+        instance = get_node_instance(resource_handler, self.instance_data['instance_id'])
+        int_ip, ext_ip = instance.internal_ip, instance.external_ip
         log.debug("[%s] Internal IP is: %s, External IP is: %s", resource_handler.name,
                 int_ip, ext_ip)
         return int_ip
@@ -210,11 +345,9 @@ class GetAddress(Command):
 
     @wet_method('127.0.0.1')
     def perform(self, resource_handler):
-        instance = get_instance(resource_handler, self.instance_data['instance_id'])
-        int_dns = getTagText(instance.getElementsByTagName('internal-hostname').item(0).childNodes)
-        ext_dns = getTagText(instance.getElementsByTagName('external-hostname').item(0).childNodes)
-        int_ip = getTagText(instance.getElementsByTagName('internal-ip-address').item(0).childNodes)
-        ext_ip = getTagText(instance.getElementsByTagName('external-ip-address').item(0).childNodes)
+        instance = get_node_instance(resource_handler, self.instance_data['instance_id'])
+        int_dns, ext_dns = instance.internal_hostname, instance.external_hostname
+        int_ip, ext_ip = instance.internal_ip, instance.external_ip
         log.debug("[%s] Internal IP is: %s, External IP is: %s, Internal hostname is: %s, External hostname is: %s",
                 resource_handler.name, int_ip, ext_ip, int_dns, ext_dns)
         addresses = list()
@@ -241,6 +374,9 @@ class CloudBrokerResourceHandler(ResourceHandler):
     :param str name: The name of this ``ResourceHandler`` instance. If unset,
         ``endpoint`` is used.
     :param bool dry_run: Skip actual resource aquisition, polling, etc.
+    :param int status_sweep_interval: If set, node states and addresses are
+        served from the instance listing of the account, retaken at most
+        this often (seconds), instead of fetching each instance.
 
     .. _CloudBroker: http://cloudbroker.com/
     .. _RESTful: https://en.wikipedia.org/wiki/Representational_state_transfer
@@ -256,6 +392,7 @@ class CloudBrokerResourceHandler(ResourceHandler):
            raise NodeCreationError(None, errormsg)
         self.endpoint = endpoint if not dry_run else None
         self.auth_data = auth_data if not dry_run else None
+        self.status_sweep_interval = config.get('status_sweep_interval', None)
 
     def cri_create_node(self, resolved_node_definition):
         return CreateNode(resolved_node_definition)
@@ -280,7 +417,7 @@ class CloudbrokerSchemaChecker(RHSchemaChecker):
     def __init__(self):
         self.req_keys = ["type", "endpoint", "description"]
         self.req_desc_keys = ["deployment_id", "instance_type_id"]
-        self.opt_keys = ["name", "start_in_vpc"]
+        self.opt_keys = ["name", "start_in_vpc", "status_sweep_interval"]
     def perform_check(self, data):
         missing_keys = RHSchemaChecker.get_missing_keys(self, data, self.req_keys)
         if missing_keys:
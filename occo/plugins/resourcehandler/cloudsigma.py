@@ -22,11 +22,14 @@
 from urllib.parse import urlparse
 import occo.util.factory as factory
 from occo.util import wet_method, coalesce, unique_vmname
-from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker
+from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker, \
+    InstanceNotFound
 import itertools as it
 import logging
 import occo.constants.status as status
-import requests, json, uuid, time, base64
+import requests, json, uuid, time, base64, hashlib, threading, copy, atexit
+from concurrent.futures import ThreadPoolExecutor
+import queue
 from occo.exceptions import SchemaError, NodeCreationError
 import http.client
 
@@ -47,14 +50,129 @@ log = logging.getLogger('occo.resourcehandler.cloudsigma')
 wait_time_between_api_call_retries=6
 max_number_of_api_call_retries=50
 
+default_poll_floor = 1
+default_poll_ceiling = 30
+transition_history_size = 50
+
+class TransitionEstimator(object):
+    """
+    Learns how long state transitions take, to poll near their expected end.
+
+    The durations of the transitions seen (``clone``: cloned drive becoming
+    unmounted, ``start``: new server starting, ``stop``: server stopping)
+    are kept for each transition. The next poll is scheduled at the median
+    of the history; once that has passed, at the 90th percentile; then
+    after a quarter of the time already waited. Without history the fixed
+    ``wait_time_between_api_call_retries`` is used. Waits are always kept
+    between a floor and a ceiling.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.history = dict()
+
+    def record(self, transition, duration):
+        with self.lock:
+            durations = self.history.setdefault(transition, list())
+            durations.append(duration)
+            del durations[:-transition_history_size]
+
+    @staticmethod
+    def _quantile(durations, q):
+        return durations[min(len(durations) - 1, int(q * len(durations)))]
+
+    def next_wait(self, transition, elapsed,
+                  floor=default_poll_floor, ceiling=default_poll_ceiling):
+        """
+        Return the time to wait before the next poll of a transition that
+        started ``elapsed`` seconds ago.
+        """
+        with self.lock:
+            durations = sorted(self.history.get(transition, list()))
+        if not durations:
+            wait = wait_time_between_api_call_retries
+        else:
+            for q in (0.5, 0.9):
+                expected = self._quantile(durations, q)
+                if expected > elapsed:
+                    wait = expected - elapsed
+                    break
+            else:
+                wait = elapsed * 0.25
+        return min(max(wait, floor), ceiling)
+
+    def get_estimates(self):
+        """
+        Return the number of samples and the median and 90th percentile
+        duration of each transition.
+        """
+        with self.lock:
+            history = dict((t, sorted(d)) for t, d in self.history.items())
+        return dict((t, dict(count=len(d), p50=self._quantile(d, 0.5),
+                             p90=self._quantile(d, 0.9)))
+                    for t, d in history.items() if d)
+
+estimators = dict()
+estimators_lock = threading.Lock()
+
+def get_estimator(endpoint):
+    """
+    Return the shared :class:`TransitionEstimator` of an endpoint.
+    """
+    with estimators_lock:
+        estimator = estimators.get(endpoint)
+        if estimator is None:
+            estimator = estimators[endpoint] = TransitionEstimator()
+        return estimator
+
+def poll_wait(resource_handler, transition, started):
+    """
+    Sleep until the next poll of a transition started at ``started``.
+    """
+    time.sleep(resource_handler.estimator.next_wait(
+        transition, time.time() - started,
+        resource_handler.poll_floor, resource_handler.poll_ceiling))
+
+default_pool_size = 10
+default_connect_timeout = 10
+default_read_timeout = 60
+
 def get_auth(auth_data):
     return (auth_data['email'], auth_data['password'])
 
+sessions = dict()
+sessions_lock = threading.Lock()
+
+def get_session(endpoint, auth_data, pool_size=default_pool_size):
+    """
+    Return the shared keep-alive ``requests.Session`` of an endpoint and
+    account.
+
+    The session carries the basic auth of the account and keeps up to
+    ``pool_size`` connections open, so API calls made by any command reuse
+    established TCP/TLS connections.
+    """
+    key = (endpoint, auth_data['email'],
+           hashlib.sha256(auth_data['password'].encode('utf-8')).hexdigest())
+    with sessions_lock:
+        session = sessions.get(key)
+        if session is None:
+            log.debug('Creating HTTP session for %r as %r',
+                      endpoint, auth_data['email'])
+            session = requests.Session()
+            session.auth = get_auth(auth_data)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                    pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            sessions[key] = session
+        return session
+
 def get_server_json(resource_handler, srv_id):
     if not srv_id:
        return None
-    r = requests.get(resource_handler.endpoint + '/servers/' + srv_id + '/',
-        auth=get_auth(resource_handler.auth_data))
+    r = resource_handler.api_request('GET', '/servers/' + srv_id + '/')
+    if r.status_code == 404:
+        raise InstanceNotFound(srv_id, 'CloudSigma API returned 404')
     if r.status_code != 200:
         log.error('[%s] Failed to get info from server %s! HTTP response code/message: %d/%s. Server response: %s.',
                   resource_handler.name, srv_id, r.status_code,
@@ -62,14 +180,450 @@ def get_server_json(resource_handler, srv_id):
         return None
     return r.json()
 
-def get_server_status(resource_handler, srv_id):
-    json_data = get_server_json(resource_handler, srv_id)
+sweep_page_size = 500
+
+def list_objects(resource_handler, path):
+    """
+    Return every object of a detail listing (e.g. ``/servers/detail/``)
+    keyed by UUID, following ``limit``/``offset`` pagination; or ``None``
+    if the listing failed.
+    """
+    objects, offset = dict(), 0
+    while True:
+        r = resource_handler.api_request('GET', path,
+                params={'limit': sweep_page_size, 'offset': offset})
+        if r.status_code != 200:
+            log.error('[%s] Failed to list %s! HTTP response code/message: %d/%s. Server response: %s.',
+                      resource_handler.name, path, r.status_code,
+                      http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
+            return None
+        json_data = r.json()
+        page = json_data.get('objects', [])
+        for obj in page:
+            objects[obj['uuid']] = obj
+        total = json_data.get('meta', {}).get('total_count', 0)
+        offset += len(page)
+        if not page or offset >= total:
+            return objects
+
+class ServerSweeper(object):
+    """
+    Snapshot of the servers of an account, taken from the
+    ``/servers/detail/`` listing.
+
+    A sweep follows ``limit``/``offset`` pagination. Per-node state and
+    address queries are answered from the snapshot, which is retaken when
+    it gets older than the sweep interval.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.servers = dict()
+        self.swept_at = None
+
+    def _sweep(self, resource_handler):
+        servers = list_objects(resource_handler, '/servers/detail/')
+        if servers is None:
+            return
+        self.servers = servers
+        self.swept_at = time.time()
+
+    def get(self, resource_handler, srv_id, interval):
+        """
+        Return the server from the snapshot, or ``None`` if the last sweep
+        did not see it.
+        """
+        with self.lock:
+            if self.swept_at is None or time.time() - self.swept_at > interval:
+                self._sweep(resource_handler)
+            return self.servers.get(srv_id)
+
+    def forget(self, srv_id):
+        """
+        Remove a server from the snapshot, so a deleted server is not
+        reported from it until the next sweep.
+        """
+        with self.lock:
+            self.servers.pop(srv_id, None)
+
+server_sweepers = dict()
+server_sweepers_lock = threading.Lock()
+
+def get_server_sweeper(endpoint, email):
+    """
+    Return the shared :class:`ServerSweeper` of an account.
+    """
+    with server_sweepers_lock:
+        sweeper = server_sweepers.get((endpoint, email))
+        if sweeper is None:
+            sweeper = server_sweepers[(endpoint, email)] = ServerSweeper()
+        return sweeper
+
+def get_node_json(resource_handler, srv_id):
+    """
+    Return the details of a server, from the status sweep snapshot if
+    enabled.
+    """
+    if resource_handler.status_sweep_interval and srv_id:
+        json_data = get_server_sweeper(
+            resource_handler.endpoint, resource_handler.auth_data['email']).get(
+                resource_handler, srv_id, resource_handler.status_sweep_interval)
+        if json_data is not None:
+            return json_data
+    return get_server_json(resource_handler, srv_id)
+
+def forget_node(resource_handler, srv_id):
+    """
+    Remove a dropped server from the status sweep snapshot.
+    """
+    if resource_handler.status_sweep_interval:
+        get_server_sweeper(resource_handler.endpoint,
+                           resource_handler.auth_data['email']).forget(srv_id)
+
+def get_server_ip(json_data, default=''):
+    """
+    Return the first IPv4 address among the runtime NICs of a server.
+    """
+    if json_data is None or json_data.get('runtime') is None:
+        return default
+    for nic in json_data['runtime'].get('nics') or []:
+        if nic is not None and nic.get('ip_v4') is not None:
+            return nic['ip_v4'].get('uuid', default)
+    return default
+
+def get_server_status(resource_handler, srv_id, json_data=None):
+    if json_data is None:
+        try:
+            json_data = get_server_json(resource_handler, srv_id)
+        except InstanceNotFound:
+            json_data = None
     if json_data is not None and json_data.get('status'):
       srv_st = json_data['status']
     else:
       srv_st = 'unknown'
     return srv_st
 
+def clone_drive(resource_handler, libdrive_id):
+    r = resource_handler.api_request('POST', '/libdrives/' + libdrive_id + '/action/', params={'do': 'clone'})
+    retry=max_number_of_api_call_retries
+    while r.status_code != 202 and retry>0:
+      error_msg = '[{0}] Cloning library drive {1} failed! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(resource_handler.name, libdrive_id, r.status_code,
+         http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
+      log.debug(error_msg)
+      log.debug('Retrying in {0} seconds...  {1} attempts left.'.format(wait_time_between_api_call_retries,retry))
+      time.sleep(wait_time_between_api_call_retries)
+      retry-=1
+      r = resource_handler.api_request('POST', '/libdrives/' + libdrive_id + '/action/', params={'do': 'clone'})
+    if r.status_code != 202:
+        error_msg = '[{0}] Cloning library drive {1} failed! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
+                    resource_handler.name, libdrive_id, r.status_code,
+                    http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
+        return None, error_msg
+    json_data = json.loads(r.text)
+    uuid = json_data['objects'][0]['uuid']
+    if uuid == None:
+        error_msg = '[{0}] Cloning library drive {1} failed: did not receive UUID!'.format(
+                    resource_handler.name, libdrive_id)
+        return None, error_msg
+    return uuid, ""
+
+def delete_drive(resource_handler, drv_id):
+    r = resource_handler.api_request('DELETE', '/drives/' + str(drv_id) + '/')
+    retry=max_number_of_api_call_retries
+    while r.status_code not in [204, 404] and retry>0:
+      error_msg = '[{0}] Deleting cloned drive {1} failed! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(resource_handler.name, drv_id, r.status_code,
+         http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
+      log.debug(error_msg)
+      log.debug('Retrying in {0} seconds...  {1} attempts left.'.format(wait_time_between_api_call_retries,retry))
+      time.sleep(wait_time_between_api_call_retries)
+      retry-=1
+      r = resource_handler.api_request('DELETE', '/drives/' + str(drv_id) + '/')
+    if r.status_code not in [204, 404]:
+        error_msg = '[{0}] Deleting cloned drive {1} failed! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
+                    resource_handler.name, drv_id, r.status_code,
+                    http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
+        return error_msg
+    return None
+
+
+def get_drive_status(resource_handler, drv_id):
+    r = resource_handler.api_request('GET', '/drives/' + str(drv_id) + '/')
+    retry=max_number_of_api_call_retries
+    while r.status_code not in [200, 404] and retry>0:
+      error_msg = '[{0}] Failed to query status of drive {1}! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(resource_handler.name, drv_id, r.status_code,
+            http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
+      log.debug(error_msg)
+      log.debug('Retrying in {0} seconds...  {1} attempts left.'.format(wait_time_between_api_call_retries,retry))
+      time.sleep(wait_time_between_api_call_retries)
+      retry-=1
+      r = resource_handler.api_request('GET', '/drives/' + str(drv_id) + '/')
+    if r.status_code != 200:
+        error_msg = '[{0}] Failed to query status of drive {1}! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
+                    resource_handler.name, drv_id, r.status_code,
+                    http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
+        return 'unknown', error_msg
+    st = r.json()['status']
+    log.debug('[%s] Status of drive %s is: %s', resource_handler.name, drv_id, st)
+    return st, ""
+
+def wait_for_drive(resource_handler, drv_id, record=True):
+    """
+    Wait until a drive becomes ``unmounted``.
+
+    :param bool record: Record the wait as the duration of a clone.
+    :raises NodeCreationError: if the status of the drive is unknown, e.g.
+        it has been deleted.
+    """
+    started = time.time()
+    drv_st, errormsg = get_drive_status(resource_handler, drv_id)
+    while drv_st != 'unmounted':
+        if drv_st == 'unknown':
+            raise NodeCreationError(None, errormsg)
+        log.debug("[%s] Waiting for cloned drive to enter unmounted state, currently %r",resource_handler.name, drv_st)
+        poll_wait(resource_handler, 'clone', started)
+        drv_st, errormsg = get_drive_status(resource_handler, drv_id)
+    if record:
+        resource_handler.estimator.record('clone', time.time() - started)
+
+default_drive_pool_max_age = 3600
+# Seconds drain() waits for clone requests still waiting for a drive id
+drive_pool_drain_timeout = 30
+
+class DrivePool(object):
+    """
+    Cloned, unmounted drives of a library drive, kept ready for new nodes.
+
+    :meth:`take` hands out a ready drive immediately, and clones a
+    replacement in the background, so creates skip cloning whenever the
+    pool is not empty. The drives in the pool are ordinary, billed drives
+    of the account. Drives older than ``max_age`` seconds and drives that
+    are no longer ``unmounted`` (e.g. deleted outside Occopus) are discarded
+    instead of handed out. :meth:`drain` stops refilling and deletes the
+    ready drives as well as those still being cloned; it is called for
+    every pool at exit.
+
+    :param str libdrive_id: The library drive cloned.
+    :param int depth: Number of drives kept ready.
+    :param float max_age: Seconds a drive may wait in the pool.
+    """
+    def __init__(self, libdrive_id, depth, max_age=default_drive_pool_max_age):
+        self.libdrive_id = libdrive_id
+        self.depth = depth
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.ready = list()
+        self.refilling = 0
+        # Drives cloned but not ready yet, and clone requests still waiting
+        # for the id of their drive
+        self.cloning = set()
+        self.requesting = 0
+        self.requests_done = threading.Condition(self.lock)
+        self.closed = False
+        self.resource_handler = None
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.refill_lags = list()
+
+    def _refill(self, resource_handler):
+        with self.lock:
+            if self.closed:
+                return
+            self.resource_handler = resource_handler
+            missing = self.depth - len(self.ready) - self.refilling
+            self.refilling += max(missing, 0)
+        for i in range(missing):
+            threading.Thread(target=self._clone, args=(resource_handler, time.time()),
+                             name='cloudsigma-drive-pool', daemon=True).start()
+
+    def _clone(self, resource_handler, requested_at):
+        drv_id = None
+        with self.lock:
+            self.requesting += 1
+        try:
+            try:
+                drv_id, errormsg = clone_drive(resource_handler, self.libdrive_id)
+            finally:
+                with self.lock:
+                    self.requesting -= 1
+                    if drv_id:
+                        self.cloning.add(drv_id)
+                    self.requests_done.notify_all()
+            if not drv_id:
+                raise NodeCreationError(None, errormsg)
+            wait_for_drive(resource_handler, drv_id)
+        except Exception as ex:
+            with self.lock:
+                self.refilling -= 1
+                # Not owned any more if drain() has deleted it
+                owned = drv_id in self.cloning
+                self.cloning.discard(drv_id)
+                closed = self.closed
+            if not closed:
+                log.warning('[%s] Failed to add drive to the pool of %r: %s',
+                            resource_handler.name, self.libdrive_id, ex)
+            if owned:
+                delete_drive(resource_handler, drv_id)
+            return
+        with self.lock:
+            self.refilling -= 1
+            owned = drv_id in self.cloning
+            self.cloning.discard(drv_id)
+            closed = self.closed
+            if owned and not closed:
+                self.ready.append((drv_id, time.time()))
+                self.refill_lags = (self.refill_lags + [time.time() - requested_at])[-100:]
+        if closed:
+            if owned:
+                delete_drive(resource_handler, drv_id)
+            return
+        log.debug('[%s] Drive %s added to the pool of %r',
+                  resource_handler.name, drv_id, self.libdrive_id)
+
+    def _discard(self, resource_handler, drv_id, reason):
+        log.warning('[%s] Discarding pooled drive %s of %r: %s',
+                    resource_handler.name, drv_id, self.libdrive_id, reason)
+        with self.lock:
+            self.discarded += 1
+        delete_drive(resource_handler, drv_id)
+
+    def take(self, resource_handler):
+        """
+        Return a ready drive, or ``None`` if the pool is empty; then start
+        refilling the pool.
+        """
+        drv_id = None
+        while drv_id is None:
+            with self.lock:
+                if not self.ready:
+                    self.misses += 1
+                    break
+                drv_id, added_at = self.ready.pop(0)
+            if time.time() - added_at > self.max_age:
+                self._discard(resource_handler, drv_id, 'too old')
+                drv_id = None
+                continue
+            drv_st, errormsg = get_drive_status(resource_handler, drv_id)
+            if drv_st != 'unmounted':
+                self._discard(resource_handler, drv_id,
+                              errormsg or 'status is {0!r}'.format(drv_st))
+                drv_id = None
+                continue
+            with self.lock:
+                self.hits += 1
+        self._refill(resource_handler)
+        return drv_id
+
+    def drain(self, resource_handler=None):
+        """
+        Stop refilling the pool and delete its drives, including those still
+        being cloned.
+
+        The refills run in daemon threads, which do not survive the exit of
+        the interpreter, so the drives they clone are deleted here instead of
+        by them. Clone requests still waiting for the id of their drive are
+        waited for at most ``drive_pool_drain_timeout`` seconds.
+        """
+        deadline = time.time() + drive_pool_drain_timeout
+        with self.lock:
+            self.closed = True
+            while self.requesting and time.time() < deadline:
+                self.requests_done.wait(deadline - time.time())
+            if self.requesting:
+                log.warning('Clone requests of %d drive(s) of %r are still '
+                            'pending; their drives may be left behind',
+                            self.requesting, self.libdrive_id)
+            drives = [drv_id for drv_id, added_at in self.ready] + \
+                sorted(self.cloning)
+            self.ready, self.cloning = list(), set()
+            resource_handler = resource_handler or self.resource_handler
+        for drv_id in drives:
+            delete_drive(resource_handler, drv_id)
+
+    def get_metrics(self):
+        with self.lock:
+            taken = self.hits + self.misses
+            return dict(
+                depth=len(self.ready),
+                target_depth=self.depth,
+                refilling=self.refilling,
+                cloning=len(self.cloning),
+                hits=self.hits,
+                misses=self.misses,
+                discarded=self.discarded,
+                hit_rate=float(self.hits) / taken if taken else None,
+                refill_lag_avg=sum(self.refill_lags) / len(self.refill_lags)
+                               if self.refill_lags else None,
+                refill_lag_last=self.refill_lags[-1] if self.refill_lags else None)
+
+drive_pools = dict()
+drive_pools_lock = threading.Lock()
+
+def get_drive_pool(resource_handler, libdrive_id, depth,
+                   max_age=default_drive_pool_max_age):
+    """
+    Return the shared :class:`DrivePool` of a library drive of an account.
+    """
+    key = (resource_handler.endpoint, resource_handler.auth_data['email'], libdrive_id)
+    with drive_pools_lock:
+        pool = drive_pools.get(key)
+        if pool is None or pool.closed:
+            pool = drive_pools[key] = DrivePool(libdrive_id, depth, max_age)
+        pool.depth = depth
+        pool.max_age = max_age
+        return pool
+
+def drain_drive_pools():
+    """
+    Delete the drives of every drive pool, so they are not left in the
+    account (and billed) after Occopus exits.
+    """
+    with drive_pools_lock:
+        pools = list(drive_pools.values())
+        drive_pools.clear()
+    for pool in pools:
+        try:
+            pool.drain()
+        except Exception as ex:
+            log.warning('Failed to drain the drive pool of %r: %s',
+                        pool.libdrive_id, ex)
+
+atexit.register(drain_drive_pools)
+
+def drive_pool_metrics():
+    """
+    Return the metrics of every drive pool, keyed by
+    ``(endpoint, email, libdrive_id)``.
+    """
+    with drive_pools_lock:
+        pools = dict(drive_pools)
+    return dict((key, pool.get_metrics()) for key, pool in pools.items())
+
+def server_description(resolved_node_definition, drv_id):
+    """
+    Return the description of a new server booting from drive ``drv_id``.
+    """
+    descr = copy.deepcopy(resolved_node_definition['resource']['description'])
+    context = resolved_node_definition.get('context', None)
+    if context is not None:
+        descr['meta'] = {
+            'base64_fields': 'cloudinit-user-data',
+            'cloudinit-user-data': base64.b64encode(context.encode('utf-8')).decode('utf-8')
+        }
+    if 'vnc_password' not in descr:
+        descr['vnc_password'] = resolved_node_definition.get('node_id', "occopus")
+    if 'name' not in descr:
+        descr['name'] = unique_vmname(resolved_node_definition)
+    if 'drives' not in descr:
+        descr['drives'] = []
+    nd = {
+        "boot_order": 1,
+        "dev_channel": "0:0",
+        "device": "virtio",
+        "drive": str(drv_id)
+    }
+    descr['drives'].append(nd)
+    return descr
+
 class CreateNode(Command):
     def __init__(self, resolved_node_definition):
         Command.__init__(self)
@@ -77,75 +631,32 @@ class CreateNode(Command):
 
     @wet_method(["uuid123",""])
     def _clone_drive(self, resource_handler, libdrive_id):
-        r = requests.post(resource_handler.endpoint + '/libdrives/' + libdrive_id + '/action/',
-            auth=get_auth(resource_handler.auth_data), params={'do': 'clone'})
-        retry=max_number_of_api_call_retries
-        while r.status_code != 202 and retry>0:
-          error_msg = '[{0}] Cloning library drive {1} failed! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(resource_handler.name, libdrive_id, r.status_code,
-             http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
-          log.debug(error_msg)
-          log.debug('Retrying in {0} seconds...  {1} attempts left.'.format(wait_time_between_api_call_retries,retry))
-          time.sleep(wait_time_between_api_call_retries)
-          retry-=1
-          r = requests.post(resource_handler.endpoint + '/libdrives/' + libdrive_id + '/action/',
-            auth=get_auth(resource_handler.auth_data), params={'do': 'clone'})
-        if r.status_code != 202:
-            error_msg = '[{0}] Cloning library drive {1} failed! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
-                        resource_handler.name, libdrive_id, r.status_code,
-                        http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
-            return None, error_msg
-        json_data = json.loads(r.text)
-        uuid = json_data['objects'][0]['uuid']
-        if uuid == None:
-            error_msg = '[{0}] Cloning library drive {1} failed: did not receive UUID!'.format(
-                        resource_handler.name, libdrive_id)
-            return None, error_msg
-        return uuid, ""
+        return clone_drive(resource_handler, libdrive_id)
 
     @wet_method()
     def _delete_drive(self, resource_handler, drv_id):
-        r = requests.delete(resource_handler.endpoint + '/drives/' + str(drv_id) + '/',
-            auth=get_auth(resource_handler.auth_data))
-        retry=max_number_of_api_call_retries
-        while r.status_code != 204 and retry>0:
-          error_msg = '[{0}] Deleting cloned drive {1} failed! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(resource_handler.name, drv_id, r.status_code,
-             http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
-          log.debug(error_msg)
-          log.debug('Retrying in {0} seconds...  {1} attempts left.'.format(wait_time_between_api_call_retries,retry))
-          time.sleep(wait_time_between_api_call_retries)
-          retry-=1
-          r = requests.delete(resource_handler.endpoint + '/drives/' + str(drv_id) + '/',
-              auth=get_auth(resource_handler.auth_data))
-        if r.status_code != 204:
-            error_msg = '[{0}] Deleting cloned drive {1} failed! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
-                        resource_handler.name, drv_id, r.status_code,
-                        http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
-            return error_msg
-        return None
-
+        return delete_drive(resource_handler, drv_id)
 
     @wet_method(['unmounted',""])
     def _get_drive_status(self, resource_handler, drv_id):
-        r = requests.get(resource_handler.endpoint + '/drives/' + str(drv_id) + '/',
-            auth=get_auth(resource_handler.auth_data))
-        retry=max_number_of_api_call_retries
-        while r.status_code != 200 and retry>0:
-          error_msg = '[{0}] Failed to query status of drive {1}! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(resource_handler.name, drv_id, r.status_code,
-                http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
-          log.debug(error_msg)
-          log.debug('Retrying in {0} seconds...  {1} attempts left.'.format(wait_time_between_api_call_retries,retry))
-          time.sleep(wait_time_between_api_call_retries)
-          retry-=1
-          r = requests.get(resource_handler.endpoint + '/drives/' + str(drv_id) + '/',
-              auth=get_auth(resource_handler.auth_data))
-        if r.status_code != 200:
-            error_msg = '[{0}] Failed to query status of drive {1}! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
-                        resource_handler.name, drv_id, r.status_code,
-                        http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
-            return 'unknown', error_msg
-        st = r.json()['status']
-        log.debug('[%s] Status of drive %s is: %s', resource_handler.name, drv_id, st)
-        return st, ""
+        return get_drive_status(resource_handler, drv_id)
+
+    @wet_method()
+    def _wait_for_drive(self, resource_handler, drv_id, record):
+        wait_for_drive(resource_handler, drv_id, record)
+
+    @wet_method()
+    def _take_pooled_drive(self, resource_handler):
+        if not resource_handler.drive_pool_size:
+            return None
+        pool = get_drive_pool(resource_handler,
+                              self.resolved_node_definition['resource']['libdrive_id'],
+                              resource_handler.drive_pool_size,
+                              resource_handler.drive_pool_max_age)
+        drv_id = pool.take(resource_handler)
+        if drv_id:
+            log.debug('[%s] Using pooled drive %s', resource_handler.name, drv_id)
+        return drv_id
 
     @wet_method([1,""])
     def _create_server(self, resource_handler, drv_id):
@@ -155,30 +666,9 @@ class CreateNode(Command):
         :Remark: This is a "wet method", the VM will not be started
             if the instance is in debug mode (``dry_run``).
         """
-        descr = self.resolved_node_definition['resource']['description']
-        context = self.resolved_node_definition.get('context', None)
-        if context is not None:
-            descr['meta'] = {
-                'base64_fields': 'cloudinit-user-data',
-                'cloudinit-user-data': base64.b64encode(context.encode('utf-8')).decode('utf-8')
-            }
-        if 'vnc_password' not in descr:
-            descr['vnc_password'] = self.resolved_node_definition.get('node_id', "occopus")
-        if 'name' not in descr:
-            descr['name'] = unique_vmname(self.resolved_node_definition)
-        if 'drivers' not in descr:
-            descr['drives'] = []
-        nd = {
-            "boot_order": 1,
-            "dev_channel": "0:0",
-            "device": "virtio",
-            "drive": str(drv_id)
-        }
-        descr['drives'].append(nd)
         json_data = {}
-        json_data['objects'] = [descr]
-        r = requests.post(resource_handler.endpoint + '/servers/',
-            auth=get_auth(resource_handler.auth_data), json=json_data)
+        json_data['objects'] = [server_description(self.resolved_node_definition, drv_id)]
+        r = resource_handler.api_request('POST', '/servers/', json=json_data)
         retry=max_number_of_api_call_retries
         while r.status_code not in [201] and retry>0:
           error_msg = '[{0}] Failed to create server! HTTP response code/message: {1}/{2}. Server response: {3}.'.format(
@@ -189,8 +679,7 @@ class CreateNode(Command):
           log.debug('Retrying in {0} seconds...  {1} attempts left.'.format(wait_time_between_api_call_retries,retry))
           time.sleep(wait_time_between_api_call_retries)
           retry-=1
-          r = requests.post(resource_handler.endpoint + '/servers/',
-              auth=get_auth(resource_handler.auth_data), json=json_data)
+          r = resource_handler.api_request('POST', '/servers/', json=json_data)
         if r.status_code != 201:
             error_msg = '[{0}] Failed to create server! HTTP response code/message: {1}/{2}. Server response: {3}.'.format(
                         resource_handler.name, r.status_code,
@@ -202,11 +691,10 @@ class CreateNode(Command):
 
     @wet_method()
     def _delete_server(self, resource_handler, srv_id):
-        r = requests.delete(resource_handler.endpoint + '/servers/' + srv_id + '/',
-            auth=get_auth(resource_handler.auth_data), params={'recurse': 'all_drives'},
+        r = resource_handler.api_request('DELETE', '/servers/' + srv_id + '/', params={'recurse': 'all_drives'},
             headers={'Content-type': 'application/json'})
         retry=max_number_of_api_call_retries
-        while r.status_code != 204 and retry>0:
+        while r.status_code not in [204, 404] and retry>0:
           error_msg = '[{0}] Failed to delete server {1}! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
             resource_handler.name, srv_id, r.status_code,
             http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
@@ -214,10 +702,9 @@ class CreateNode(Command):
           log.debug('Retrying in {0} seconds...  {1} attempts left.'.format(wait_time_between_api_call_retries,retry))
           time.sleep(wait_time_between_api_call_retries)
           retry-=1
-          r = requests.delete(resource_handler.endpoint + '/servers/' + srv_id + '/',
-              auth=get_auth(resource_handler.auth_data), params={'recurse': 'all_drives'},
+          r = resource_handler.api_request('DELETE', '/servers/' + srv_id + '/', params={'recurse': 'all_drives'},
               headers={'Content-type': 'application/json'})
-        if r.status_code != 204:
+        if r.status_code not in [204, 404]:
             error_msg = '[{0}] Failed to delete server {1}! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
                         resource_handler.name, srv_id, r.status_code,
                         http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
@@ -226,8 +713,7 @@ class CreateNode(Command):
 
     @wet_method([True,""])
     def _start_server(self, resource_handler, srv_id):
-        r = requests.post(resource_handler.endpoint + '/servers/' + srv_id + '/action/',
-            auth=get_auth(resource_handler.auth_data), params={'do': 'start'})
+        r = resource_handler.api_request('POST', '/servers/' + srv_id + '/action/', params={'do': 'start'})
         if r.status_code != 202:
             error_msg = '[{0}] Failed to start server {1}! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
                         resource_handler.name, srv_id, r.status_code,
@@ -237,8 +723,7 @@ class CreateNode(Command):
 
     @wet_method([True,""])
     def _stop_server(self, resource_handler, srv_id):
-        r = requests.post(resource_handler.endpoint + '/servers/' + srv_id + '/action/',
-            auth=get_auth(resource_handler.auth_data), params={'do': 'stop'})
+        r = resource_handler.api_request('POST', '/servers/' + srv_id + '/action/', params={'do': 'stop'})
         if r.status_code != 202:
              error_msg = '[{0}] Failed to stop server {1}! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
                          resource_handler.name, srv_id, r.status_code,
@@ -251,20 +736,20 @@ class CreateNode(Command):
                   resource_handler.name, self.resolved_node_definition['name'])
         drv_id, srv_id = None, None
         try:
-            drv_id, errormsg = self._clone_drive(resource_handler, self.resolved_node_definition['resource']['libdrive_id'])
+            drv_id = self._take_pooled_drive(resource_handler)
+            cloned = not drv_id
+            if cloned:
+                drv_id, errormsg = self._clone_drive(resource_handler, self.resolved_node_definition['resource']['libdrive_id'])
             if not drv_id:
                 log.error(errormsg)
                 raise NodeCreationError(None, errormsg)
-            drv_st, errormsg = self._get_drive_status(resource_handler, drv_id)
-            while drv_st != 'unmounted':
-                log.debug("[%s] Waiting for cloned drive to enter unmounted state, currently %r",resource_handler.name, drv_st)
-                time.sleep(wait_time_between_api_call_retries)
-                drv_st, errormsg = self._get_drive_status(resource_handler, drv_id)
+            self._wait_for_drive(resource_handler, drv_id, cloned)
             srv_id, errormsg = self._create_server(resource_handler, drv_id)
             if not srv_id:
                 log.error(errormsg)
                 self._delete_drive(resource_handler, drv_id)
                 raise NodeCreationError(None, errormsg)
+            started = time.time()
             srv_st = get_server_status(resource_handler, srv_id)
             while srv_st not in ['starting','started','running']:
                 log.debug("[%s] Server is in %s state. Waiting to enter starting state...",
@@ -273,15 +758,17 @@ class CreateNode(Command):
                   ret, errormsg = self._start_server(resource_handler, srv_id)
                   if not ret:
                      log.debug(errormsg)
-                time.sleep(wait_time_between_api_call_retries)
+                poll_wait(resource_handler, 'start', started)
                 srv_st = get_server_status(resource_handler, srv_id)
+            resource_handler.estimator.record('start', time.time() - started)
         except KeyboardInterrupt:
             log.info('Interrupting node creation! Rolling back. Please, stand by!')
             if srv_id:
+                started = time.time()
                 srv_st = get_server_status(resource_handler, srv_id)
                 while srv_st not in ['stopped','unknown']:
                     log.debug("[%s] Server is in %s state.",resource_handler.name, srv_st)
-                    time.sleep(wait_time_between_api_call_retries)
+                    poll_wait(resource_handler, 'stop', started)
                     if srv_st != 'stopping':
                       self._stop_server(resource_handler, srv_id)
                     srv_st = get_server_status(resource_handler, srv_id)
@@ -296,6 +783,302 @@ class CreateNode(Command):
             raise
         return srv_id
 
+batch_workers = 10
+# Seconds a batch node may wait for its drive to get unmounted and for its
+# server to start
+batch_clone_timeout = 1800
+batch_start_timeout = 900
+
+class BatchNode(object):
+    """
+    A node passing through the :class:`CreateNodes` pipeline.
+    """
+    def __init__(self, resolved_node_definition):
+        self.resolved_node_definition = resolved_node_definition
+        self.drv_id = None
+        self.srv_id = None
+        self.error = None
+        self.cloned = False
+        self.waiting_since = None
+
+class PipelineStage(threading.Thread):
+    """
+    A stage of the :class:`CreateNodes` pipeline.
+
+    The stage takes every node waiting in its inbox at once and hands them
+    to ``process``, which returns the nodes done (passed to the outbox) and
+    the nodes still to be processed (retried after the number of seconds
+    ``poll`` returns for them). A ``None`` in the inbox closes the stage
+    once its pending nodes are done.
+    """
+    def __init__(self, name, process, inbox, outbox, failed, poll=None):
+        threading.Thread.__init__(self, name='cloudsigma-' + name, daemon=True)
+        self.process = process
+        self.inbox = inbox
+        self.outbox = outbox
+        self.failed = failed
+        self.poll = poll
+
+    def _receive(self, pending, block):
+        closed = False
+        try:
+            item = self.inbox.get(block=block)
+            while True:
+                if item is None:
+                    closed = True
+                else:
+                    pending.append(item)
+                item = self.inbox.get_nowait()
+        except queue.Empty:
+            pass
+        return closed
+
+    def run(self):
+        pending, closed = list(), False
+        while True:
+            if not closed:
+                closed = self._receive(pending, block=not pending)
+            if self.failed.is_set():
+                pending = list()
+            if pending:
+                try:
+                    done, pending = self.process(pending)
+                except Exception as ex:
+                    log.exception('Stage %s failed:', self.name)
+                    for node in pending:
+                        node.error = str(ex)
+                    done, pending = list(), list()
+                    self.failed.set()
+                for node in done:
+                    self.outbox.put(node)
+            if closed and not pending:
+                self.outbox.put(None)
+                return
+            if pending and self.poll:
+                time.sleep(self.poll(pending))
+
+class CreateNodes(Command):
+    """
+    Create several nodes through a pipeline of stages connected by queues:
+    cloning drives, awaiting them to become unmounted, defining the servers,
+    starting them and awaiting them to run.
+
+    Each stage handles every node waiting for it at once. Clones and starts
+    are issued in parallel, the servers are defined with a single
+    ``objects`` POST, and each wait needs one listing per poll, whatever
+    the number of nodes. A node fails if its drive or server disappears,
+    or if it waits longer than ``batch_clone_timeout`` or
+    ``batch_start_timeout``. If any node fails, every node of the batch is
+    rolled back.
+    """
+    def __init__(self, resolved_node_definitions):
+        Command.__init__(self)
+        self.resolved_node_definitions = resolved_node_definitions
+
+    def _fail(self, node, errormsg):
+        log.error(errormsg)
+        node.error = errormsg
+        self.failed.set()
+
+    def _clone(self, resource_handler, node):
+        libdrive_id = node.resolved_node_definition['resource']['libdrive_id']
+        node.waiting_since = time.time()
+        if resource_handler.drive_pool_size:
+            pool = get_drive_pool(resource_handler, libdrive_id,
+                                  resource_handler.drive_pool_size,
+                                  resource_handler.drive_pool_max_age)
+            node.drv_id = pool.take(resource_handler)
+        node.cloned = not node.drv_id
+        if not node.drv_id:
+            node.drv_id, errormsg = clone_drive(resource_handler, libdrive_id)
+            if not node.drv_id:
+                self._fail(node, errormsg)
+        return node
+
+    def _stage_clone(self, resource_handler, nodes):
+        done = list(self.executor.map(
+            lambda node: self._clone(resource_handler, node), nodes))
+        return [node for node in done if not node.error], list()
+
+    def _poll(self, resource_handler, transition, nodes):
+        return resource_handler.estimator.next_wait(
+            transition, time.time() - min(node.waiting_since for node in nodes),
+            resource_handler.poll_floor, resource_handler.poll_ceiling)
+
+    def _stage_await_drives(self, resource_handler, nodes):
+        # If the listing fails, the drives are queried one by one below, so
+        # batch_clone_timeout still applies
+        drives = list_objects(resource_handler, '/drives/detail/') or dict()
+        done, pending = list(), list()
+        for node in nodes:
+            drv_st, errormsg = drives.get(node.drv_id, {}).get('status'), None
+            if drv_st is None:
+                drv_st, errormsg = get_drive_status(resource_handler, node.drv_id)
+            log.debug("[%s] Cloned drive %s is in %r state",
+                      resource_handler.name, node.drv_id, drv_st)
+            if drv_st == 'unknown':
+                self._fail(node, errormsg or '[{0}] Cloned drive {1} is in unknown state'.format(
+                           resource_handler.name, node.drv_id))
+            elif time.time() - node.waiting_since > batch_clone_timeout:
+                self._fail(node, '[{0}] Cloned drive {1} is still in {2!r} state after {3} seconds'.format(
+                           resource_handler.name, node.drv_id, drv_st, batch_clone_timeout))
+            elif drv_st == 'unmounted':
+                if node.cloned:
+                    resource_handler.estimator.record(
+                        'clone', time.time() - node.waiting_since)
+                done.append(node)
+            else:
+                pending.append(node)
+        return done, pending
+
+    def _stage_create(self, resource_handler, nodes):
+        json_data = dict(objects=[
+            server_description(node.resolved_node_definition, node.drv_id)
+            for node in nodes])
+        r = resource_handler.api_request('POST', '/servers/', json=json_data)
+        retry=max_number_of_api_call_retries
+        while r.status_code != 201 and retry>0:
+          log.debug('[%s] Failed to create %d servers! HTTP response code/message: %d/%s. Server response: %s.',
+                    resource_handler.name, len(nodes), r.status_code,
+                    http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
+          log.debug('Retrying in {0} seconds...  {1} attempts left.'.format(wait_time_between_api_call_retries,retry))
+          time.sleep(wait_time_between_api_call_retries)
+          retry-=1
+          r = resource_handler.api_request('POST', '/servers/', json=json_data)
+        if r.status_code != 201:
+            errormsg = '[{0}] Failed to create {1} servers! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
+                        resource_handler.name, len(nodes), r.status_code,
+                        http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
+            for node in nodes:
+                self._fail(node, errormsg)
+            return list(), list()
+        servers = r.json().get('objects') or list()
+        if len(servers) != len(nodes):
+            errormsg = '[{0}] Requested {1} servers, CloudSigma API returned {2}'.format(
+                        resource_handler.name, len(nodes), len(servers))
+            # Servers cannot be matched to nodes; only their drives are
+            # rolled back with the nodes, so delete the servers here
+            for server in servers:
+                if server.get('uuid'):
+                    DropNode(dict(instance_id=server['uuid'], node_id=None)
+                             ).perform(resource_handler)
+            for node in nodes:
+                self._fail(node, errormsg)
+            return list(), list()
+        for node, server in zip(nodes, servers):
+            node.srv_id = server['uuid']
+            node.waiting_since = time.time()
+            log.debug('[%s] Created server\'s UUID is: %s', resource_handler.name, node.srv_id)
+        return nodes, list()
+
+    def _start(self, resource_handler, node):
+        r = resource_handler.api_request('POST', '/servers/' + node.srv_id + '/action/',
+                                         params={'do': 'start'})
+        if r.status_code != 202:
+            log.debug('[%s] Failed to start server %s! HTTP response code/message: %d/%s.',
+                      resource_handler.name, node.srv_id, r.status_code,
+                      http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"))
+        return node
+
+    def _stage_start(self, resource_handler, nodes):
+        return list(self.executor.map(
+            lambda node: self._start(resource_handler, node), nodes)), list()
+
+    def _stage_await_running(self, resource_handler, nodes):
+        # If the listing fails, the servers are queried one by one below, so
+        # batch_start_timeout still applies
+        servers = list_objects(resource_handler, '/servers/detail/') or dict()
+        done, pending, stopped = list(), list(), list()
+        for node in nodes:
+            srv_st = servers.get(node.srv_id, {}).get('status')
+            if srv_st is None:
+                try:
+                    srv_st = get_server_status(resource_handler, node.srv_id,
+                                               get_server_json(resource_handler, node.srv_id) or {})
+                except InstanceNotFound as ex:
+                    self._fail(node, '[{0}] {1}'.format(resource_handler.name, ex))
+                    continue
+            if srv_st in ['starting','started','running']:
+                resource_handler.estimator.record(
+                    'start', time.time() - node.waiting_since)
+                done.append(node)
+            elif time.time() - node.waiting_since > batch_start_timeout:
+                self._fail(node, '[{0}] Server {1} is still in {2!r} state after {3} seconds'.format(
+                           resource_handler.name, node.srv_id, srv_st, batch_start_timeout))
+            else:
+                log.debug("[%s] Server %s is in %s state. Waiting to enter starting state...",
+                          resource_handler.name, node.srv_id, srv_st)
+                pending.append(node)
+                if srv_st == 'stopped':
+                    stopped.append(node)
+        self._stage_start(resource_handler, stopped)
+        return done, pending
+
+    def _rollback(self, resource_handler, nodes):
+        log.info('[%s] Rolling back batch of %d nodes', resource_handler.name, len(nodes))
+        for node in nodes:
+            try:
+                if node.srv_id:
+                    DropNode(dict(instance_id=node.srv_id,
+                                  node_id=node.resolved_node_definition.get('node_id'))
+                             ).perform(resource_handler)
+                elif node.drv_id:
+                    delete_drive(resource_handler, node.drv_id)
+            except Exception:
+                log.exception('[%s] Rolling back node failed:', resource_handler.name)
+
+    @wet_method()
+    def _run_pipeline(self, resource_handler):
+        nodes = [BatchNode(rnd) for rnd in self.resolved_node_definitions]
+        self.failed = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=batch_workers)
+        queues = [queue.Queue() for i in range(6)]
+        stages = [
+            PipelineStage('clone', lambda ns: self._stage_clone(resource_handler, ns),
+                          queues[0], queues[1], self.failed),
+            PipelineStage('await-drives', lambda ns: self._stage_await_drives(resource_handler, ns),
+                          queues[1], queues[2], self.failed,
+                          lambda ns: self._poll(resource_handler, 'clone', ns)),
+            PipelineStage('create', lambda ns: self._stage_create(resource_handler, ns),
+                          queues[2], queues[3], self.failed),
+            PipelineStage('start', lambda ns: self._stage_start(resource_handler, ns),
+                          queues[3], queues[4], self.failed),
+            PipelineStage('await-running', lambda ns: self._stage_await_running(resource_handler, ns),
+                          queues[4], queues[5], self.failed,
+                          lambda ns: self._poll(resource_handler, 'start', ns)),
+        ]
+        for stage in stages:
+            stage.start()
+        for node in nodes:
+            queues[0].put(node)
+        queues[0].put(None)
+        try:
+            while stages[-1].is_alive():
+                stages[-1].join(1)
+        except KeyboardInterrupt:
+            log.info('Interrupting node creation! Rolling back. Please, stand by!')
+            self.failed.set()
+            for stage in stages:
+                stage.join()
+            self._rollback(resource_handler, nodes)
+            raise
+        finally:
+            self.executor.shutdown()
+        if self.failed.is_set():
+            self._rollback(resource_handler, nodes)
+            errors = [node.error for node in nodes if node.error]
+            raise NodeCreationError(None, errors[0] if errors else
+                                    'Batch creation of CloudSigma nodes failed')
+        return [node.srv_id for node in nodes]
+
+    def perform(self, resource_handler):
+        log.debug("[%s] Creating %d nodes",
+                  resource_handler.name, len(self.resolved_node_definitions))
+        srv_ids = self._run_pipeline(resource_handler)
+        if srv_ids is None:
+            srv_ids = [1] * len(self.resolved_node_definitions)
+        return srv_ids
+
 class DropNode(Command):
     def __init__(self, instance_data):
         Command.__init__(self)
@@ -303,8 +1086,7 @@ class DropNode(Command):
 
     @wet_method([True,""])
     def _stop_server(self, resource_handler, srv_id):
-        r = requests.post(resource_handler.endpoint + '/servers/' + srv_id + '/action/',
-            auth=get_auth(resource_handler.auth_data), params={'do': 'stop'})
+        r = resource_handler.api_request('POST', '/servers/' + srv_id + '/action/', params={'do': 'stop'})
         if r.status_code != 202:
              error_msg = '[{0}] Failed to stop server {1}! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
                          resource_handler.name, srv_id, r.status_code,
@@ -314,11 +1096,10 @@ class DropNode(Command):
 
     @wet_method()
     def _delete_server(self, resource_handler, srv_id):
-        r = requests.delete(resource_handler.endpoint + '/servers/' + srv_id + '/',
-            auth=get_auth(resource_handler.auth_data), params={'recurse': 'all_drives'},
+        r = resource_handler.api_request('DELETE', '/servers/' + srv_id + '/', params={'recurse': 'all_drives'},
             headers={'Content-type': 'application/json'})
         retry=max_number_of_api_call_retries
-        while r.status_code != 204 and retry>0:
+        while r.status_code not in [204, 404] and retry>0:
           error_msg = '[{0}] Failed to delete server {1}! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
             resource_handler.name, srv_id, r.status_code,
             http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
@@ -326,10 +1107,9 @@ class DropNode(Command):
           log.debug('Retrying in {0} seconds...  {1} attempts left.'.format(wait_time_between_api_call_retries,retry))
           time.sleep(wait_time_between_api_call_retries)
           retry-=1
-          r = requests.delete(resource_handler.endpoint + '/servers/' + srv_id + '/',
-              auth=get_auth(resource_handler.auth_data), params={'recurse': 'all_drives'},
+          r = resource_handler.api_request('DELETE', '/servers/' + srv_id + '/', params={'recurse': 'all_drives'},
               headers={'Content-type': 'application/json'})
-        if r.status_code != 204:
+        if r.status_code not in [204, 404]:
             error_msg = '[{0}] Failed to delete server {1}! HTTP response code/message: {2}/{3}. Server response: {4}.'.format(
                         resource_handler.name, srv_id, r.status_code,
                         http.client.responses.get(r.status_code,"(undefined http code returned by CloudSigma API)"), r.text)
@@ -351,14 +1131,22 @@ class DropNode(Command):
         log.debug("[%s] Deleting server %r", resource_handler.name,
                 self.instance_data['node_id'])
 
-        srv_st = get_server_status(resource_handler, srv_id)
-        while srv_st not in ['stopped','unknown']:
-            log.debug("[%s] Server is in %s state. Waiting for \"stopped\" state...",resource_handler.name, srv_st)
-            if srv_st != 'stopping':
-              self._stop_server(resource_handler, srv_id)
-            time.sleep(wait_time_between_api_call_retries)
-            srv_st = get_server_status(resource_handler, srv_id)
-        self._delete_server(resource_handler, srv_id)
+        started = time.time()
+        try:
+            # A server that is already gone raises InstanceNotFound here
+            srv_st = get_server_status(resource_handler, srv_id,
+                                       get_server_json(resource_handler, srv_id) or {})
+            while srv_st not in ['stopped','unknown']:
+                log.debug("[%s] Server is in %s state. Waiting for \"stopped\" state...",resource_handler.name, srv_st)
+                if srv_st != 'stopping':
+                  self._stop_server(resource_handler, srv_id)
+                poll_wait(resource_handler, 'stop', started)
+                srv_st = get_server_status(resource_handler, srv_id)
+            if srv_st == 'stopped':
+                resource_handler.estimator.record('stop', time.time() - started)
+            self._delete_server(resource_handler, srv_id)
+        finally:
+            forget_node(resource_handler, srv_id)
 
         log.debug("[%s] Deleting server: done", resource_handler.name)
 
@@ -370,7 +1158,8 @@ class GetState(Command):
     @wet_method(status.READY)
     def perform(self, resource_handler):
         srv_id = self.instance_data['instance_id']
-        srv_st = get_server_status(resource_handler, srv_id)
+        srv_st = get_server_status(resource_handler, srv_id,
+                                   get_node_json(resource_handler, srv_id))
         try:
             retval = STATE_MAPPING[srv_st]
         except KeyError:
@@ -388,20 +1177,7 @@ class GetIpAddress(Command):
     @wet_method('127.0.0.1')
     def perform(self, resource_handler):
         srv_id = self.instance_data['instance_id']
-        rv = ''
-        json_data = get_server_json(resource_handler, srv_id)
-        if json_data == None:
-            return rv
-        if json_data.get('runtime',None) == None:
-            return rv
-        if 'nics' not in json_data['runtime']:
-            return rv
-        for nic in json_data['runtime']['nics']:
-            if nic == None:
-              continue
-            if nic.get('ip_v4') is not None:
-              return nic.get('ip_v4').get('uuid',rv)
-        return rv
+        return get_server_ip(get_node_json(resource_handler, srv_id))
 
 class GetAddress(Command):
     def __init__(self, instance_data):
@@ -411,20 +1187,7 @@ class GetAddress(Command):
     @wet_method('127.0.0.1')
     def perform(self, resource_handler):
         srv_id = self.instance_data['instance_id']
-        rv = ''
-        json_data = get_server_json(resource_handler, srv_id)
-        if json_data == None:
-            return rv
-        if json_data.get('runtime',None) == None:
-            return rv
-        if 'nics' not in json_data['runtime']:
-            return rv
-        for nic in json_data['runtime']['nics']:
-            if nic == None:
-              continue
-            if nic.get('ip_v4') is not None:
-              return nic.get('ip_v4').get('uuid',rv)
-        return rv
+        return get_server_ip(get_node_json(resource_handler, srv_id))
 
 @factory.register(ResourceHandler, PROTOCOL_ID)
 class CloudSigmaResourceHandler(ResourceHandler):
@@ -441,6 +1204,22 @@ class CloudSigmaResourceHandler(ResourceHandler):
     :param str name: The name of this ``ResourceHandler`` instance. If unset,
         ``endpoint`` is used.
     :param bool dry_run: Skip actual resource aquisition, polling, etc.
+    :param int pool_size: Number of connections kept open to the API.
+    :param int status_sweep_interval: If set, node states and addresses are
+        served from the servers detail listing, retaken at most this often
+        (seconds), instead of fetching each server.
+    :param float poll_floor: Shortest wait between two polls of a state
+        transition (seconds).
+    :param float poll_ceiling: Longest wait between two polls of a state
+        transition (seconds).
+    :param int drive_pool_size: If set, this many cloned drives of each
+        library drive are kept ready, so new nodes need not wait for cloning.
+        The pooled drives are deleted at exit.
+    :param float drive_pool_max_age: Pooled drives older than this (seconds)
+        are deleted instead of used.
+    :param float connect_timeout: Timeout of connecting to the API (seconds).
+    :param float read_timeout: Timeout of waiting for an API response
+        (seconds).
 
     .. _CloudSigma: https://www.cloudsigma.com/
     .. _RESTful: https://en.wikipedia.org/wiki/Representational_state_transfer
@@ -456,10 +1235,51 @@ class CloudSigmaResourceHandler(ResourceHandler):
            raise NodeCreationError(None, errormsg)
         self.endpoint = endpoint if not dry_run else None
         self.auth_data = auth_data if not dry_run else None
+        self.timeout = (config.get('connect_timeout', default_connect_timeout),
+                        config.get('read_timeout', default_read_timeout))
+        self.session = get_session(endpoint, auth_data,
+                                   config.get('pool_size', default_pool_size)) \
+                       if not dry_run else None
+        self.drive_pool_size = config.get('drive_pool_size', None)
+        self.drive_pool_max_age = config.get('drive_pool_max_age',
+                                             default_drive_pool_max_age)
+        self.status_sweep_interval = config.get('status_sweep_interval', None)
+        self.poll_floor = config.get('poll_floor', default_poll_floor)
+        self.poll_ceiling = config.get('poll_ceiling', default_poll_ceiling)
+        self.estimator = get_estimator(self.endpoint)
+
+    def get_transition_estimates(self):
+        """
+        Return the learned durations of drive clones, server starts and
+        stops.
+        """
+        return self.estimator.get_estimates()
+
+    def get_drive_pool_metrics(self):
+        """
+        Return the depth, hit rate and refill lag of the drive pools.
+        """
+        return drive_pool_metrics()
+
+    def drain_drive_pools(self):
+        """
+        Delete the drives kept ready in the drive pools.
+        """
+        drain_drive_pools()
+
+    def api_request(self, method, path, **kwargs):
+        """
+        Call the CloudSigma API through the shared session.
+        """
+        return self.session.request(method, self.endpoint + path,
+                                    timeout=self.timeout, **kwargs)
 
     def cri_create_node(self, resolved_node_definition):
         return CreateNode(resolved_node_definition)
 
+    def cri_create_nodes(self, resolved_node_definitions):
+        return CreateNodes(resolved_node_definitions)
+
     def cri_drop_node(self, instance_data):
         return DropNode(instance_data)
 
@@ -480,7 +1300,9 @@ class CloudSigmaSchemaChecker(RHSchemaChecker):
     def __init__(self):
         self.req_keys = ["type", "endpoint", "libdrive_id", "description"]
         self.req_desc_keys = ['cpu', 'mem', 'vnc_password']
-        self.opt_keys = ["name"]
+        self.opt_keys = ["name", "pool_size", "connect_timeout", "read_timeout",
+                         "drive_pool_size", "drive_pool_max_age", "status_sweep_interval",
+                         "poll_floor", "poll_ceiling"]
     def perform_check(self, data):
         missing_keys = RHSchemaChecker.get_missing_keys(self, data, self.req_keys)
         if missing_keys:
@@ -21,9 +21,17 @@
 import occo.util.factory as factory
 import docker
 import ast
+import contextlib
+import hashlib
 import logging
+import os
+import tempfile
+import threading
+import time
+import requests
 from occo.util import wet_method, coalesce
-from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker
+from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker, \
+    translates_not_found
 import occo.constants.status as status
 from occo.exceptions import SchemaError
 
@@ -33,6 +41,547 @@ PROTOCOL_ID = 'docker'
 
 log = logging.getLogger('occo.resourcehandler.docker')
 
+default_max_connections = 10
+
+# Calls that are safe to repeat when the connection to the daemon breaks
+IDEMPOTENT_CALLS = ['containers', 'images', 'info', 'inspect_container',
+                    'inspect_image', 'pull', 'remove_container', 'stop',
+                    'version']
+
+clients = dict()
+clients_lock = threading.Lock()
+
+def get_client(endpoint, max_connections):
+    """
+    Return the shared ``docker.APIClient`` of an endpoint.
+
+    The client keeps at most ``max_connections`` connections to the daemon
+    and is shared by every command of every resource handler using the same
+    endpoint.
+    """
+    with clients_lock:
+        cli = clients.get(endpoint)
+        if cli is None:
+            log.debug('Creating Docker client for %r', endpoint)
+            try:
+                cli = docker.APIClient(base_url=endpoint,
+                                       max_pool_size=max_connections)
+            except TypeError:
+                # docker-py releases before max_pool_size existed
+                cli = docker.APIClient(base_url=endpoint)
+            clients[endpoint] = cli
+        return cli
+
+def drop_client(endpoint, cli):
+    """
+    Forget a client whose connections broke, so the next call builds a new
+    one.
+    """
+    with clients_lock:
+        if clients.get(endpoint) is cli:
+            del clients[endpoint]
+    try:
+        cli.close()
+    except Exception:
+        pass
+
+def is_not_found(ex):
+    return isinstance(ex, docker.errors.NotFound)
+
+class PooledClient(object):
+    """
+    Proxy of the shared client of an endpoint.
+
+    When a call fails because the connection to the daemon broke (e.g. the
+    daemon was restarted), the client is rebuilt; idempotent calls are then
+    retried once.
+    """
+    def __init__(self, endpoint, max_connections=default_max_connections):
+        self.endpoint = endpoint
+        self.max_connections = max_connections
+
+    def __getattr__(self, name):
+        attr = getattr(get_client(self.endpoint, self.max_connections), name)
+        if not callable(attr):
+            return attr
+        def call(*args, **kwargs):
+            cli = get_client(self.endpoint, self.max_connections)
+            try:
+                return getattr(cli, name)(*args, **kwargs)
+            except requests.exceptions.ConnectionError as ex:
+                log.warning('Connection to Docker daemon %r failed: %s',
+                            self.endpoint, ex)
+                drop_client(self.endpoint, cli)
+                if name not in IDEMPOTENT_CALLS:
+                    raise
+                cli = get_client(self.endpoint, self.max_connections)
+                return getattr(cli, name)(*args, **kwargs)
+        return call
+
+class ImageLoad(object):
+    """
+    An image load in progress; other creates needing the same image wait
+    for it instead of loading the image themselves.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+class ImageCache(object):
+    """
+    Images known to be present on a Docker host.
+
+    Presence is checked with a single ``inspect_image`` call and then
+    remembered, so an image is loaded at most once per host. Concurrent
+    loads of the same image are single-flight: one create loads it and the
+    others wait for the result.
+
+    If a digest is pinned for an image, the local image only counts as
+    present while its repository digests include the pinned one; otherwise
+    it is loaded again.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.present = dict()
+        self.loads = dict()
+
+    @staticmethod
+    def _fresh(repo_digests, digest):
+        if digest is None:
+            return True
+        return any(d.split('@')[-1] == digest for d in repo_digests)
+
+    @staticmethod
+    def _inspect(cli, ref):
+        try:
+            info = cli.inspect_image(ref)
+        except docker.errors.NotFound:
+            return None
+        return set(info.get('RepoDigests') or list())
+
+    def ensure(self, cli, ref, load, digest=None):
+        """
+        Make sure image ``ref`` (``repository:tag``) is present, calling
+        ``load()`` if it is not.
+
+        :returns: Whether this call loaded the image.
+        """
+        with self.lock:
+            if ref in self.present and self._fresh(self.present[ref], digest):
+                return False
+            flight = self.loads.get(ref)
+            leader = flight is None
+            if leader:
+                flight = self.loads[ref] = ImageLoad()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return False
+        try:
+            repo_digests = self._inspect(cli, ref)
+            loaded = repo_digests is None or not self._fresh(repo_digests, digest)
+            if loaded:
+                load()
+                repo_digests = self._inspect(cli, ref)
+                if repo_digests is None or not self._fresh(repo_digests, digest):
+                    raise Exception('Loading Docker image {0!r} failed'.format(ref))
+            with self.lock:
+                self.present[ref] = repo_digests
+            return loaded
+        except Exception as ex:
+            flight.error = ex
+            raise
+        finally:
+            with self.lock:
+                del self.loads[ref]
+            flight.done.set()
+
+    def forget(self, ref):
+        """
+        Stop treating ``ref`` as present, e.g. after the host reported it
+        missing.
+        """
+        with self.lock:
+            self.present.pop(ref, None)
+
+image_caches = dict()
+image_caches_lock = threading.Lock()
+
+def get_image_cache(endpoint):
+    """
+    Return the shared :class:`ImageCache` of a Docker host.
+    """
+    with image_caches_lock:
+        cache = image_caches.get(endpoint)
+        if cache is None:
+            cache = image_caches[endpoint] = ImageCache()
+        return cache
+
+# Labels put on the containers created by Occopus
+LABEL_MANAGED = 'occopus.managed'
+LABEL_INFRA_ID = 'occopus.infra_id'
+LABEL_NODE_ID = 'occopus.node_id'
+
+# Container states reported by ``containers()``
+STATE_MAPPING = {
+    'created': status.PENDING,
+    'restarting': status.PENDING,
+    'paused': status.PENDING,
+    'running': status.READY,
+    'removing': status.SHUTDOWN,
+    'exited': status.SHUTDOWN,
+    'dead': status.TMP_FAIL,
+}
+
+legacy_instance_ids = dict()
+
+def parse_instance_id(instance_id):
+    """
+    Return the container Id stored as ``instance_id``.
+
+    With multiple hosts, ``instance_id`` is a dict also holding the
+    endpoint of the host. Nodes created by earlier versions stored the
+    ``str()`` of the whole ``create_container`` response; such ids are
+    parsed only once.
+    """
+    if isinstance(instance_id, dict):
+        return instance_id['container_id']
+    if instance_id.startswith('{'):
+        container_id = legacy_instance_ids.get(instance_id)
+        if container_id is None:
+            container_id = legacy_instance_ids[instance_id] = \
+                ast.literal_eval(instance_id)['Id']
+        return container_id
+    return instance_id
+
+def container_state(info):
+    """
+    Translate the state of an ``inspect_container`` result.
+    """
+    state = info['State']
+    if state['Running']:
+        return status.READY
+    elif state['StartedAt'] == state['FinishedAt']:
+        return status.PENDING
+    elif state['ExitCode'] == '-1':
+        return status.TMP_FAIL
+    else:
+        return status.SHUTDOWN
+
+def container_addresses(info):
+    """
+    Return the network addresses of a container, from either an
+    ``inspect_container`` result or a ``containers()`` entry.
+    """
+    return [v['IPAddress']
+            for v in info['NetworkSettings']['Networks'].values()]
+
+class ContainerSweeper(object):
+    """
+    Snapshot of the Occopus containers of a Docker host, taken with one
+    ``containers(all=True, filters={'label': ...})`` call.
+
+    Per-node state and address queries are answered from the snapshot,
+    which is retaken when it gets older than the sweep interval.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.containers = dict()
+        self.swept_at = None
+
+    def _sweep(self, cli):
+        containers = cli.containers(all=True,
+                                    filters={'label': LABEL_MANAGED})
+        self.containers = dict((c['Id'], c) for c in containers)
+        self.swept_at = time.time()
+
+    def get(self, cli, container_id, interval):
+        """
+        Return the container from the snapshot, or ``None`` if the last
+        sweep did not see it.
+        """
+        with self.lock:
+            if self.swept_at is None or time.time() - self.swept_at > interval:
+                self._sweep(cli)
+            return self.containers.get(container_id)
+
+    def forget(self, container_id):
+        """
+        Remove a container from the snapshot, so a removed container is not
+        reported from it until the next sweep.
+        """
+        with self.lock:
+            self.containers.pop(container_id, None)
+
+container_sweepers = dict()
+container_sweepers_lock = threading.Lock()
+
+def get_container_sweeper(endpoint):
+    """
+    Return the shared :class:`ContainerSweeper` of a Docker host.
+    """
+    with container_sweepers_lock:
+        sweeper = container_sweepers.get(endpoint)
+        if sweeper is None:
+            sweeper = container_sweepers[endpoint] = ContainerSweeper()
+        return sweeper
+
+default_image_cache_dir = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'occopus', 'docker-images')
+default_image_cache_size = 10 * 1024 ** 3
+download_chunk_size = 1024 * 1024
+# (connect, read) timeouts of the tarball HEAD and GET requests
+download_timeout = (10, 60)
+
+class TarballCache(object):
+    """
+    Local cache of image tarballs downloaded from URLs.
+
+    A tarball is stored under the digest of its URL and of the validator
+    (``ETag``, or ``Last-Modified`` and ``Content-Length``) the server
+    reports for it, so a changed image is downloaded again. If the ``HEAD``
+    request fails (some servers and presigned URLs only allow ``GET``) or
+    reports no validator, the tarball is downloaded for the import only and
+    not cached. Downloads are streamed to disk in chunks and happen once
+    even if several creates need the same tarball. The least recently used tarballs are evicted when the
+    cache grows beyond ``max_size`` bytes; tarballs being fetched or
+    imported are never evicted.
+
+    The directory is created private (mode 0700). Since the tarball names
+    are predictable, an existing directory is only used if it is owned by
+    the current user and not writable by others.
+    """
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.key_locks = dict()
+        self.in_use = dict()
+        self.checked = False
+
+    def _check_directory(self):
+        if self.checked:
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, mode=0o700)
+        st = os.stat(self.directory)
+        if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+            raise Exception('Docker image cache directory {0!r} is not owned '
+                            'by the current user'.format(self.directory))
+        if st.st_mode & 0o022:
+            raise Exception('Docker image cache directory {0!r} is writable '
+                            'by other users'.format(self.directory))
+        self.checked = True
+
+    def _key(self, url):
+        """
+        Return the cache key of ``url``, or ``None`` if it cannot be cached.
+        """
+        try:
+            response = requests.head(url, allow_redirects=True,
+                                     timeout=download_timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as ex:
+            log.debug('HEAD of Docker image tarball %r failed, not caching '
+                      'it: %s', url, ex)
+            return None
+        headers = response.headers
+        if not any(headers.get(h) for h in
+                   ('ETag', 'Last-Modified', 'Content-Length')):
+            log.debug('No validator for Docker image tarball %r, not '
+                      'caching it', url)
+            return None
+        validator = headers.get('ETag') or '{0}/{1}'.format(
+            headers.get('Last-Modified', ''), headers.get('Content-Length', ''))
+        return hashlib.sha256('{0}\n{1}'.format(url, validator)
+                              .encode('utf-8')).hexdigest()
+
+    def _key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def _download(self, url, path):
+        log.info('Downloading Docker image tarball %r', url)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                response = requests.get(url, stream=True,
+                                        timeout=download_timeout)
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=download_chunk_size):
+                    f.write(chunk)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def _evict(self):
+        entries = list()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.tar'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if self.in_use.get(path):
+                continue
+            log.debug('Evicting Docker image tarball %r', path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    @contextlib.contextmanager
+    def _fetch_uncached(self, url):
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            self._download(url, path)
+            yield path
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @contextlib.contextmanager
+    def fetch(self, url):
+        """
+        Context manager yielding the path of the cached tarball of ``url``,
+        downloading it first if needed. The tarball is not evicted before
+        the context is left.
+        """
+        with self.lock:
+            self._check_directory()
+        key = self._key(url)
+        if key is None:
+            with self._fetch_uncached(url) as path:
+                yield path
+            return
+        path = os.path.join(self.directory, key + '.tar')
+        with self.lock:
+            self.in_use[path] = self.in_use.get(path, 0) + 1
+        try:
+            with self._key_lock(key):
+                if os.path.exists(path):
+                    log.debug('Using cached Docker image tarball of %r', url)
+                    os.utime(path, None)
+                else:
+                    self._download(url, path)
+                    with self.lock:
+                        self._evict()
+            yield path
+        finally:
+            with self.lock:
+                self.in_use[path] -= 1
+                if not self.in_use[path]:
+                    del self.in_use[path]
+
+tarball_caches = dict()
+tarball_caches_lock = threading.Lock()
+
+def get_tarball_cache(directory, max_size):
+    """
+    Return the shared :class:`TarballCache` of a directory.
+    """
+    with tarball_caches_lock:
+        cache = tarball_caches.get(directory)
+        if cache is None:
+            cache = tarball_caches[directory] = TarballCache(directory, max_size)
+        cache.max_size = max_size
+        return cache
+
+host_info_ttl = 10
+
+class HostLoad(object):
+    """
+    Load of a Docker host, used to place new containers.
+
+    The number of running containers, CPUs and memory are taken from
+    ``info()``, refreshed at most every ``host_info_ttl`` seconds.
+    Containers placed on the host since then are counted too, so a burst
+    of creates is spread over the hosts instead of piling up on the one
+    that looked idle at the last refresh.
+    """
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.running = 0
+        self.cpus = 1
+        self.memory = 0
+        self.placed = 0
+        self.refreshed_at = None
+
+    def stale(self):
+        return self.refreshed_at is None or \
+            time.time() - self.refreshed_at >= host_info_ttl
+
+    def update(self, info, placed_before):
+        """
+        Take the counters of an ``info()`` result, which already include
+        the ``placed_before`` containers placed before it was requested.
+        """
+        self.running = info.get('ContainersRunning', info.get('Containers', 0))
+        self.cpus = max(info.get('NCPU', 1), 1)
+        self.memory = info.get('MemTotal', 0)
+        self.placed = max(self.placed - placed_before, 0)
+        self.refreshed_at = time.time()
+
+    def load(self):
+        """
+        Containers per CPU; hosts with more memory win ties.
+        """
+        return (float(self.running + self.placed) / self.cpus, -self.memory)
+
+host_loads = dict()
+host_loads_lock = threading.Lock()
+
+def place_container(endpoints, clients):
+    """
+    Choose the least loaded of ``endpoints`` for a new container and count
+    the container on it.
+
+    Stale host loads are refreshed without holding ``host_loads_lock``, so
+    a slow host does not hold up placements elsewhere. Hosts whose
+    ``info()`` fails are skipped.
+    """
+    with host_loads_lock:
+        hosts = list()
+        for endpoint in endpoints:
+            host = host_loads.get(endpoint)
+            if host is None:
+                host = host_loads[endpoint] = HostLoad(endpoint)
+            hosts.append(host)
+        stale = [(host, host.placed) for host in hosts if host.stale()]
+    failed = set()
+    for host, placed_before in stale:
+        try:
+            info = clients[host.endpoint].info()
+        except Exception as ex:
+            log.warning('Cannot query Docker host %r: %s', host.endpoint, ex)
+            failed.add(host.endpoint)
+            continue
+        with host_loads_lock:
+            host.update(info, placed_before)
+    with host_loads_lock:
+        candidates = [host for host in hosts
+                      if host.endpoint not in failed
+                      and host.refreshed_at is not None]
+        if not candidates:
+            raise Exception('None of the Docker hosts {0!r} is available'
+                            .format(endpoints))
+        host = min(candidates, key=lambda h: h.load())
+        host.placed += 1
+        log.debug('Placing container on %r (load %r)', host.endpoint, host.load())
+        return host.endpoint
+
 class CreateNode(Command):
     def __init__(self, resolved_node_definition):
         Command.__init__(self)
@@ -41,6 +590,10 @@ class CreateNode(Command):
         #self.network_mode = self.resolved_node_definition['resource']['network_mode']
         self.image = self.resolved_node_definition['resource']['image']
         self.tag = self.resolved_node_definition['resource']['tag']
+        # Images imported from tarballs have no repository digests, so a
+        # digest can only be pinned for images pulled from Docker Hub
+        self.digest = self.resolved_node_definition['resource'].get('image_digest', None) \
+            if self.origin == 'dockerhub' else None
 
         self.command = self.resolved_node_definition.get('attributes',dict()).get('command',None)
         self.env = self.resolved_node_definition.get('attributes',dict()).get('env',None)
@@ -48,41 +601,62 @@ class CreateNode(Command):
             raise Exception('Missing keys! Docker requires \'command\',\'env\' keywords to be specified under \'contextualisation\' section in node definition!')
 
     @wet_method('1')
-    def _start_instance(self, resource_handler):
+    def _start_instance(self, resource_handler, endpoint):
         """
         Start the Docker instance.
         """
-        log.debug('Starting container')
-        cli = resource_handler.cli
+        log.debug('Starting container on %r', endpoint)
+        cli = resource_handler.get_client(endpoint)
         #host_config=cli.create_host_config(network_mode=self.network_mode)
         container = cli.create_container(
             image='{0.image}:{0.tag}'.format(self),
             command=self.command,
             #host_config=host_config,
-            environment=self.env
+            environment=self.env,
+            labels={
+                LABEL_MANAGED: 'true',
+                LABEL_INFRA_ID: str(self.resolved_node_definition.get('infra_id')),
+                LABEL_NODE_ID: str(self.resolved_node_definition.get('node_id')),
+            }
         )
 
         cli.start(container.get('Id'))
         log.debug('Started container [%s]', container)
-        return str(container)
+        return container.get('Id')
 
     @wet_method()
-    def _load(self, resource_handler):
+    def _load(self, resource_handler, endpoint):
         """
         Load Docker image so it can be instantiated.
         """
+        if self.origin == 'local':
+            return
+        ref = '{0.image}:{0.tag}'.format(self)
+        cli = resource_handler.get_client(endpoint)
+        loaded = get_image_cache(endpoint).ensure(
+            cli, ref, lambda: self._load_image(resource_handler, cli),
+            self.digest)
+        if not loaded:
+            log.debug('[%s] Docker image %r is already present on %r',
+                      resource_handler.name, ref, endpoint)
+
+    def _load_image(self, resource_handler, cli):
         log.info('[%s] Loading Docker image origin=%r image=%r tag=%r',
                  resource_handler.name, self.origin, self.image, self.tag)
         if self.origin == 'dockerhub':
-            resource_handler.cli.pull(repository=self.image, tag=self.tag)
-        elif self.origin == 'local':
-            pass
+            if self.digest is not None:
+                cli.pull(repository='{0.image}@{0.digest}'.format(self))
+                cli.tag('{0.image}@{0.digest}'.format(self),
+                        self.image, self.tag, force=True)
+            else:
+                cli.pull(repository=self.image, tag=self.tag)
         else:
-            resource_handler.cli.import_image_from_url(
-                url=self.origin,
-                repository=self.image,
-                tag=self.tag
-            )
+            with resource_handler.get_tarball_cache().fetch(self.origin) as path:
+                cli.import_image_from_file(
+                    path,
+                    repository=self.image,
+                    tag=self.tag
+                )
 
     def perform(self, resource_handler):
         log.debug("[%s] Creating node: %r",
@@ -90,8 +664,21 @@ class CreateNode(Command):
 
         log.debug("Creating node")
 
-        self._load(resource_handler)
-        instance_id = self._start_instance(resource_handler)
+        endpoint = resource_handler.place_container()
+        self._load(resource_handler, endpoint)
+        try:
+            container_id = self._start_instance(resource_handler, endpoint)
+        except docker.errors.ImageNotFound:
+            if self.origin == 'local':
+                raise
+            # Removed from the host (rmi, prune) since it has been cached
+            log.info('[%s] Docker image %r is gone from %r; loading it again',
+                     resource_handler.name, '{0.image}:{0.tag}'.format(self),
+                     endpoint)
+            get_image_cache(endpoint).forget('{0.image}:{0.tag}'.format(self))
+            self._load(resource_handler, endpoint)
+            container_id = self._start_instance(resource_handler, endpoint)
+        instance_id = resource_handler.make_instance_id(endpoint, container_id)
 
         log.debug("[%s] Done; container_id = %r", resource_handler.name, instance_id)
         return instance_id
@@ -101,19 +688,26 @@ class DropNode(Command):
         Command.__init__(self)
         self.instance_data = instance_data
 
-    def _delete_container(self, resource_handler, instance_id):
+    def _delete_container(self, resource_handler, cli, instance_id):
         log.debug("[%s] Stopping container %r", resource_handler.name, instance_id)
-        resource_handler.cli.stop(container=instance_id)
+        cli.stop(container=instance_id)
         log.debug("[%s] Removing container %r", resource_handler.name, instance_id)
-        resource_handler.cli.remove_container(container=instance_id)
+        cli.remove_container(container=instance_id)
 
     @wet_method()
+    @translates_not_found(is_not_found)
     def perform(self, resource_handler):
         log.debug("[%s] Dropping node %r", resource_handler.name,
                   self.instance_data['node_id'])
 
-        self.instance_id = ast.literal_eval(self.instance_data['instance_id'])['Id']
-        self._delete_container(resource_handler, self.instance_id)
+        endpoint, self.instance_id = resource_handler.locate(
+            self.instance_data['instance_id'])
+        try:
+            self._delete_container(resource_handler,
+                                   resource_handler.get_client(endpoint),
+                                   self.instance_id)
+        finally:
+            resource_handler.forget_container(endpoint, self.instance_id)
 
         log.debug("[%s] Done", resource_handler.name)
 
@@ -123,6 +717,7 @@ class GetState(Command):
         self.instance_data = instance_data
 
     @wet_method('ready')
+    @translates_not_found(is_not_found)
     def perform(self, resource_handler):
         """
         Return translated status of the container.
@@ -130,29 +725,20 @@ class GetState(Command):
         See http://www.lpds.sztaki.hu/occo/datastructures.html#node-status
         """
 
-        instance_id = ast.literal_eval(self.instance_data['instance_id'])['Id']
-        info = resource_handler.cli.inspect_container(container=instance_id)
-
-        if info['State']['Running']:
-            log.debug("[%s] Done; retval=%r; status=%r",resource_handler.name,
-                      'Running', status.READY)
-            return status.READY
-
-        elif info['State']['StartedAt'] == info['State']['FinishedAt']:
-            log.debug("[%s] Done; retval=%r; status=%r",resource_handler.name,
-                      'Pending', status.PENDING)
-
-        elif info['State']['ExitCode'] == '-1':
-            log.debug("[%s] Done; retval=%r; status=%r",resource_handler.name,
-                      'Failed', status.TMP_FAIL)
-            return status.TMP_FAIL
-
-        elif not info['State']['Running']:
-            log.debug("[%s] Done; retval=%r; status=%r",resource_handler.name,
-                      'Finished', status.SHUTDOWN)
-            return status.SHUTDOWN
+        endpoint, instance_id = resource_handler.locate(
+            self.instance_data['instance_id'])
+        container = resource_handler.get_swept_container(endpoint, instance_id)
+        if container is not None and container['State'] in STATE_MAPPING:
+            retval = container['State']
+            state = STATE_MAPPING[retval]
         else:
-            raise NotImplementedError()
+            info = resource_handler.get_client(endpoint).inspect_container(
+                container=instance_id)
+            retval = info['State'].get('Status')
+            state = container_state(info)
+        log.debug("[%s] Done; retval=%r; status=%r", resource_handler.name,
+                  retval, state)
+        return state
 
 class GetIpAddress(Command):
     def __init__(self, instance_data):
@@ -160,16 +746,14 @@ class GetIpAddress(Command):
         self.instance_data = instance_data
 
     @wet_method('127.0.0.1')
+    @translates_not_found(is_not_found)
     def perform(self, resource_handler):
         """
         Return (IPv4) network address of the container.
         """
-        instance_id = ast.literal_eval(self.instance_data['instance_id'])['Id']
-        info = resource_handler.cli.inspect_container(container=instance_id)
-        ip_addresses = []
-        for k, v in info['NetworkSettings']['Networks'].items():
-            ip_addresses.append(v['IPAddress'])
-        return ip_addresses[0]
+        endpoint, instance_id = resource_handler.locate(
+            self.instance_data['instance_id'])
+        return resource_handler.get_addresses(endpoint, instance_id)[0]
 
 class GetAddress(Command):
     def __init__(self, instance_data):
@@ -177,16 +761,14 @@ class GetAddress(Command):
         self.instance_data = instance_data
 
     @wet_method('127.0.0.1')
+    @translates_not_found(is_not_found)
     def perform(self, resource_handler):
         """
         Return network address of the container.
         """
-        instance_id = ast.literal_eval(self.instance_data['instance_id'])['Id']
-        info = resource_handler.cli.inspect_container(container=instance_id)
-        ip_addresses = []
-        for k, v in info['NetworkSettings']['Networks'].items():
-            ip_addresses.append(v['IPAddress'])
-        return ip_addresses[0]
+        endpoint, instance_id = resource_handler.locate(
+            self.instance_data['instance_id'])
+        return resource_handler.get_addresses(endpoint, instance_id)[0]
 
 @factory.register(ResourceHandler, PROTOCOL_ID)
 class DockerResourceHandler(ResourceHandler):
@@ -194,15 +776,100 @@ class DockerResourceHandler(ResourceHandler):
     :class:`~occo.resourcehandler.ResourceHandler` class utilizing Docker_.
 
     :param str endpoint: Docker socket URL
+    :param list endpoints: Docker socket URLs of several hosts. Each new
+        container is placed on the least loaded one, which is recorded in
+        the instance id.
+    :param int max_connections: Maximum number of connections kept open to
+        the Docker daemon.
+    :param str image_cache_dir: Directory caching the image tarballs
+        downloaded when ``origin`` is a URL.
+    :param int image_cache_size: Size limit of the tarball cache in bytes.
+    :param int status_sweep_interval: If set, container states and addresses
+        are served from a listing of all Occopus containers of the host,
+        retaken at most this often (seconds), instead of inspecting each
+        container.
 
     .. _Docker: https://www.docker.com/
     """
-    def __init__(self, endpoint,
+    def __init__(self, endpoint=None,
                  name=None, dry_run=False,
                  **config):
         self.dry_run = dry_run
-        self.name = name if name else endpoint
-        self.cli = docker.APIClient(base_url=endpoint)
+        self.endpoints = config.get('endpoints') or [endpoint]
+        self.endpoint = endpoint if endpoint else self.endpoints[0]
+        self.name = name if name else self.endpoint
+        max_connections = config.get('max_connections', default_max_connections)
+        self.clients = dict((ep, PooledClient(ep, max_connections))
+                            for ep in set(self.endpoints + [self.endpoint]))
+        self.cli = self.clients[self.endpoint]
+        self.status_sweep_interval = config.get('status_sweep_interval', None)
+        self.image_cache_dir = config.get('image_cache_dir',
+                                          default_image_cache_dir)
+        self.image_cache_size = config.get('image_cache_size',
+                                           default_image_cache_size)
+
+    def get_tarball_cache(self):
+        return get_tarball_cache(self.image_cache_dir, self.image_cache_size)
+
+    @property
+    def multi_host(self):
+        return len(self.endpoints) > 1
+
+    def get_client(self, endpoint):
+        client = self.clients.get(endpoint)
+        if client is None:
+            # Host removed from the configuration since the node was created
+            client = self.clients[endpoint] = PooledClient(
+                endpoint, self.cli.max_connections)
+        return client
+
+    def place_container(self):
+        """
+        Return the endpoint of the host a new container is to be started on.
+        """
+        if not self.multi_host or self.dry_run:
+            return self.endpoint
+        return place_container(self.endpoints, self.clients)
+
+    def make_instance_id(self, endpoint, container_id):
+        if self.multi_host:
+            return dict(endpoint=endpoint, container_id=container_id)
+        return container_id
+
+    def locate(self, instance_id):
+        """
+        Return the endpoint of the host and the Id of a container.
+        """
+        if isinstance(instance_id, dict):
+            return instance_id['endpoint'], instance_id['container_id']
+        return self.endpoint, parse_instance_id(instance_id)
+
+    def get_swept_container(self, endpoint, container_id):
+        """
+        Return a container from the status sweep snapshot, or ``None`` if
+        sweeping is disabled or the container was not seen.
+        """
+        if not self.status_sweep_interval:
+            return None
+        return get_container_sweeper(endpoint).get(
+            self.get_client(endpoint), container_id, self.status_sweep_interval)
+
+    def forget_container(self, endpoint, container_id):
+        """
+        Remove a dropped container from the status sweep snapshot.
+        """
+        if self.status_sweep_interval:
+            get_container_sweeper(endpoint).forget(container_id)
+
+    def get_addresses(self, endpoint, container_id):
+        """
+        Return the network addresses of a container.
+        """
+        container = self.get_swept_container(endpoint, container_id)
+        if container is None or not container_addresses(container):
+            container = self.get_client(endpoint).inspect_container(
+                container=container_id)
+        return container_addresses(container)
 
     def cri_create_node(self, resolved_node_definition):
         return CreateNode(resolved_node_definition)
@@ -226,16 +893,22 @@ class DockerResourceHandler(ResourceHandler):
 class DockerSchemaChecker(RHSchemaChecker):
     def __init__(self):
         #self.req_keys = ["type", "endpoint", "origin", "network_mode", "image", "tag"]
-        self.req_keys = ["type", "endpoint", "origin", "image", "tag"]
-        self.opt_keys = ["name"]
+        self.req_keys = ["type", "origin", "image", "tag"]
+        self.opt_keys = ["name", "endpoint", "endpoints", "max_connections",
+                         "image_digest", "image_cache_dir", "image_cache_size",
+                         "status_sweep_interval"]
     def perform_check(self, data):
         missing_keys = RHSchemaChecker.get_missing_keys(self, data, self.req_keys)
         if missing_keys:
             msg = "Missing key(s): " + ', '.join(str(key) for key in missing_keys)
             raise SchemaError(msg)
+        if not data.get("endpoint") and not data.get("endpoints"):
+            raise SchemaError("Missing key(s): endpoint or endpoints")
         valid_keys = self.req_keys + self.opt_keys
         invalid_keys = RHSchemaChecker.get_invalid_keys(self, data, valid_keys)
         if invalid_keys:
             msg = "Unknown key(s): " + ', '.join(str(key) for key in invalid_keys)
             raise SchemaError(msg)
+        if data.get("image_digest") and data["origin"] != "dockerhub":
+            raise SchemaError("image_digest requires origin: dockerhub")
         return True
@@ -23,18 +23,22 @@
 
 import boto
 import boto.ec2
+import boto.exception
 from urllib.parse import urlparse
 import occo.util.factory as factory
 from occo.util import wet_method, coalesce
-from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker
+from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker, \
+    InstanceNotFound, translates_not_found
 import itertools as it
 import logging
 import occo.constants.status as status
 from occo.exceptions import SchemaError,NodeCreationError
 import time
+import threading
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-__all__ = ['EC2ResourceHandler']
+__all__ = ['EC2ResourceHandler', 'pending_terminations']
 
 PROTOCOL_ID = 'ec2'
 STATE_MAPPING = {
@@ -46,6 +50,8 @@ STATE_MAPPING = {
     'stopped'       : status.TMP_FAIL,
 }
 
+TERMINATING_STATES = ['shutting-down', 'terminated']
+
 log = logging.getLogger('occo.resourcehandler.ec2')
 
 def setup_connection(endpoint, regionname, auth_data):
@@ -65,11 +71,243 @@ def setup_connection(endpoint, regionname, auth_data):
         port=url.port,
         path=url.path)
 
+NOT_FOUND_ERRORS = ['InvalidInstanceID.NotFound', 'InvalidInstanceID.Malformed']
+
+def is_not_found(ex):
+    return isinstance(ex, boto.exception.EC2ResponseError) \
+        and ex.error_code in NOT_FOUND_ERRORS
+
+@translates_not_found(is_not_found)
 def get_instance(conn, instance_id):
     reservations = conn.get_all_reservations(instance_ids=[instance_id])
+    if not reservations or not reservations[0].instances:
+        raise InstanceNotFound(instance_id)
     # ASSUMING len(reservations)==1 and len(instances)==1
     return reservations[0].instances[0]
 
+class RegionFanOut(object):
+    """
+    Runs describe calls against several EC2 regions concurrently.
+
+    One connection is kept per region and reused by every call. Results of
+    the regions are merged into a single dictionary keyed by instance id.
+    Latency and error counters are maintained per region.
+
+    :param list regions: ``(regionname, endpoint)`` pairs.
+    :param dict auth_data: Credentials used in all regions.
+    """
+    def __init__(self, regions, auth_data):
+        self.regions = list(regions)
+        self.auth_data = auth_data
+        self.lock = threading.Lock()
+        self.connections = dict()
+        self.metrics = dict(
+            (regionname, dict(endpoint=endpoint, calls=0, errors=0,
+                              last_latency=None, total_latency=0.0,
+                              last_error=None))
+            for regionname, endpoint in self.regions)
+        self.executor = ThreadPoolExecutor(max_workers=len(self.regions)) \
+            if len(self.regions) > 1 else None
+
+    def get_connection(self, regionname, endpoint):
+        with self.lock:
+            conn = self.connections.get(regionname)
+            if conn is None:
+                conn = setup_connection(endpoint, regionname, self.auth_data)
+                self.connections[regionname] = conn
+            return conn
+
+    def _describe_region(self, regionname, endpoint, filters):
+        start = time.time()
+        try:
+            conn = self.get_connection(regionname, endpoint)
+            instances = conn.get_only_instances(filters=filters)
+        except Exception as ex:
+            with self.lock:
+                metrics = self.metrics[regionname]
+                metrics['calls'] += 1
+                metrics['errors'] += 1
+                metrics['last_error'] = str(ex)
+            log.warning('Describing instances in EC2 region %r failed: %s',
+                        regionname, ex)
+            return None
+        latency = time.time() - start
+        with self.lock:
+            metrics = self.metrics[regionname]
+            metrics['calls'] += 1
+            metrics['last_latency'] = latency
+            metrics['total_latency'] += latency
+        return instances
+
+    def describe(self, instance_ids=None, filters=None):
+        """
+        Describe instances in all regions.
+
+        :param list instance_ids: Restrict the query to these instances.
+            Unknown ids are ignored instead of failing the query.
+        :param dict filters: Additional EC2 filters.
+
+        :returns: ``(instances, failed_regions)``; ``instances`` is a
+            ``dict`` mapping instance ids to boto ``Instance`` objects, whose
+            ``region`` attribute tells where they were found.
+            ``failed_regions`` lists the names of the regions that could not
+            be queried; instances living there are missing from the result.
+        """
+        filters = dict(filters or dict())
+        if instance_ids is not None:
+            filters['instance-id'] = list(instance_ids)
+        if self.executor is None:
+            results = [self._describe_region(regionname, endpoint, filters)
+                       for regionname, endpoint in self.regions]
+        else:
+            futures = [self.executor.submit(self._describe_region,
+                                            regionname, endpoint, filters)
+                       for regionname, endpoint in self.regions]
+            results = [f.result() for f in futures]
+        merged = dict()
+        failed = list()
+        for (regionname, endpoint), instances in zip(self.regions, results):
+            if instances is None:
+                failed.append(regionname)
+                continue
+            for inst in instances:
+                merged[inst.id] = inst
+        return merged, failed
+
+    def get_metrics(self):
+        """
+        Per-region call count, error count, and last and average latency.
+        """
+        with self.lock:
+            rv = dict()
+            for regionname, metrics in self.metrics.items():
+                rv[regionname] = dict(metrics)
+                rv[regionname]['avg_latency'] = \
+                    metrics['total_latency'] / metrics['calls'] \
+                    if metrics['calls'] > metrics['errors'] else None
+            return rv
+
+fanouts = dict()
+fanouts_lock = threading.Lock()
+
+def get_fanout(regions, auth_data):
+    """
+    Return the shared :class:`RegionFanOut` of the given regions and
+    credentials.
+    """
+    key = (tuple(regions), auth_data['accesskey'])
+    with fanouts_lock:
+        fanout = fanouts.get(key)
+        if fanout is None:
+            fanout = fanouts[key] = RegionFanOut(regions, auth_data)
+        return fanout
+
+class TerminationTracker(object):
+    """
+    Keeps track of instances dropped in fast teardown mode.
+
+    Fast teardown issues a single ``terminate_instances`` call and returns
+    immediately. The tracker confirms in the background that the instances
+    have entered a terminating state, and terminates them again if they have
+    not done so within their deadline.
+
+    :param int check_interval: Seconds to wait between confirmation sweeps.
+    """
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.pending = dict()
+        self.thread = None
+
+    def add(self, resource_handler, instance_id, deadline):
+        now = time.time()
+        with self.lock:
+            self.pending[instance_id] = dict(
+                instance_id=instance_id,
+                resource_handler=resource_handler,
+                requested_at=now,
+                deadline=now + deadline,
+                timeout=deadline,
+                attempts=1)
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name='ec2-termination-tracker')
+                self.thread.daemon = True
+                self.thread.start()
+
+    def pending_terminations(self, name=None):
+        """
+        List the terminations not confirmed yet.
+
+        :param str name: Only list instances dropped through the resource
+            handler called ``name``.
+        """
+        with self.lock:
+            entries = list(self.pending.values())
+        return [dict(instance_id=e['instance_id'],
+                     resource=e['resource_handler'].name,
+                     requested_at=e['requested_at'],
+                     deadline=e['deadline'],
+                     attempts=e['attempts'])
+                for e in entries
+                if name is None or e['resource_handler'].name == name]
+
+    def _run(self):
+        while True:
+            time.sleep(self.check_interval)
+            with self.lock:
+                if not self.pending:
+                    self.thread = None
+                    return
+                entries = list(self.pending.values())
+            groups = dict()
+            for entry in entries:
+                rh = entry['resource_handler']
+                key = (tuple(rh.regions), rh.auth_data['accesskey'])
+                groups.setdefault(key, list()).append(entry)
+            for group in groups.values():
+                try:
+                    self._check(group)
+                except Exception:
+                    log.exception('[%s] Failed to confirm termination of %r:',
+                                  group[0]['resource_handler'].name,
+                                  [e['instance_id'] for e in group])
+
+    def _check(self, entries):
+        resource_handler = entries[0]['resource_handler']
+        instances, failed = resource_handler.describe_instances(
+            [e['instance_id'] for e in entries])
+        states = dict((iid, inst.state) for iid, inst in instances.items())
+        now = time.time()
+        overdue = list()
+        with self.lock:
+            for entry in entries:
+                iid = entry['instance_id']
+                if iid not in states and failed:
+                    # It may live in a region that could not be queried
+                    continue
+                if states.get(iid, 'terminated') in TERMINATING_STATES:
+                    log.debug('[%s] Termination of %r confirmed',
+                              resource_handler.name, iid)
+                    self.pending.pop(iid, None)
+                elif now > entry['deadline']:
+                    entry['attempts'] += 1
+                    entry['deadline'] = now + entry['timeout']
+                    overdue.append(iid)
+        if overdue:
+            log.warning('[%s] Instances %r are not terminating; '
+                        'terminating them again', resource_handler.name, overdue)
+            for iid in overdue:
+                instances[iid].terminate()
+
+termination_tracker = TerminationTracker()
+
+def pending_terminations():
+    """
+    List the fast teardown terminations that EC2 has not confirmed yet.
+    """
+    return termination_tracker.pending_terminations()
+
 def needs_connection(f):
     """
     Sets up the conn member of the Command object upon calling this method.
@@ -148,6 +386,7 @@ class DropNode(Command):
         self.instance_data = instance_data
 
     @wet_method()
+    @translates_not_found(is_not_found)
     @needs_connection
     def _delete_vms(self, resource_handler, *vm_ids):
         """
@@ -159,6 +398,15 @@ class DropNode(Command):
         :Remark: This is a "wet method", termination will not be attempted
             if the instance is in debug mode (``dry_run``).
         """
+        if len(resource_handler.regions) > 1:
+            inst = resource_handler.lookup_instance(self.conn, vm_ids[0])
+            self.conn = inst.connection
+        if resource_handler.fast_teardown:
+            self.conn.terminate_instances(instance_ids=vm_ids)
+            for vm_id in vm_ids:
+                termination_tracker.add(resource_handler, vm_id,
+                                        resource_handler.termination_deadline)
+            return
         self.conn.stop_instances(instance_ids=vm_ids, force=True)
         self.conn.terminate_instances(instance_ids=vm_ids)
 
@@ -187,7 +435,8 @@ class GetState(Command):
     def perform(self, resource_handler):
         log.debug("[%s] Acquiring node state %r",
                   resource_handler.name, self.instance_data['node_id'])
-        inst = get_instance(self.conn, self.instance_data['instance_id'])
+        inst = resource_handler.lookup_instance(
+            self.conn, self.instance_data['instance_id'])
         inst_state = inst.state
         try:
             retval = STATE_MAPPING[inst_state]
@@ -209,7 +458,8 @@ class GetIpAddress(Command):
         log.debug("[%s] Acquiring IP address for %r",
                   resource_handler.name,
                   self.instance_data['node_id'])
-        inst = get_instance(self.conn, self.instance_data['instance_id'])
+        inst = resource_handler.lookup_instance(
+            self.conn, self.instance_data['instance_id'])
         ip_address = None if inst.ip_address == '' else inst.ip_address
         private_ip_address = None if inst.private_ip_address == '' else inst.private_ip_address
         log.debug("[%s] Priv IP address for %r is \"%s\"",
@@ -229,7 +479,8 @@ class GetAddress(Command):
         log.debug("[%s] Acquiring address for %r",
                   resource_handler.name,
                   self.instance_data['node_id'])
-        inst = get_instance(self.conn, self.instance_data['instance_id'])
+        inst = resource_handler.lookup_instance(
+            self.conn, self.instance_data['instance_id'])
         public_dns_name = None if inst.public_dns_name == '' else inst.public_dns_name
         ip_address = None if inst.ip_address == '' else inst.ip_address
         private_ip_address = None if inst.private_ip_address == '' else inst.private_ip_address
@@ -263,6 +514,13 @@ class EC2ResourceHandler(ResourceHandler):
     :param str name: The name of this ``ResourceHandler`` instance. If unset,
         ``endpoint`` is used.
     :param bool dry_run: Skip actual resource aquisition, polling, etc.
+    :param bool fast_teardown: Drop nodes with a single terminate call and
+        confirm the termination asynchronously.
+    :param int termination_deadline: Seconds to wait in fast teardown mode
+        for an instance to start terminating before terminating it again.
+    :param list regions: Further regions, each given by ``regionname`` and
+        ``endpoint``, where nodes of this resource are looked up. Queries
+        are sent to all regions concurrently.
 
     .. _Boto: https://boto.readthedocs.org/en/latest/
     .. _EC2: http://aws.amazon.com/ec2/
@@ -279,10 +537,59 @@ class EC2ResourceHandler(ResourceHandler):
            log.debug(errormsg)
            raise NodeCreationError(None, errormsg)
         self.auth_data = auth_data
+        self.fast_teardown = config.get('fast_teardown', False)
+        self.termination_deadline = config.get('termination_deadline', 60)
+        self.regions = [(regionname, endpoint)]
+        for region in config.get('regions', list()):
+            region = (region['regionname'], region['endpoint'])
+            if region not in self.regions:
+                self.regions.append(region)
 
     def get_connection(self):
         return setup_connection(self.endpoint, self.regionname, self.auth_data)
 
+    def describe_instances(self, instance_ids=None, filters=None):
+        """
+        Describe instances in all regions of this resource concurrently.
+
+        See :meth:`RegionFanOut.describe`.
+        """
+        return get_fanout(self.regions, self.auth_data).describe(
+            instance_ids, filters)
+
+    def get_region_metrics(self):
+        """
+        Latency and error counters of the regions of this resource.
+        """
+        return get_fanout(self.regions, self.auth_data).get_metrics()
+
+    def lookup_instance(self, conn, instance_id):
+        """
+        Return the boto ``Instance`` identified by ``instance_id``.
+
+        With a single region, ``conn`` is used; otherwise all regions are
+        queried concurrently.
+        """
+        if len(self.regions) == 1:
+            return get_instance(conn, instance_id)
+        instances, failed = self.describe_instances([instance_id])
+        if instance_id not in instances:
+            if failed:
+                raise Exception(
+                    'Instance {0!r} not found; querying regions {1!r} '
+                    'failed'.format(instance_id, failed))
+            raise InstanceNotFound(
+                instance_id, 'not in regions {0!r}'.format(
+                    [r[0] for r in self.regions]))
+        return instances[instance_id]
+
+    def get_pending_terminations(self):
+        """
+        List the fast teardown terminations issued through this resource
+        that EC2 has not confirmed yet.
+        """
+        return termination_tracker.pending_terminations(self.name)
+
     def cri_create_node(self, resolved_node_definition):
         return CreateNode(resolved_node_definition)
 
@@ -305,7 +612,8 @@ class EC2ResourceHandler(ResourceHandler):
 class EC2SchemaChecker(RHSchemaChecker):
     def __init__(self):
         self.req_keys = ["type", "endpoint", "regionname", "image_id", "instance_type"]
-        self.opt_keys = ["key_name", "security_group_ids", "subnet_id", "name", "tags"]
+        self.opt_keys = ["key_name", "security_group_ids", "subnet_id", "name", "tags",
+                         "fast_teardown", "termination_deadline", "regions"]
     def perform_check(self, data):
         missing_keys = RHSchemaChecker.get_missing_keys(self, data, self.req_keys)
         if missing_keys:
@@ -21,21 +21,29 @@
 import time
 import uuid
 import random
+import hashlib
+import threading
+import contextlib
 import novaclient
 import novaclient.client
+import novaclient.exceptions
 import novaclient.auth_plugin
 from keystoneauth1.identity import v3
 from keystoneauth1 import session
 from urllib.parse import urlparse
 import occo.util.factory as factory
 from occo.util import wet_method, coalesce, unique_vmname
-from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker
+from occo.resourcehandler import ResourceHandler, Command, RHSchemaChecker, \
+    InstanceNotFound, translates_not_found, drop_created_nodes
 import itertools as it
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
 import occo.constants.status as status
 from occo.exceptions import SchemaError, NodeCreationError
+from collections import OrderedDict
 
-__all__ = ['NovaResourceHandler']
+__all__ = ['NovaResourceHandler', 'CancellationToken', 'cancel_all_creates']
 
 PROTOCOL_ID = 'nova'
 STATE_MAPPING = {
@@ -51,7 +59,47 @@ STATE_MAPPING = {
 
 log = logging.getLogger('occo.resourcehandler.nova')
 
+connections = dict()
+connections_lock = threading.Lock()
+
+def connection_key(endpoint, auth_data, resolved_node_definition):
+    """
+    Identify the Nova connection (endpoint, credential, project and region)
+    needed by a node.
+    """
+    resource = resolved_node_definition['resource']
+    digest = lambda secret: hashlib.sha256(secret.encode('utf-8')).hexdigest()
+    auth_type = auth_data.get('type', None)
+    if auth_type is None:
+        credential = (auth_data['username'], digest(auth_data['password']))
+    elif auth_type == 'application_credential':
+        credential = (auth_data['id'], digest(auth_data['secret']))
+    else:
+        credential = (auth_data.get('proxy'),)
+    return (endpoint, auth_type, credential,
+            resource.get('tenant_name', None),
+            resource.get('project_id', None),
+            resource.get('user_domain_name', 'Default'),
+            resource.get('region_name', None))
+
 def setup_connection(endpoint, auth_data, resolved_node_definition):
+    """
+    Return the connection to the Nova endpoint.
+
+    Clients are cached per :func:`connection_key`, so the Keystone session,
+    its token and its HTTP connection pool are shared by all commands. The
+    token is renewed by the authentication plugin when it expires.
+    """
+    key = connection_key(endpoint, auth_data, resolved_node_definition)
+    with connections_lock:
+        nt = connections.get(key)
+        if nt is None:
+            log.debug('Creating new Nova connection to %r', endpoint)
+            nt = connections[key] = create_connection(
+                endpoint, auth_data, resolved_node_definition)
+        return nt
+
+def create_connection(endpoint, auth_data, resolved_node_definition):
     """
     Setup the connection to the Nova endpoint.
     """
@@ -99,31 +147,479 @@ def needs_connection(f):
 
     return g
 
-import signal
-class GracefulInterruptHandler(object):
-    def __init__(self, sig=signal.SIGINT):
-        self.sig = sig
-    def __enter__(self):
-        self.interrupted = False
-        self.released = False
-        self.original_handler = signal.getsignal(self.sig)
-        def handler(signum, frame):
-            self.interrupted = True
-        signal.signal(self.sig, handler)
-        return self
-    def __exit__(self, type, value, tb):
-        self.release()
-    def release(self):
-        if self.released:
-            return False
-        signal.signal(self.sig, self.original_handler)
-        self.released = True
-        return True
+floating_ip_attempts = 60
+floating_ip_retry_wait = 1
+floating_ip_refresh_interval = 30
+
+class FloatingIpAllocator(object):
+    """
+    Hands out the floating IPs of a pool to the servers created by this
+    process.
+
+    The floating IPs are listed once and cached. An IP is reserved while it is
+    being associated, so parallel creates never pick the same address. The
+    chosen IP is re-read right before and after the association, and skipped
+    if someone else has associated it meanwhile; the whole list is fetched
+    again only when the cache runs out of free IPs or gets older than
+    ``floating_ip_refresh_interval``. When the pool has no free IP left, a new
+    one is allocated from it.
+
+    :param str pool: Name of the floating IP pool; ``None`` means any pool.
+    """
+    def __init__(self, pool=None):
+        self.pool = pool
+        self.lock = threading.Lock()
+        self.ips = dict()
+        self.reserved = set()
+        self.refreshed_at = None
+
+    def _refresh(self, conn):
+        self.ips = dict((flip.id, flip) for flip in conn.floating_ips.list()
+                        if not self.pool or flip.pool == self.pool)
+        self.refreshed_at = time.time()
+
+    def _free_ips(self):
+        return [flip for flip in self.ips.values()
+                if flip.instance_id is None and flip.id not in self.reserved]
+
+    def _reserve(self, resource_handler, conn):
+        with self.lock:
+            fresh = False
+            if self.refreshed_at is None or \
+                    time.time() - self.refreshed_at > floating_ip_refresh_interval:
+                self._refresh(conn)
+                fresh = True
+            free = self._free_ips()
+            if not free and not fresh:
+                self._refresh(conn)
+                free = self._free_ips()
+            if free:
+                floating_ip = random.choice(free)
+                self.reserved.add(floating_ip.id)
+                return floating_ip
+        log.debug("[%s] No unused floating ip found, allocating a new one...",
+                  resource_handler.name)
+        try:
+            floating_ip = conn.floating_ips.create(pool=self.pool)
+        except Exception as ex:
+            log.debug("[%s] Allocating new floating ip failed: %s",
+                      resource_handler.name, ex)
+            return None
+        with self.lock:
+            self.ips[floating_ip.id] = floating_ip
+            self.reserved.add(floating_ip.id)
+        return floating_ip
+
+    def allocate(self, resource_handler, conn, server):
+        """
+        Associate a floating IP with ``server``.
+
+        :returns: The associated floating IP.
+        :raises NodeCreationError: if no floating IP could be associated.
+        """
+        for attempt in range(floating_ip_attempts):
+            floating_ip = self._reserve(resource_handler, conn)
+            if floating_ip is None:
+                if self.pool is not None:
+                    error_msg = '[{0}] Cannot find unused floating ip address in pool "{1}"!'.format(
+                          resource_handler.name, self.pool)
+                else:
+                    error_msg = '[{0}] Cannot find unused floating ip address!'.format(
+                          resource_handler.name)
+                raise NodeCreationError(None, error_msg)
+            current = None
+            taken = False
+            try:
+                # Nova moves an associated floating IP to the new server
+                # instead of refusing, so the cached state is not enough
+                current = conn.floating_ips.get(floating_ip.id)
+                taken = current.instance_id is not None
+                if not taken:
+                    log.debug("[%s] Try associating floating ip (%s) to server (%s)...",
+                              resource_handler.name, floating_ip.ip, server.id)
+                    server.add_floating_ip(floating_ip)
+                    current = conn.floating_ips.get(floating_ip.id)
+            except Exception as ex:
+                log.debug(ex)
+                current = None
+            with self.lock:
+                self.reserved.discard(floating_ip.id)
+                if current is not None:
+                    self.ips[floating_ip.id] = current
+                else:
+                    self.ips.pop(floating_ip.id, None)
+            if taken:
+                log.debug("[%s] Floating ip (%s) has been taken meanwhile, picking another one...",
+                          resource_handler.name, floating_ip.ip)
+                continue
+            if current is not None and current.instance_id == server.id:
+                return current
+            log.debug("[%s] Associating floating ip (%s) to node failed. Retry after %i seconds...",
+                      resource_handler.name, floating_ip.ip, floating_ip_retry_wait)
+            time.sleep(floating_ip_retry_wait)
+        raise NodeCreationError(None,
+            '[{0}] Gave up associating floating ip to node after {1} attempts!'.format(
+                resource_handler.name, floating_ip_attempts))
+
+floating_ip_allocators = dict()
+floating_ip_allocators_lock = threading.Lock()
+
+def get_floating_ip_allocator(conn_key, pool):
+    """
+    Return the shared :class:`FloatingIpAllocator` of a pool.
+    """
+    with floating_ip_allocators_lock:
+        allocator = floating_ip_allocators.get((conn_key, pool))
+        if allocator is None:
+            allocator = floating_ip_allocators[(conn_key, pool)] = \
+                FloatingIpAllocator(pool)
+        return allocator
+
+floating_ip_index_ttl = 10
+
+class FloatingIpIndex(object):
+    """
+    Floating IPs of a tenant indexed by the id of the instance they are
+    associated with.
+
+    The index is rebuilt from a single ``floating_ips.list()`` call when it
+    gets older than ``floating_ip_index_ttl`` seconds, and is shared by all
+    address queries of the tenant.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_instance = dict()
+        self.refreshed_at = None
+
+    def _refresh(self, conn):
+        by_instance = dict()
+        for flip in conn.floating_ips.list():
+            if flip.instance_id is not None:
+                by_instance.setdefault(flip.instance_id, list()).append(flip.ip)
+        self.by_instance = by_instance
+        self.refreshed_at = time.time()
+
+    def lookup(self, conn, instance_id):
+        """
+        Return the floating IP addresses associated with an instance.
+        """
+        with self.lock:
+            if self.refreshed_at is None or \
+                    time.time() - self.refreshed_at > floating_ip_index_ttl:
+                self._refresh(conn)
+            return list(self.by_instance.get(instance_id, list()))
+
+    def add(self, instance_id, ip):
+        """
+        Record an association made by this process.
+        """
+        with self.lock:
+            ips = self.by_instance.setdefault(instance_id, list())
+            if ip not in ips:
+                ips.append(ip)
+
+floating_ip_indexes = dict()
+floating_ip_indexes_lock = threading.Lock()
+
+def get_floating_ip_index(conn_key):
+    """
+    Return the shared :class:`FloatingIpIndex` of a connection.
+    """
+    with floating_ip_indexes_lock:
+        index = floating_ip_indexes.get(conn_key)
+        if index is None:
+            index = floating_ip_indexes[conn_key] = FloatingIpIndex()
+        return index
+
+def is_not_found(ex):
+    return isinstance(ex, novaclient.exceptions.NotFound)
+
+sweep_page_size = 1000
+
+class NovaStatusSweeper(object):
+    """
+    Snapshot of the servers of a tenant, taken with detailed
+    ``servers.list`` calls.
+
+    A sweep follows marker-based pagination until an empty page, as the
+    server may return fewer servers per page than requested
+    (``osapi_max_limit``). Per-node state and address queries are answered
+    from the snapshot, which is retaken when it gets older than the sweep
+    interval.
+
+    :param dict search_opts: Filter passed to ``servers.list`` (e.g.
+        ``{'name': '^occopus-'}``) to restrict the sweep to our servers.
+    """
+    def __init__(self, search_opts=None):
+        self.search_opts = search_opts or dict()
+        self.lock = threading.Lock()
+        self.servers = dict()
+        self.swept_at = None
+
+    def _sweep(self, conn):
+        servers, marker = dict(), None
+        while True:
+            page = conn.servers.list(detailed=True,
+                                     search_opts=dict(self.search_opts),
+                                     marker=marker, limit=sweep_page_size)
+            if not page:
+                break
+            for server in page:
+                servers[server.id] = server
+            marker = page[-1].id
+        self.servers = servers
+        self.swept_at = time.time()
+
+    def _update(self, conn, interval):
+        if self.swept_at is None or time.time() - self.swept_at > interval:
+            self._sweep(conn)
+
+    def get(self, conn, server_id, interval):
+        """
+        Return the server from the snapshot, or ``None`` if the last sweep
+        did not see it.
+        """
+        with self.lock:
+            self._update(conn, interval)
+            return self.servers.get(server_id)
+
+    def forget(self, server_id):
+        """
+        Remove a server from the snapshot, so a deleted server is not
+        reported from it until the next sweep.
+        """
+        with self.lock:
+            self.servers.pop(server_id, None)
+
+status_sweepers = dict()
+status_sweepers_lock = threading.Lock()
+
+def get_status_sweeper(conn_key, search_opts=None):
+    """
+    Return the shared :class:`NovaStatusSweeper` of a connection and filter.
+    """
+    key = (conn_key, tuple(sorted((search_opts or dict()).items())))
+    with status_sweepers_lock:
+        sweeper = status_sweepers.get(key)
+        if sweeper is None:
+            sweeper = status_sweepers[key] = NovaStatusSweeper(search_opts)
+        return sweeper
+
+catalog_ttl = 300
+
+# novaclient looks these kinds up through the Glance and Neutron APIs; its
+# image and network listing proxies are gone
+CATALOG_FINDERS = dict(images=('glance', 'find_image'),
+                       networks=('neutron', 'find_network'))
+
+def is_uuid(ref):
+    try:
+        uuid.UUID(str(ref))
+    except ValueError:
+        return False
+    return True
+
+class NovaCatalog(object):
+    """
+    Flavors, images and networks of a tenant, resolved to ids.
+
+    Flavors are listed with one call; images and networks are looked up one
+    by one with ``conn.glance.find_image`` and ``conn.neutron.find_network``.
+    Results are cached for ``catalog_ttl`` seconds. A flavor missing from a
+    cached list triggers one early refresh before it is reported as unknown.
+    If a kind cannot be queried, a warning is logged and its references are
+    passed through unchecked. Network ids are always passed through, as
+    Neutron is only searched by name; Nova rejects unknown ones on create.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = dict()
+
+    def _refresh(self, conn, kind):
+        try:
+            items = getattr(conn, kind).list()
+        except Exception as ex:
+            log.warning('Cannot list Nova %s, not validating them: %s', kind, ex)
+            ids = None
+        else:
+            ids = dict()
+            for item in items:
+                ids[item.id] = item.id
+            for item in items:
+                name = getattr(item, 'name', None)
+                if name is not None:
+                    ids.setdefault(name, item.id)
+        self.entries[kind] = (time.time(), ids)
+        return ids
+
+    def _find(self, conn, kind, ref):
+        proxy, method = CATALOG_FINDERS[kind]
+        try:
+            item = getattr(getattr(conn, proxy), method)(ref)
+        except (novaclient.exceptions.NotFound,
+                novaclient.exceptions.NoUniqueMatch):
+            raise KeyError(ref)
+        except Exception as ex:
+            log.warning('Cannot look up Nova %s %r, not validating it: %s',
+                        kind, ref, ex)
+            return ref
+        self.entries[(kind, ref)] = (time.time(), item.id)
+        return item.id
+
+    def resolve(self, conn, kind, ref):
+        """
+        Return the id of the flavor, image or network called or identified
+        by ``ref``.
+
+        :param str kind: ``flavors``, ``images`` or ``networks``.
+        :raises KeyError: if ``ref`` is unknown or ambiguous.
+        """
+        with self.lock:
+            if kind in CATALOG_FINDERS:
+                if kind == 'networks' and is_uuid(ref):
+                    return ref
+                entry = self.entries.get((kind, ref))
+                if entry is not None and time.time() - entry[0] <= catalog_ttl:
+                    return entry[1]
+                return self._find(conn, kind, ref)
+            entry = self.entries.get(kind)
+            if entry is None or time.time() - entry[0] > catalog_ttl:
+                ids = self._refresh(conn, kind)
+            else:
+                ids = entry[1]
+                if ids is not None and ref not in ids:
+                    ids = self._refresh(conn, kind)
+            if ids is None:
+                return ref
+            return ids[ref]
+
+catalogs = dict()
+catalogs_lock = threading.Lock()
+
+def get_catalog(conn_key):
+    """
+    Return the shared :class:`NovaCatalog` of a connection.
+    """
+    with catalogs_lock:
+        catalog = catalogs.get(conn_key)
+        if catalog is None:
+            catalog = catalogs[conn_key] = NovaCatalog()
+        return catalog
+
+def resolve_resources(resource_handler, conn, node_def):
+    """
+    Resolve the image, flavor and network of a node to ids, validating them
+    before anything is created.
+
+    :returns: ``(image_id, flavor_id, network_id)``
+    :raises NodeCreationError: listing every unknown reference.
+    """
+    res = node_def['resource']
+    catalog = get_catalog(connection_key(resource_handler.endpoint,
+                                         resource_handler.auth_data, node_def))
+    refs = [('images', 'image_id', res['image_id']),
+            ('flavors', 'flavor_name', res['flavor_name']),
+            ('networks', 'network_id', res.get('network_id', None))]
+    resolved, unknown = list(), list()
+    for kind, key, ref in refs:
+        if ref is None:
+            resolved.append(None)
+            continue
+        try:
+            resolved.append(catalog.resolve(conn, kind, ref))
+        except KeyError:
+            unknown.append('{0}={1!r}'.format(key, ref))
+    if unknown:
+        raise NodeCreationError(None, '[{0}] Unknown resource(s): {1}'.format(
+            resource_handler.name, ', '.join(unknown)))
+    return tuple(resolved)
+
+class CreateCancelled(KeyboardInterrupt):
+    """
+    Raised by a node creation cancelled through its
+    :class:`CancellationToken`.
+
+    It is a :class:`KeyboardInterrupt`, so callers handling interrupted
+    creations need no changes.
+    """
+
+class CancellationToken(object):
+    """
+    Thread-safe request to abandon a node creation.
+
+    Unlike a signal handler, a token can be cancelled from any thread or
+    event loop, so it also works for creations running in worker threads.
+    The creation checks the token after each step and rolls back whatever
+    it has created so far.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise CreateCancelled()
+
+active_tokens = set()
+active_tokens_lock = threading.Lock()
+
+def cancel_all_creates():
+    """
+    Cancel every Nova node creation in progress in this process.
+
+    Meant to be called by the thread receiving ``KeyboardInterrupt``;
+    :meth:`ResourceHandler.create_node` and
+    :meth:`~ResourceHandler.create_nodes` do so through
+    :meth:`NovaResourceHandler.cancel_creates`.
+    """
+    with active_tokens_lock:
+        tokens = list(active_tokens)
+    for token in tokens:
+        token.cancel()
+
+@contextlib.contextmanager
+def tracked_token(token):
+    """
+    Register a :class:`CancellationToken` for :func:`cancel_all_creates`
+    while a creation runs.
+    """
+    with active_tokens_lock:
+        active_tokens.add(token)
+    try:
+        yield token
+    finally:
+        with active_tokens_lock:
+            active_tokens.discard(token)
+
+# Server metadata key marking the node a server was created for
+NODE_ID_KEY = 'occopus_node_id'
+
+def delete_servers_named(conn, name_regex, metadata=None):
+    """
+    Delete the servers whose name matches ``name_regex``; used to roll back
+    creations whose response was lost.
+
+    :param dict metadata: Only delete the servers having these metadata
+        items, as the name alone may be shared by other servers.
+    """
+    for server in conn.servers.list(search_opts=dict(name=name_regex)):
+        server_meta = getattr(server, 'metadata', None) or dict()
+        if any(server_meta.get(k) != v for k, v in (metadata or dict()).items()):
+            continue
+        log.debug('Rolling back server %s (%s)', server.id, server.name)
+        conn.servers.delete(server.id)
 
 class CreateNode(Command):
-    def __init__(self, resolved_node_definition):
+    def __init__(self, resolved_node_definition, cancellation_token=None):
         Command.__init__(self)
         self.resolved_node_definition = resolved_node_definition
+        self.cancellation_token = cancellation_token or CancellationToken()
 
     def _start_instance(self, resource_handler, node_def):
         """
@@ -134,38 +630,42 @@ class CreateNode(Command):
         :Remark: This is a "wet method", the VM will not be started
             if the instance is in debug mode (``dry_run``).
         """
-        image_id = node_def['resource']['image_id']
-        flavor_name = node_def['resource']['flavor_name']
+        image_id, flavor_name, network_id = resolve_resources(
+            resource_handler, self.conn, node_def)
         context = node_def.get('context', None)
         sec_groups = node_def['resource'].get('security_groups', None)
         key_name = node_def['resource'].get('key_name', None)
         server_name = node_def['resource'].get('server_name',unique_vmname(node_def))
-        network_id = node_def['resource'].get('network_id', None)
+        # server_name may be shared by all nodes of the node type; the
+        # metadata tells our server apart when rolling back
+        meta = {NODE_ID_KEY: node_def['node_id']}
         nics = None
         if network_id is not None:
             nics = [{"net-id": network_id, "v4-fixed-ip": ''}]
         log.debug("[%s] Creating new server using image ID %r and flavor name %r",
             resource_handler.name, image_id, flavor_name)
+        self.cancellation_token.raise_if_cancelled()
+        server = None
         try:
-            server = None
-            KBinterrupt = False
-            with GracefulInterruptHandler() as h:
-                log.debug('Server creation started for node %s...', node_def['node_id'])
-                server = self.conn.servers.create(server_name, image_id, flavor_name,
-                     security_groups=sec_groups, key_name=key_name, userdata=context, nics=nics)
-                KBinterrupt = h.interrupted
-                log.debug('Server creation finished for node %s: server: %r', node_def['node_id'], server)
-            if KBinterrupt:
-              log.debug('Keyboard interrupt detected while VM was being created!')
-              raise KeyboardInterrupt
+            log.debug('Server creation started for node %s...', node_def['node_id'])
+            server = self.conn.servers.create(server_name, image_id, flavor_name,
+                 security_groups=sec_groups, key_name=key_name, userdata=context, nics=nics,
+                 meta=meta)
+            log.debug('Server creation finished for node %s: server: %r', node_def['node_id'], server)
+            self.cancellation_token.raise_if_cancelled()
         except KeyboardInterrupt:
             log.debug('Interrupting node creation!')
-            if server is not None:
-                log.debug('Rolling back...')
-                try:
+            log.debug('Rolling back...')
+            try:
+                if server is not None:
                     self.conn.servers.delete(server)
-                except Exception as ex:
-                    raise NodeCreationError(None, str(ex))
+                else:
+                    # Interrupted before the response arrived: the server
+                    # may exist, but we only know its name and metadata
+                    delete_servers_named(self.conn, '^{0}$'.format(re.escape(server_name)),
+                                         meta)
+            except Exception as ex:
+                raise NodeCreationError(None, str(ex))
             raise
         except Exception as ex:
             raise NodeCreationError(None, str(ex))
@@ -175,63 +675,33 @@ class CreateNode(Command):
         pool = self.resolved_node_definition['resource'].get('floating_ip_pool', None)
         if ('floating_ip' not in self.resolved_node_definition['resource']) and (pool is None):
             return
-        flip_waiting = 10
-        flip_attempts = 60
-        attempts = 1
-        while attempts <= flip_attempts:
-            unused_ips = [addr for addr in self.conn.floating_ips.list() \
-                         if addr.instance_id is None and ( not pool or pool == addr.pool) ]
-            if not unused_ips:
-                if pool is not None:
-                    error_msg = '[{0}] Cannot find unused floating ip address in pool "{1}"!'.format(
-                          resource_handler.name, pool)
-                else:
-                    error_msg = '[{0}] Cannot find unused floating ip address!'.format(
-                          resource_handler.name)
-                server = self.conn.servers.get(server.id)
-                self.conn.servers.delete(server)
-                raise NodeCreationError(None, error_msg)
-            log.debug("[%s] List of unused floating ips: %s", resource_handler.name, str([ ip.ip for ip in unused_ips]))
-            floating_ip = random.choice(unused_ips)
-            try:
-                log.debug("[%s] Try associating floating ip (%s) to server (%s)...",
-                          resource_handler.name, floating_ip.ip, server.id)
-                server.add_floating_ip(floating_ip)
-                time.sleep(random.randint(1,5))
-                flips = self.conn.floating_ips.list()
-                log.debug("[%s] List of floating IPs: %s", resource_handler.name, flips)
-                myallocation = [ addr for addr in flips if addr.instance_id == server.id ]
-                if not myallocation:
-                    log.debug("SOMEONE took my ip meanwhile I was allocating it!")
-                    raise Exception
-                else:
-                    log.debug("ALLOCATION seemt to succeed: %r",myallocation[0])
-                    log.debug("[%s] Associating floating ip (%s) to node: success. Took %i seconds.", resource_handler.name, floating_ip.ip, (attempts - 1) * flip_waiting)
-                    break
-            except Exception as e:
-                log.debug(e)
-                log.debug("[%s] Associating floating ip (%s) to node failed. Retry after %i seconds...", resource_handler.name, floating_ip.ip, flip_waiting)
-                time.sleep(flip_waiting)
-                attempts += 1
-        if attempts > flip_attempts:
-            error_msg = '[{0}] Gave up associating floating ip to node! Could not get it in {1} seconds."'.format(
-                        resource_handler.name, flip_attempts * flip_waiting)
-            log.error(error_msg)
+        conn_key = connection_key(resource_handler.endpoint,
+                                  resource_handler.auth_data,
+                                  self.resolved_node_definition)
+        allocator = get_floating_ip_allocator(conn_key, pool)
+        try:
+            floating_ip = allocator.allocate(resource_handler, self.conn, server)
+        except NodeCreationError as ex:
+            log.error(str(ex))
             server = self.conn.servers.get(server.id)
             self.conn.servers.delete(server)
-            raise NodeCreationError(None, error_msg)
-        return
+            raise
+        get_floating_ip_index(conn_key).add(server.id, floating_ip.ip)
+        log.debug("[%s] Associating floating ip (%s) to node: success.",
+                  resource_handler.name, floating_ip.ip)
 
     @wet_method(1)
     @needs_connection
     def perform(self, resource_handler):
         log.debug("[%s] Creating node: %r",
                   resource_handler.name, self.resolved_node_definition['name'])
+        server = None
         try:
-            server = None
-            server = self._start_instance(resource_handler, self.resolved_node_definition)
-            log.debug("[%s] Server instance created, id: %r", resource_handler.name, server.id)
-            self._allocate_floating_ip(resource_handler,server)
+            with tracked_token(self.cancellation_token):
+                server = self._start_instance(resource_handler, self.resolved_node_definition)
+                log.debug("[%s] Server instance created, id: %r", resource_handler.name, server.id)
+                self._allocate_floating_ip(resource_handler,server)
+                self.cancellation_token.raise_if_cancelled()
         except KeyboardInterrupt:
             try:
                 if server is not None:
@@ -242,6 +712,138 @@ class CreateNode(Command):
             raise
         return server.id
 
+def batch_signature(node_def):
+    """
+    Properties that must be identical for nodes to be created in one
+    multi-create request.
+    """
+    res = node_def['resource']
+    return (res['image_id'], res['flavor_name'], res.get('network_id', None),
+            res.get('key_name', None),
+            tuple(res.get('security_groups', None) or ()),
+            node_def.get('context', None),
+            'floating_ip' in res, res.get('floating_ip_pool', None))
+
+class CreateNodes(Command):
+    """
+    Create several nodes, using one multi-create request (``min_count`` /
+    ``max_count``) per group of identical node definitions.
+
+    The servers of a batch are matched to the nodes by the index suffix Nova
+    appends to their names, then renamed as if they had been created one by
+    one. Floating IPs are associated in parallel. If any node of a batch
+    fails, all servers of the batch are deleted, and so are the nodes
+    already created for the other groups.
+    """
+    def __init__(self, resolved_node_definitions, cancellation_token=None):
+        Command.__init__(self)
+        self.resolved_node_definitions = resolved_node_definitions
+        self.resolved_node_definition = resolved_node_definitions[0]
+        self.cancellation_token = cancellation_token or CancellationToken()
+
+    @staticmethod
+    def _batch_index(server, prefix):
+        suffix = server.name[len(prefix):].lstrip('-')
+        return int(suffix) if suffix.isdigit() else suffix
+
+    def _list_batch(self, prefix, count):
+        search_opts = dict(name='^{0}'.format(re.escape(prefix)))
+        servers = self.conn.servers.list(search_opts=search_opts)
+        if len(servers) != count:
+            raise NodeCreationError(None,
+                'Multi-create returned {0} servers instead of {1}'.format(
+                    len(servers), count))
+        return sorted(servers, key=lambda srv: self._batch_index(srv, prefix))
+
+    @wet_method()
+    @needs_connection
+    def _create_batch(self, resource_handler, node_defs):
+        node_def = node_defs[0]
+        res = node_def['resource']
+        image_id, flavor_id, network_id = resolve_resources(
+            resource_handler, self.conn, node_def)
+        nics = None
+        if network_id is not None:
+            nics = [{"net-id": network_id, "v4-fixed-ip": ''}]
+        prefix = 'occopus-batch-{0}'.format(uuid.uuid4().hex[:8])
+        log.debug("[%s] Creating %d servers in one request using image ID %r and flavor %r",
+                  resource_handler.name, len(node_defs), image_id, flavor_id)
+        self.cancellation_token.raise_if_cancelled()
+        try:
+            self.conn.servers.create(prefix, image_id, flavor_id,
+                security_groups=res.get('security_groups', None),
+                key_name=res.get('key_name', None),
+                userdata=node_def.get('context', None), nics=nics,
+                min_count=len(node_defs), max_count=len(node_defs))
+            servers = self._list_batch(prefix, len(node_defs))
+            self.cancellation_token.raise_if_cancelled()
+        except KeyboardInterrupt:
+            self._rollback(resource_handler, prefix)
+            raise
+        except Exception as ex:
+            self._rollback(resource_handler, prefix)
+            raise NodeCreationError(None, str(ex))
+        try:
+            for nd, server in zip(node_defs, servers):
+                server.update(name=nd['resource'].get('server_name', unique_vmname(nd)))
+            with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+                futures = list()
+                for nd, server in zip(node_defs, servers):
+                    cmd = CreateNode(nd, self.cancellation_token)
+                    cmd.conn = self.conn
+                    futures.append(executor.submit(
+                        cmd._allocate_floating_ip, resource_handler, server))
+                for f in futures:
+                    f.result()
+            self.cancellation_token.raise_if_cancelled()
+        except (Exception, KeyboardInterrupt) as ex:
+            log.error('[%s] Creating batch %s failed, rolling back: %s',
+                      resource_handler.name, prefix, ex)
+            for server in servers:
+                try:
+                    self.conn.servers.delete(server.id)
+                except Exception as dex:
+                    log.debug('[%s] Deleting %s failed: %s',
+                              resource_handler.name, server.id, dex)
+            if isinstance(ex, (NodeCreationError, KeyboardInterrupt)):
+                raise
+            raise NodeCreationError(None, str(ex))
+        return [server.id for server in servers]
+
+    def _rollback(self, resource_handler, prefix):
+        try:
+            delete_servers_named(self.conn, '^{0}'.format(re.escape(prefix)))
+        except Exception as ex:
+            log.error('[%s] Rolling back batch %s failed: %s',
+                      resource_handler.name, prefix, ex)
+
+    def perform(self, resource_handler):
+        groups = OrderedDict()
+        for index, node_def in enumerate(self.resolved_node_definitions):
+            groups.setdefault(batch_signature(node_def), list()).append(index)
+        instance_ids = [None] * len(self.resolved_node_definitions)
+        created = list()
+        try:
+            for indexes in groups.values():
+                node_defs = [self.resolved_node_definitions[i] for i in indexes]
+                if len(node_defs) == 1:
+                    ids = [CreateNode(node_defs[0], self.cancellation_token).perform(resource_handler)]
+                else:
+                    log.debug("[%s] Creating nodes %r in one batch", resource_handler.name,
+                              [nd['name'] for nd in node_defs])
+                    with tracked_token(self.cancellation_token):
+                        ids = self._create_batch(resource_handler, node_defs)
+                    if ids is None:
+                        ids = [1] * len(node_defs)
+                for i, instance_id in zip(indexes, ids):
+                    instance_ids[i] = instance_id
+                created.extend(zip(node_defs, ids))
+        except (Exception, KeyboardInterrupt):
+            # Groups created earlier would otherwise be left untracked
+            drop_created_nodes(resource_handler, created)
+            raise
+        return instance_ids
+
 class DropNode(Command):
     def __init__(self, instance_data):
         Command.__init__(self)
@@ -249,6 +851,7 @@ class DropNode(Command):
         self.resolved_node_definition = instance_data['resolved_node_definition']
 
     @wet_method()
+    @translates_not_found(is_not_found)
     @needs_connection
     def _delete_vms(self, resource_handler, *vm_ids):
         """
@@ -277,8 +880,13 @@ class DropNode(Command):
                   self.instance_data['node_id'])
         try:
             self._delete_vms(resource_handler, instance_id)
+        except InstanceNotFound:
+            raise
         except Exception as ex:
             raise NodeCreationError(None, str(ex))
+        finally:
+            resource_handler.forget_server(self.resolved_node_definition,
+                                           instance_id)
 
         log.debug("[%s] Done", resource_handler.name)
 
@@ -294,7 +902,11 @@ class GetState(Command):
         log.debug("[%s] Acquiring node state %r",
                   resource_handler.name, self.instance_data['node_id'])
         try:
-            server = self.conn.servers.get(self.instance_data['instance_id'])
+            server = resource_handler.get_server(
+                self.conn, self.resolved_node_definition,
+                self.instance_data['instance_id'])
+        except InstanceNotFound:
+            raise
         except Exception as ex:
             raise NodeCreationError(None, str(ex))
         inst_state = server.status
@@ -320,14 +932,19 @@ class GetAnyIpAddress(Command):
                   resource_handler.name,
                   self.instance_data['node_id'])
         try:
-            server = self.conn.servers.get(self.instance_data['instance_id'])
+            server = resource_handler.get_server(
+                self.conn, self.resolved_node_definition,
+                self.instance_data['instance_id'])
+        except InstanceNotFound:
+            raise
         except Exception as ex:
             raise NodeCreationError(None, str(ex))
-        floating_ips = self.conn.floating_ips.list()
-        for floating_ip in floating_ips:
-            if floating_ip.instance_id == server.id:
-                return floating_ip.ip
-        networks = self.conn.servers.ips(server)
+        floating_ips = get_floating_ip_index(
+            connection_key(resource_handler.endpoint, resource_handler.auth_data,
+                           self.resolved_node_definition)).lookup(self.conn, server.id)
+        if floating_ips:
+            return floating_ips[0]
+        networks = server.addresses
         for tenant in list(networks.keys()):
             for addre in networks[tenant]:
                 return addre['addr']
@@ -346,22 +963,22 @@ class GetPrivIpAddress(Command):
                   resource_handler.name,
                   self.instance_data['node_id'])
         try:
-            server = self.conn.servers.get(self.instance_data['instance_id'])
+            server = resource_handler.get_server(
+                self.conn, self.resolved_node_definition,
+                self.instance_data['instance_id'])
+        except InstanceNotFound:
+            raise
         except Exception as ex:
             raise NodeCreationError(None, str(ex))
-        ip = ""
-        floating_ips = self.conn.floating_ips.list()
-        networks = self.conn.servers.ips(server)
+        floating_ips = set(get_floating_ip_index(
+            connection_key(resource_handler.endpoint, resource_handler.auth_data,
+                           self.resolved_node_definition)).lookup(self.conn, server.id))
+        networks = server.addresses
         for tenant in list(networks.keys()):
             log.debug("[%s] networks[tenant]: %s",resource_handler.name,networks[tenant])
             for addre in networks[tenant]:
-                ip = addre['addr']
-                private_ip = ip
-                for floating_ip in floating_ips:
-                    if floating_ip.instance_id == server.id:
-                        if floating_ip.ip == ip:
-                            private_ip = ""
-                if private_ip != "":
+                private_ip = addre['addr']
+                if private_ip not in floating_ips:
                   log.debug("[%s] Private ip found: %s",resource_handler.name,private_ip)
                   return private_ip
         log.debug("[%s] Private ip not found.",resource_handler.name)
@@ -387,6 +1004,11 @@ class NovaResourceHandler(ResourceHandler):
     :param str name: The name of this ``ResourceHandler`` instance. If unset,
         ``target['endpoint']`` is used.
     :param bool dry_run: Skip actual resource aquisition, polling, etc.
+    :param int status_sweep_interval: If set, node states and addresses are
+        served from a snapshot of all servers, retaken at most this often
+        (seconds). See :class:`NovaStatusSweeper`.
+    :param dict status_sweep_filter: ``search_opts`` restricting the servers
+        listed by the sweeps.
 
     """
     def __init__(self, endpoint, auth_data,
@@ -408,13 +1030,47 @@ class NovaResourceHandler(ResourceHandler):
             raise NodeCreationError(None,errormsg)
         self.auth_data = auth_data
         self.data = config
+        self.status_sweep_interval = config.get('status_sweep_interval', None)
+        self.status_sweep_filter = config.get('status_sweep_filter', None)
 
     def get_connection(self, resolved_node_definition):
         return setup_connection(self.endpoint, self.auth_data, resolved_node_definition)
 
+    def get_status_sweeper(self, resolved_node_definition):
+        return get_status_sweeper(
+            connection_key(self.endpoint, self.auth_data, resolved_node_definition),
+            self.status_sweep_filter)
+
+    def get_server(self, conn, resolved_node_definition, server_id):
+        """
+        Return a server, from the status sweep snapshot if enabled.
+        """
+        if self.status_sweep_interval:
+            server = self.get_status_sweeper(resolved_node_definition).get(
+                conn, server_id, self.status_sweep_interval)
+            if server is not None:
+                return server
+        try:
+            return conn.servers.get(server_id)
+        except novaclient.exceptions.NotFound as ex:
+            raise InstanceNotFound(server_id, str(ex))
+
+    def forget_server(self, resolved_node_definition, server_id):
+        """
+        Remove a dropped server from the status sweep snapshot.
+        """
+        if self.status_sweep_interval:
+            self.get_status_sweeper(resolved_node_definition).forget(server_id)
+
+    def cancel_creates(self):
+        cancel_all_creates()
+
     def cri_create_node(self, resolved_node_definition):
         return CreateNode(resolved_node_definition)
 
+    def cri_create_nodes(self, resolved_node_definitions):
+        return CreateNodes(resolved_node_definitions)
+
     def cri_drop_node(self, instance_data):
         return DropNode(instance_data)
 
@@ -434,7 +1090,8 @@ class NovaResourceHandler(ResourceHandler):
 class NovaSchemaChecker(RHSchemaChecker):
     def __init__(self):
         self.req_keys = ["type", "endpoint", "image_id", "flavor_name"]
-        self.opt_keys = ["server_name", "key_name", "security_groups", "floating_ip", "name", "project_id", "tenant_name", "user_domain_name", "network_id", "floating_ip_pool", "region_name"]
+        self.opt_keys = ["server_name", "key_name", "security_groups", "floating_ip", "name", "project_id", "tenant_name", "user_domain_name", "network_id", "floating_ip_pool", "region_name",
+                         "status_sweep_interval", "status_sweep_filter"]
     def perform_check(self, data):
         missing_keys = RHSchemaChecker.get_missing_keys(self, data, self.req_keys)
         if missing_keys:
@@ -18,17 +18,125 @@
 
 """
 
-__all__ = ['ResourceHandler', 'ResourceHandlerProvider']
+__all__ = ['ResourceHandler', 'ResourceHandlerProvider', 'InstanceNotFound']
 
 import occo.infobroker as ib
 import occo.util.factory as factory
 from ruamel import yaml
 import logging
 import time
+import threading
+import functools
+import occo.constants.status as status
 from occo.exceptions import SchemaError
 
 log = logging.getLogger('occo.resourcehandler')
 
+class InstanceNotFound(Exception):
+    """
+    Raised by the commands of a plugin when the cloud reports that the
+    instance does not exist (anymore).
+    """
+    def __init__(self, instance_id, reason=None):
+        Exception.__init__(self, instance_id, reason)
+        self.instance_id = instance_id
+        self.reason = reason
+
+    def __str__(self):
+        return 'Instance {0!r} not found{1}'.format(
+            self.instance_id, ': {0}'.format(self.reason) if self.reason else '')
+
+def translates_not_found(is_not_found):
+    """
+    Decorator of plugin methods raising :class:`InstanceNotFound` in place
+    of the exceptions ``is_not_found(exception)`` classifies as a missing
+    instance.
+    """
+    def decorator(fun):
+        @functools.wraps(fun)
+        def wrapper(*args, **kwargs):
+            try:
+                return fun(*args, **kwargs)
+            except InstanceNotFound:
+                raise
+            except Exception as ex:
+                if is_not_found(ex):
+                    raise InstanceNotFound(None, str(ex))
+                raise
+        return wrapper
+    return decorator
+
+not_found_ttl = 60
+
+class NotFoundCache(object):
+    """
+    Instances recently found missing.
+
+    Queries about them are answered without calling the cloud until the
+    entry expires after ``ttl`` seconds.
+    """
+    def __init__(self, ttl=not_found_ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.expires = dict()
+
+    def add(self, key):
+        with self.lock:
+            self.expires[key] = time.time() + self.ttl
+
+    def __contains__(self, key):
+        with self.lock:
+            expires = self.expires.get(key)
+            if expires is None:
+                return False
+            if expires < time.time():
+                del self.expires[key]
+                return False
+            return True
+
+not_found_cache = NotFoundCache()
+
+# Seconds an instance must keep being reported missing before it is treated
+# as gone, and between the attempts of a drop meanwhile
+not_found_grace = 15
+not_found_retry_wait = 3
+
+class MissingTracker(object):
+    """
+    When instances started to be reported missing.
+
+    Eventually consistent clouds (e.g. EC2) may report an instance missing
+    for a while after it has been created, so an instance only counts as
+    gone once it has been reported missing for ``grace`` seconds without
+    being found in between.
+    """
+    def __init__(self, grace=not_found_grace):
+        self.grace = grace
+        self.lock = threading.Lock()
+        self.first_missed = dict()
+
+    def missed(self, key):
+        """
+        Record that an instance has been reported missing.
+
+        :returns: Whether it has been missing long enough to be gone.
+        """
+        now = time.time()
+        with self.lock:
+            first = self.first_missed.setdefault(key, now)
+            return now - first >= self.grace
+
+    def found(self, key):
+        with self.lock:
+            self.first_missed.pop(key, None)
+
+missing_tracker = MissingTracker()
+
+def instance_key(instance_data):
+    resource = instance_data.get('resource', dict())
+    return (resource.get('type'), resource.get('endpoint'),
+            repr(instance_data.get('instance_id')))
+
 class Command(object):
     def __init__(self):
         pass   
@@ -36,6 +144,47 @@ class Command(object):
         """Perform the algorithm represented by this command."""
         raise NotImplementedError()
 
+def drop_created_nodes(resource_handler, created):
+    """
+    Drop the nodes created before a multi-node create failed, so that they
+    do not stay behind untracked.
+
+    :param list created: ``(resolved_node_definition, instance_id)`` pairs.
+    """
+    for rnd, instance_id in created:
+        instance_data = dict(instance_id=instance_id,
+                             node_id=rnd.get('node_id'),
+                             resource=rnd['resource'],
+                             resolved_node_definition=rnd)
+        try:
+            resource_handler.cri_drop_node(instance_data).perform(resource_handler)
+        except Exception as ex:
+            log.error('[%s] Dropping node %r (%r) after failed create failed: %s',
+                      resource_handler.name, rnd.get('node_id'), instance_id, ex)
+
+class CreateNodes(Command):
+    """
+    Create several nodes of the same resource one after the other.
+
+    This is the default implementation of
+    :meth:`ResourceHandler.cri_create_nodes`; backends able to create
+    nodes in bulk override it. If a node cannot be created, the nodes
+    created before it are dropped.
+    """
+    def __init__(self, resolved_node_definitions):
+        Command.__init__(self)
+        self.resolved_node_definitions = resolved_node_definitions
+    def perform(self, resource_handler):
+        created = list()
+        try:
+            for rnd in self.resolved_node_definitions:
+                created.append(
+                    (rnd, resource_handler.cri_create_node(rnd).perform(resource_handler)))
+        except (Exception, KeyboardInterrupt):
+            drop_created_nodes(resource_handler, created)
+            raise
+        return [instance_id for rnd, instance_id in created]
+
 class RHSchemaChecker(factory.MultiBackend):
     def __init__(self):
         return
@@ -79,6 +228,27 @@ class ResourceHandler(factory.MultiBackend):
         """
         raise NotImplementedError()
 
+    def cri_create_nodes(self, resolved_node_definitions):
+        """ Instantiate several nodes of this resource.
+
+        :param list resolved_node_definitions: Definitions of the nodes, all
+            using the same resource.
+
+        The command returns the instance ids in the order of the
+        definitions.
+        """
+        return CreateNodes(resolved_node_definitions)
+
+    def cancel_creates(self):
+        """ Cancel the node creations of this backend that are in progress
+        in other threads of this process.
+
+        Called when a creation is interrupted with ``KeyboardInterrupt``.
+        Backends whose creations can be cancelled override it; by default
+        it does nothing.
+        """
+        pass
+
     def cri_drop_node(self, instance_data):
         """ Destroy a node instance.
 
@@ -106,23 +276,81 @@ class ResourceHandler(factory.MultiBackend):
 
     def create_node(self, resolved_node_definition):
         rh = self.instantiate_rh(resolved_node_definition)
-        return rh.cri_create_node(resolved_node_definition).perform(rh)
+        try:
+            return rh.cri_create_node(resolved_node_definition).perform(rh)
+        except KeyboardInterrupt:
+            rh.cancel_creates()
+            raise
+
+    def create_nodes(self, resolved_node_definitions):
+        rh = self.instantiate_rh(resolved_node_definitions[0])
+        try:
+            return rh.cri_create_nodes(resolved_node_definitions).perform(rh)
+        except KeyboardInterrupt:
+            rh.cancel_creates()
+            raise
+
+    def _query(self, instance_data, cri, missing):
+        """
+        Perform a query about an instance; if the instance is gone, return
+        ``missing`` and remember that for a while.
+
+        An instance reported missing for less than ``not_found_grace``
+        seconds may be a new one the cloud does not list yet; the
+        :class:`InstanceNotFound` is raised then.
+        """
+        key = instance_key(instance_data)
+        if key in not_found_cache:
+            return missing
+        rh = self.instantiate_rh(instance_data)
+        try:
+            result = cri(rh, instance_data).perform(rh)
+        except InstanceNotFound as ex:
+            if not missing_tracker.missed(key):
+                raise
+            log.info('Node %r: %s', instance_data.get('node_id'), ex)
+            not_found_cache.add(key)
+            return missing
+        missing_tracker.found(key)
+        return result
 
     def drop_node(self, instance_data):
+        """
+        Destroy a node instance.
+
+        The not-found cache is not used, so a drop is never skipped. An
+        instance reported missing is dropped again every
+        ``not_found_retry_wait`` seconds until it has been missing for
+        ``not_found_grace`` seconds, as it may have just been created.
+        """
+        key = instance_key(instance_data)
         rh = self.instantiate_rh(instance_data)
-        return rh.cri_drop_node(instance_data).perform(rh)
+        while True:
+            try:
+                result = rh.cri_drop_node(instance_data).perform(rh)
+            except InstanceNotFound as ex:
+                if missing_tracker.missed(key):
+                    log.info('Node %r: %s', instance_data.get('node_id'), ex)
+                    return None
+                log.debug('Node %r: %s; retrying the drop in %s seconds',
+                          instance_data.get('node_id'), ex, not_found_retry_wait)
+                time.sleep(not_found_retry_wait)
+                continue
+            missing_tracker.found(key)
+            return result
 
     def get_state(self, instance_data):
-        rh = self.instantiate_rh(instance_data)
-        return rh.cri_get_state(instance_data).perform(rh)
+        return self._query(instance_data,
+                           lambda rh, data: rh.cri_get_state(data),
+                           status.SHUTDOWN)
 
     def get_address(self, instance_data):
-        rh = self.instantiate_rh(instance_data)
-        return rh.cri_get_address(instance_data).perform(rh)
+        return self._query(instance_data,
+                           lambda rh, data: rh.cri_get_address(data), [])
 
     def get_ip_address(self, instance_data):
-        rh = self.instantiate_rh(instance_data)
-        return rh.cri_get_ip_address(instance_data).perform(rh)
+        return self._query(instance_data,
+                           lambda rh, data: rh.cri_get_ip_address(data), None)
 
 @ib.provider
 class ResourceHandlerProvider(ib.InfoProvider):
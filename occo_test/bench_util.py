@@ -0,0 +1,83 @@
+### Copyright 2014, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+
+""" Helpers shared by the offline resource handler benchmarks.
+"""
+
+import logging
+import time
+
+import occo.infobroker as ib
+
+log = logging.getLogger('occo_test.bench')
+
+@ib.provider
+class AuthDataProvider(ib.InfoProvider):
+    def __init__(self, auth_data):
+        self.auth_data = auth_data
+
+    @ib.provides('backends.auth_data')
+    def get_auth_data(self, section, resource):
+        return self.auth_data
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+class Phase(object):
+    """
+    Timing and API call statistics of one kind of operation.
+    """
+    def __init__(self, name, cloud):
+        self.name = name
+        self.cloud = cloud
+        self.latencies = list()
+        self.errors = 0
+
+    def __enter__(self):
+        self.calls_before = self.cloud.call_counts()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.elapsed = time.time() - self.start
+        self.calls = self.cloud.call_counts() - self.calls_before
+
+    def timed(self, fun, *args):
+        start = time.time()
+        try:
+            return fun(*args)
+        except Exception:
+            self.errors += 1
+            log.exception('%s failed:', self.name)
+        finally:
+            self.latencies.append(time.time() - start)
+
+    def report(self):
+        ops = len(self.latencies)
+        print('{0}: {1} ops in {2:.2f} s, {3:.1f} ops/s, {4} errors'.format(
+            self.name, ops, self.elapsed, ops / self.elapsed if self.elapsed else 0,
+            self.errors))
+        print('    latency p50={0:.3f} p95={1:.3f} p99={2:.3f} max={3:.3f} s'.format(
+            percentile(self.latencies, 50), percentile(self.latencies, 95),
+            percentile(self.latencies, 99), max(self.latencies or [0])))
+        for call, count in sorted(self.calls.items()):
+            print('    {0:<40} {1:>6} ({2:.2f}/op)'.format(
+                call, count, count / float(ops) if ops else 0))
+        errors = sum(count for call, count in self.calls.items()
+                     if call.endswith('.error'))
+        if errors:
+            print('    injected API errors retried: {0}'.format(errors))
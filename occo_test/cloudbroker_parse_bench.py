@@ -0,0 +1,100 @@
+### Copyright 2014, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+
+""" CPU cost of parsing CloudBroker instance responses.
+
+Compares :func:`~occo.plugins.resourcehandler.cloudbroker.parse_instances`
+with building a ``minidom`` DOM and reading the fields with
+``getElementsByTagName``, as the plugin used to, on single-instance and list
+responses.
+
+Example::
+
+    python occo_test/cloudbroker_parse_bench.py --instances 1 10 100 1000
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from occo.plugins.resourcehandler.cloudbroker import \
+    parse_instances, INSTANCE_FIELDS
+from fake_rest import INSTANCE_FIELDS as DOCUMENT_FIELDS
+
+def instance_xml(n):
+    values = {
+        'id': str(uuid.uuid4()), 'name': 'instance-{0}'.format(n),
+        'status': 'running', 'deployment-id': 'bench-deployment',
+        'instance-type-id': 'bench-type',
+        'internal-ip-address': '10.1.{0}.{1}'.format(n // 250, n % 250 + 2),
+        'external-ip-address': '203.0.113.{0}'.format(n % 250 + 1),
+        'internal-hostname': 'ip-10-1-{0}-{1}.internal'.format(n // 250, n % 250 + 2),
+        'external-hostname': 'node-{0}.cloudbroker.example'.format(n),
+        'created-at': '2016-01-01T00:00:00Z', 'updated-at': '2016-01-01T00:00:00Z',
+        'disable-autostop': 'true', 'isolated': 'true'}
+    return '<instance>{0}</instance>'.format(''.join(
+        '<{0}>{1}</{0}>'.format(field, values[field]) for field in DOCUMENT_FIELDS))
+
+def document(instances):
+    if instances == 1:
+        body = instance_xml(0)
+    else:
+        body = '<instances type="array">{0}</instances>'.format(
+            ''.join(instance_xml(n) for n in range(instances)))
+    return ('<?xml version="1.0" encoding="UTF-8"?>' + body).encode('utf-8')
+
+def get_tag_text(nodelist):
+    return ''.join(node.data for node in nodelist
+                   if node.nodeType == node.TEXT_NODE)
+
+def parse_dom(doc):
+    dom = xml.dom.minidom.parseString(doc)
+    return [dict((name, get_tag_text(
+                 instance.getElementsByTagName(field).item(0).childNodes))
+                 for field, name in INSTANCE_FIELDS.items())
+            for instance in dom.getElementsByTagName('instance')]
+
+def measure(parse, doc, repeat):
+    start = time.process_time()
+    for i in range(repeat):
+        parse(doc)
+    return (time.process_time() - start) / repeat
+
+def main(args):
+    print('{0:>10} {1:>10} {2:>14} {3:>14} {4:>8}'.format(
+        'instances', 'bytes', 'minidom ms', 'streaming ms', 'speedup'))
+    for instances in args.instances:
+        doc = document(instances)
+        repeat = max(1, args.work // instances)
+        assert [r.id for r in parse_instances(doc)] == \
+               [r['id'] for r in parse_dom(doc)]
+        dom = measure(parse_dom, doc, repeat)
+        streaming = measure(parse_instances, doc, repeat)
+        print('{0:>10} {1:>10} {2:>14.3f} {3:>14.3f} {4:>7.1f}x'.format(
+            instances, len(doc), dom * 1000, streaming * 1000, dom / streaming))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Measure CPU per CloudBroker response parse')
+    parser.add_argument('--instances', type=int, nargs='+',
+                        default=[1, 10, 100, 1000],
+                        help='instances per response')
+    parser.add_argument('--work', type=int, default=20000,
+                        help='instances parsed per measurement')
+    main(parser.parse_args())
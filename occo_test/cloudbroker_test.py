@@ -0,0 +1,144 @@
+### Copyright 2014, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+#!/dev/null
+
+import unittest
+from nose.tools import ok_, eq_
+import occo.plugins.resourcehandler.cloudbroker as cloudbroker
+from occo.plugins.resourcehandler.cloudbroker import parse_instances, \
+    InstanceSweeper
+
+INSTANCE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<instance>
+  <id>1a2b</id>
+  <name>node-1</name>
+  <status>running</status>
+  <deployment>
+    <id>not-the-instance-id</id>
+  </deployment>
+  <internal-ip-address>10.0.0.2</internal-ip-address>
+  <external-ip-address> 203.0.113.7 </external-ip-address>
+  <internal-hostname>ip-10-0-0-2.internal</internal-hostname>
+  <external-hostname></external-hostname>
+</instance>
+"""
+
+INSTANCES = b"""<?xml version="1.0" encoding="UTF-8"?>
+<instances type="array">
+  <instance><id>a</id><status>starting</status></instance>
+  <instance><id>b</id><status>running</status></instance>
+  <instance><id>c</id><status>stopped</status></instance>
+</instances>
+"""
+
+class ParseInstancesTest(unittest.TestCase):
+    def test_single(self):
+        records = parse_instances(INSTANCE)
+        eq_(len(records), 1)
+        eq_(records[0].id, '1a2b')
+        eq_(records[0].status, 'running')
+        eq_(records[0].internal_ip, '10.0.0.2')
+        eq_(records[0].external_ip, '203.0.113.7')
+        eq_(records[0].internal_hostname, 'ip-10-0-0-2.internal')
+        eq_(records[0].external_hostname, '')
+    def test_list(self):
+        records = parse_instances(INSTANCES)
+        eq_([r.id for r in records], ['a', 'b', 'c'])
+        eq_([r.status for r in records], ['starting', 'running', 'stopped'])
+    def test_missing_fields(self):
+        record = parse_instances(INSTANCES)[0]
+        eq_(record.internal_ip, '')
+        eq_(record.external_hostname, '')
+    def test_empty_list(self):
+        eq_(parse_instances(b'<instances type="array"></instances>'), [])
+
+class Response(object):
+    def __init__(self, status_code, content=b''):
+        self.status_code = status_code
+        self.content = content
+        self.text = content.decode('utf-8')
+
+class FakeRequests(object):
+    """ Serves ``/instances.xml`` pages of ``count`` instances; if
+    ``ignore_page`` is set, every request gets the first page. """
+    def __init__(self, count, ignore_page=False):
+        self.ids = ['i-{0:03}'.format(i) for i in range(count)]
+        self.ignore_page = ignore_page
+        self.status_code = 200
+        self.pages = list()
+    def get(self, url, auth, params, timeout):
+        self.pages.append(params['page'])
+        if self.status_code != 200:
+            return Response(self.status_code)
+        page = 1 if self.ignore_page else params['page']
+        start = (page - 1) * params['per_page']
+        body = ''.join('<instance><id>{0}</id><status>running</status></instance>'.format(i)
+                       for i in self.ids[start:start + params['per_page']])
+        return Response(200, '<instances type="array">{0}</instances>'.format(body)
+                        .encode('utf-8'))
+
+class ResourceHandler(object):
+    name = 'fake-cloudbroker'
+    endpoint = 'https://cloudbroker.example.com'
+    auth_data = dict(email='user@example.com', password='secret')
+
+class InstanceSweeperTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (cloudbroker.requests, cloudbroker.sweep_page_size,
+                      cloudbroker.sweep_max_pages)
+        cloudbroker.sweep_page_size = 10
+        self.rh = ResourceHandler()
+    def tearDown(self):
+        (cloudbroker.requests, cloudbroker.sweep_page_size,
+         cloudbroker.sweep_max_pages) = self.saved
+    def sweeper(self, fake):
+        cloudbroker.requests = fake
+        return InstanceSweeper()
+    def test_pages(self):
+        fake = FakeRequests(25)
+        sweeper = self.sweeper(fake)
+        eq_(sweeper.get(self.rh, 'i-024', 60).status, 'running')
+        eq_(len(sweeper.instances), 25)
+        eq_(fake.pages, [1, 2, 3])
+    def test_full_last_page(self):
+        fake = FakeRequests(20)
+        self.sweeper(fake).get(self.rh, 'i-000', 60)
+        eq_(fake.pages, [1, 2, 3])
+    def test_page_ignored(self):
+        fake = FakeRequests(25, ignore_page=True)
+        sweeper = self.sweeper(fake)
+        eq_(sweeper.get(self.rh, 'i-024', 60), None)
+        eq_(len(sweeper.instances), 10)
+        eq_(fake.pages, [1, 2])
+    def test_page_limit(self):
+        cloudbroker.sweep_max_pages = 2
+        fake = FakeRequests(50)
+        sweeper = self.sweeper(fake)
+        sweeper.get(self.rh, 'i-000', 60)
+        eq_(fake.pages, [1, 2])
+        eq_(len(sweeper.instances), 20)
+    def test_failed_sweep(self):
+        fake = FakeRequests(5)
+        sweeper = self.sweeper(fake)
+        sweeper.get(self.rh, 'i-000', 0)
+        fake.status_code = 500
+        eq_(sweeper.get(self.rh, 'i-000', 0).status, 'running')
+    def test_forget(self):
+        fake = FakeRequests(5)
+        sweeper = self.sweeper(fake)
+        sweeper.get(self.rh, 'i-000', 60)
+        sweeper.forget('i-000')
+        eq_(sweeper.get(self.rh, 'i-000', 60), None)
+        ok_(sweeper.get(self.rh, 'i-001', 60) is not None)
+        eq_(fake.pages, [1])
@@ -0,0 +1,318 @@
+### Copyright 2014, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+#!/dev/null
+
+import unittest
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from nose.tools import ok_, eq_
+import occo.plugins.resourcehandler.cloudsigma as cloudsigma
+from occo.plugins.resourcehandler.cloudsigma import DrivePool, ServerSweeper, \
+    CreateNodes, BatchNode, TransitionEstimator
+from occo.exceptions import NodeCreationError
+
+class ResourceHandler(object):
+    name = 'fake-cloudsigma'
+
+class TransitionEstimatorTest(unittest.TestCase):
+    def estimator(self, durations):
+        estimator = TransitionEstimator()
+        for duration in durations:
+            estimator.record('clone', duration)
+        return estimator
+    def test_no_history(self):
+        eq_(TransitionEstimator().next_wait('clone', 0, floor=0, ceiling=100),
+            cloudsigma.wait_time_between_api_call_retries)
+    def test_median_first(self):
+        estimator = self.estimator([10, 20, 30, 40, 50, 60, 70, 80, 90, 100])
+        eq_(estimator.next_wait('clone', 0, floor=0, ceiling=1000), 60)
+        eq_(estimator.next_wait('clone', 50, floor=0, ceiling=1000), 10)
+    def test_p90_after_median(self):
+        estimator = self.estimator([10, 20, 30, 40, 50, 60, 70, 80, 90, 100])
+        eq_(estimator.next_wait('clone', 60, floor=0, ceiling=1000), 40)
+    def test_overdue(self):
+        estimator = self.estimator([10, 20, 30])
+        eq_(estimator.next_wait('clone', 200, floor=0, ceiling=1000), 50)
+    def test_bounds(self):
+        estimator = self.estimator([10, 20, 30])
+        eq_(estimator.next_wait('clone', 29.9, floor=1, ceiling=1000), 1)
+        eq_(estimator.next_wait('clone', 2000, floor=1, ceiling=30), 30)
+    def test_transitions_are_separate(self):
+        estimator = self.estimator([10])
+        eq_(estimator.next_wait('start', 0, floor=0, ceiling=100),
+            cloudsigma.wait_time_between_api_call_retries)
+    def test_history_size(self):
+        estimator = self.estimator(range(cloudsigma.transition_history_size + 10))
+        eq_(estimator.get_estimates()['clone']['count'],
+            cloudsigma.transition_history_size)
+    def test_estimates(self):
+        estimates = self.estimator([30, 10, 20]).get_estimates()
+        eq_(estimates, dict(clone=dict(count=3, p50=20, p90=30)))
+
+class FakeCloud(object):
+    """ Stands in for the drive API calls used by :class:`DrivePool`. """
+    def __init__(self, clone_delay=0):
+        self.lock = threading.Lock()
+        self.clone_delay = clone_delay
+        self.ready = threading.Event()
+        self.ready.set()
+        self.drives = dict()
+        self.deleted = list()
+        self.count = 0
+    def clone_drive(self, resource_handler, libdrive_id):
+        time.sleep(self.clone_delay)
+        with self.lock:
+            self.count += 1
+            drv_id = 'drv-{0}'.format(self.count)
+            self.drives[drv_id] = 'cloning'
+        return drv_id, None
+    def wait_for_drive(self, resource_handler, drv_id, record=True):
+        self.ready.wait()
+        with self.lock:
+            if drv_id not in self.drives:
+                raise NodeCreationError(None, 'drive is gone')
+            self.drives[drv_id] = 'unmounted'
+    def get_drive_status(self, resource_handler, drv_id):
+        with self.lock:
+            return self.drives.get(drv_id, 'unknown'), None
+    def delete_drive(self, resource_handler, drv_id):
+        with self.lock:
+            self.deleted.append(drv_id)
+            self.drives.pop(drv_id, None)
+
+class DrivePoolTest(unittest.TestCase):
+    FUNCTIONS = ['clone_drive', 'wait_for_drive', 'get_drive_status', 'delete_drive']
+    def setUp(self):
+        self.saved = dict((name, getattr(cloudsigma, name)) for name in self.FUNCTIONS)
+        self.rh = ResourceHandler()
+        self.pools = list()
+    def tearDown(self):
+        for pool in self.pools:
+            pool.drain(self.rh)
+            self.cloud_ready.set()
+            self.wait_for(lambda: pool.refilling == 0)
+        for name, function in self.saved.items():
+            setattr(cloudsigma, name, function)
+    def cloud(self, **kwargs):
+        cloud = FakeCloud(**kwargs)
+        for name in self.FUNCTIONS:
+            setattr(cloudsigma, name, getattr(cloud, name))
+        self.cloud_ready = cloud.ready
+        return cloud
+    def pool(self, depth, **kwargs):
+        pool = DrivePool('lib', depth, **kwargs)
+        self.pools.append(pool)
+        return pool
+    def wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        ok_(condition())
+    def test_take(self):
+        cloud = self.cloud()
+        pool = self.pool(2)
+        eq_(pool.take(self.rh), None)
+        self.wait_for(lambda: len(pool.ready) == 2)
+        ok_(pool.take(self.rh) in ('drv-1', 'drv-2'))
+        eq_(pool.get_metrics()['hits'], 1)
+    def test_too_old(self):
+        cloud = self.cloud()
+        pool = self.pool(1, max_age=0)
+        pool.take(self.rh)
+        self.wait_for(lambda: len(pool.ready) == 1)
+        time.sleep(0.01)
+        pool.depth = 0
+        eq_(pool.take(self.rh), None)
+        eq_(cloud.deleted, ['drv-1'])
+    def test_not_unmounted(self):
+        cloud = self.cloud()
+        pool = self.pool(1)
+        pool.take(self.rh)
+        self.wait_for(lambda: len(pool.ready) == 1)
+        del cloud.drives['drv-1']
+        pool.depth = 0
+        eq_(pool.take(self.rh), None)
+        eq_(pool.get_metrics()['discarded'], 1)
+    def test_drain_deletes_cloning_drives(self):
+        cloud = self.cloud()
+        pool = self.pool(2)
+        pool.take(self.rh)
+        self.wait_for(lambda: len(pool.ready) == 2)
+        cloud.ready.clear()
+        pool.depth = 3
+        pool.take(self.rh)
+        self.wait_for(lambda: len(pool.cloning) == 2)
+        pool.drain()
+        eq_(sorted(cloud.deleted), ['drv-2', 'drv-3', 'drv-4'])
+        cloud.ready.set()
+        self.wait_for(lambda: pool.refilling == 0)
+        eq_(len(cloud.deleted), 3)
+        eq_(pool.take(self.rh), None)
+    def test_drain_waits_for_clone_requests(self):
+        cloud = self.cloud(clone_delay=0.2)
+        cloud.ready.clear()
+        pool = self.pool(1)
+        pool.take(self.rh)
+        self.wait_for(lambda: pool.requesting == 1)
+        pool.drain()
+        eq_(cloud.deleted, ['drv-1'])
+        cloud.ready.set()
+
+class ListingResponse(object):
+    def __init__(self, status_code, json_data=None):
+        self.status_code = status_code
+        self.json_data = json_data
+        self.text = ''
+    def json(self):
+        return self.json_data
+
+class ListingResourceHandler(ResourceHandler):
+    """ Serves ``/servers/detail/`` with ``limit``/``offset`` pagination,
+    at most ``max_limit`` objects per page. """
+    def __init__(self, count, max_limit=1000):
+        self.objects = [dict(uuid='srv-{0:03}'.format(i), status='running')
+                        for i in range(count)]
+        self.max_limit = max_limit
+        self.status_code = 200
+        self.requests = 0
+    def api_request(self, method, path, params):
+        self.requests += 1
+        if self.status_code != 200:
+            return ListingResponse(self.status_code)
+        offset, limit = params['offset'], min(params['limit'], self.max_limit)
+        return ListingResponse(200, dict(
+            meta=dict(total_count=len(self.objects)),
+            objects=self.objects[offset:offset + limit]))
+
+class ServerSweeperTest(unittest.TestCase):
+    def test_pages(self):
+        rh = ListingResourceHandler(25, max_limit=10)
+        sweeper = ServerSweeper()
+        eq_(sweeper.get(rh, 'srv-024', 60)['status'], 'running')
+        eq_(len(sweeper.servers), 25)
+        eq_(rh.requests, 3)
+    def test_failed_listing(self):
+        rh = ListingResourceHandler(2)
+        sweeper = ServerSweeper()
+        sweeper.get(rh, 'srv-000', 0)
+        rh.status_code = 503
+        time.sleep(0.01)
+        eq_(sweeper.get(rh, 'srv-000', 0)['status'], 'running')
+    def test_forget(self):
+        rh = ListingResourceHandler(2)
+        sweeper = ServerSweeper()
+        sweeper.get(rh, 'srv-000', 60)
+        sweeper.forget('srv-000')
+        eq_(sweeper.get(rh, 'srv-000', 60), None)
+        ok_(sweeper.get(rh, 'srv-001', 60) is not None)
+        eq_(rh.requests, 1)
+
+class BatchResourceHandler(ResourceHandler):
+    """ Serves the drive and server calls of the batch pipeline stages;
+    the detail listings answer ``list_status``. """
+    status_sweep_interval = None
+    def __init__(self, drives=None, servers=None, list_status=200, created=None):
+        self.drives = dict(drives or dict())
+        self.servers = dict(servers or dict())
+        self.list_status = list_status
+        self.created = created
+        self.deleted = list()
+        self.estimator = TransitionEstimator()
+    def api_request(self, method, path, params=None, json=None, headers=None):
+        parts = path.strip('/').split('/')
+        objects = self.drives if parts[0] == 'drives' else self.servers
+        if method == 'GET' and parts[1] == 'detail':
+            if self.list_status != 200:
+                return ListingResponse(self.list_status)
+            return ListingResponse(200, dict(
+                meta=dict(total_count=len(objects)),
+                objects=[dict(uuid=k, status=v) for k, v in objects.items()]))
+        if method == 'GET':
+            if parts[1] not in objects:
+                return ListingResponse(404)
+            return ListingResponse(200, dict(uuid=parts[1], status=objects[parts[1]]))
+        if method == 'POST' and len(parts) == 1:
+            count = len(json['objects']) if self.created is None else self.created
+            srv_ids = ['srv-{0}'.format(i) for i in range(count)]
+            for srv_id in srv_ids:
+                self.servers[srv_id] = 'stopped'
+            return ListingResponse(201, dict(objects=[dict(uuid=i) for i in srv_ids]))
+        if method == 'DELETE':
+            self.deleted.append(parts[1])
+            objects.pop(parts[1], None)
+            return ListingResponse(204)
+        raise AssertionError('Unexpected request {0} {1}'.format(method, path))
+
+class CreateNodesStagesTest(unittest.TestCase):
+    def setUp(self):
+        self.timeouts = cloudsigma.batch_clone_timeout, cloudsigma.batch_start_timeout
+    def tearDown(self):
+        cloudsigma.batch_clone_timeout, cloudsigma.batch_start_timeout = self.timeouts
+    def batch(self, count):
+        rnds = [dict(node_id=str(i), resource=dict(description=dict(cpu=1000)))
+                for i in range(count)]
+        cmd = CreateNodes(rnds)
+        cmd.failed = threading.Event()
+        cmd.executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(cmd.executor.shutdown)
+        return cmd, [BatchNode(rnd) for rnd in rnds]
+    def drive_nodes(self, nodes, waited=0):
+        for i, node in enumerate(nodes):
+            node.drv_id = 'drv-{0}'.format(i)
+            node.cloned = True
+            node.waiting_since = time.time() - waited
+        return nodes
+    def test_drives_listing_failed(self):
+        cmd, nodes = self.batch(2)
+        rh = BatchResourceHandler(drives={'drv-0': 'unmounted', 'drv-1': 'cloning_dst'},
+                                  list_status=503)
+        done, pending = cmd._stage_await_drives(rh, self.drive_nodes(nodes))
+        eq_((done, pending), ([nodes[0]], [nodes[1]]))
+    def test_drives_listing_failed_timeout(self):
+        cloudsigma.batch_clone_timeout = 10
+        cmd, nodes = self.batch(1)
+        rh = BatchResourceHandler(drives={'drv-0': 'cloning_dst'}, list_status=503)
+        eq_(cmd._stage_await_drives(rh, self.drive_nodes(nodes, waited=20)),
+            ([], []))
+        ok_(cmd.failed.is_set())
+        ok_('after 10 seconds' in nodes[0].error)
+    def test_drive_gone(self):
+        cmd, nodes = self.batch(1)
+        rh = BatchResourceHandler()
+        eq_(cmd._stage_await_drives(rh, self.drive_nodes(nodes)), ([], []))
+        ok_(cmd.failed.is_set())
+    def test_servers_listing_failed_timeout(self):
+        cloudsigma.batch_start_timeout = 10
+        cmd, nodes = self.batch(2)
+        rh = BatchResourceHandler(servers={'srv-0': 'running', 'srv-1': 'starting_x'},
+                                  list_status=503)
+        for i, node in enumerate(nodes):
+            node.srv_id = 'srv-{0}'.format(i)
+            node.waiting_since = time.time() - 20
+        done, pending = cmd._stage_await_running(rh, nodes)
+        eq_((done, pending), ([nodes[0]], []))
+        ok_('after 10 seconds' in nodes[1].error)
+    def test_create(self):
+        cmd, nodes = self.batch(2)
+        rh = BatchResourceHandler()
+        eq_(cmd._stage_create(rh, self.drive_nodes(nodes)), (nodes, []))
+        eq_([node.srv_id for node in nodes], ['srv-0', 'srv-1'])
+    def test_create_count_mismatch(self):
+        cmd, nodes = self.batch(2)
+        rh = BatchResourceHandler(created=1)
+        eq_(cmd._stage_create(rh, self.drive_nodes(nodes)), ([], []))
+        ok_(cmd.failed.is_set())
+        eq_(rh.deleted, ['srv-0'])
+        eq_([node.srv_id for node in nodes], [None, None])
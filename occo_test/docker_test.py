@@ -0,0 +1,224 @@
+### Copyright 2014, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+#!/dev/null
+
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+import docker.errors
+import requests
+import occo.plugins.resourcehandler.docker as dockerrh
+from nose.tools import ok_, eq_
+from occo.plugins.resourcehandler.docker import ImageCache, CreateNode, \
+    DockerSchemaChecker, ContainerSweeper, TarballCache, LABEL_MANAGED
+from occo.exceptions import SchemaError
+
+REF = 'ubuntu:20.04'
+
+class FakeClient(object):
+    """ Images present on a fake Docker host, with their repo digests. """
+    def __init__(self, images=None):
+        self.images = dict(images or dict())
+        self.inspects = 0
+    def inspect_image(self, ref):
+        self.inspects += 1
+        if ref not in self.images:
+            raise docker.errors.NotFound('No such image: ' + ref)
+        return dict(RepoDigests=self.images[ref])
+
+class Loader(object):
+    """ Loads ``REF`` onto a :class:`FakeClient`, counting the loads. """
+    def __init__(self, cli, digest='sha256:new', delay=0, error=None):
+        self.cli = cli
+        self.digest = digest
+        self.delay = delay
+        self.error = error
+        self.loads = 0
+    def __call__(self):
+        self.loads += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.cli.images[REF] = ['ubuntu@' + self.digest]
+
+class ImageCacheTest(unittest.TestCase):
+    def test_present_on_host(self):
+        cli = FakeClient({REF: ['ubuntu@sha256:old']})
+        load = Loader(cli)
+        eq_(ImageCache().ensure(cli, REF, load), False)
+        eq_(load.loads, 0)
+    def test_loaded_once(self):
+        cli, cache = FakeClient(), ImageCache()
+        load = Loader(cli)
+        eq_(cache.ensure(cli, REF, load), True)
+        eq_(cache.ensure(cli, REF, load), False)
+        eq_(load.loads, 1)
+        eq_(cli.inspects, 2)
+    def test_single_flight(self):
+        cli, cache = FakeClient(), ImageCache()
+        load = Loader(cli, delay=0.1)
+        results = list()
+        threads = [threading.Thread(
+                       target=lambda: results.append(cache.ensure(cli, REF, load)))
+                   for i in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        eq_(load.loads, 1)
+        eq_(sorted(results), [False] * 4 + [True])
+    def test_failed_load(self):
+        cli, cache = FakeClient(), ImageCache()
+        self.assertRaises(ValueError, cache.ensure, cli, REF,
+                          Loader(cli, error=ValueError('pull failed')))
+        load = Loader(cli)
+        eq_(cache.ensure(cli, REF, load), True)
+        eq_(load.loads, 1)
+    def test_image_not_loaded(self):
+        cli, cache = FakeClient(), ImageCache()
+        self.assertRaises(Exception, cache.ensure, cli, REF, lambda: None)
+    def test_pinned_digest(self):
+        cli, cache = FakeClient({REF: ['ubuntu@sha256:old']}), ImageCache()
+        load = Loader(cli, digest='sha256:new')
+        eq_(cache.ensure(cli, REF, load, 'sha256:new'), True)
+        eq_(cache.ensure(cli, REF, load, 'sha256:new'), False)
+        eq_(load.loads, 1)
+    def test_forget(self):
+        cli, cache = FakeClient(), ImageCache()
+        load = Loader(cli)
+        cache.ensure(cli, REF, load)
+        del cli.images[REF]
+        cache.forget(REF)
+        eq_(cache.ensure(cli, REF, load), True)
+        eq_(load.loads, 2)
+
+def resource(**kwargs):
+    res = dict(type='docker', endpoint='unix://var/run/docker.sock',
+               origin='dockerhub', image='ubuntu', tag='20.04')
+    res.update(kwargs)
+    return res
+
+class ImageDigestTest(unittest.TestCase):
+    def node_def(self, **kwargs):
+        return dict(resource=resource(**kwargs),
+                    attributes=dict(command='sleep', env=['A=1']))
+    def test_dockerhub(self):
+        eq_(CreateNode(self.node_def(image_digest='sha256:new')).digest,
+            'sha256:new')
+    def test_tarball_ignores_digest(self):
+        eq_(CreateNode(self.node_def(origin='http://example.com/ubuntu.tar',
+                                     image_digest='sha256:new')).digest, None)
+    def test_schema(self):
+        ok_(DockerSchemaChecker().perform_check(resource(image_digest='sha256:new')))
+        self.assertRaises(SchemaError, DockerSchemaChecker().perform_check,
+                          resource(origin='http://example.com/ubuntu.tar',
+                                   image_digest='sha256:new'))
+
+class ListingClient(object):
+    def __init__(self, ids):
+        self.ids = ids
+        self.listings = list()
+    def containers(self, all, filters):
+        self.listings.append(filters)
+        return [dict(Id=container_id, State='running') for container_id in self.ids]
+
+class ContainerSweeperTest(unittest.TestCase):
+    def test_sweep(self):
+        cli, sweeper = ListingClient(['c1', 'c2']), ContainerSweeper()
+        eq_(sweeper.get(cli, 'c1', 60)['State'], 'running')
+        eq_(sweeper.get(cli, 'c3', 60), None)
+        eq_(cli.listings, [{'label': LABEL_MANAGED}])
+    def test_resweep(self):
+        cli, sweeper = ListingClient(['c1']), ContainerSweeper()
+        sweeper.get(cli, 'c1', 0)
+        time.sleep(0.01)
+        sweeper.get(cli, 'c1', 0)
+        eq_(len(cli.listings), 2)
+    def test_forget(self):
+        cli, sweeper = ListingClient(['c1', 'c2']), ContainerSweeper()
+        sweeper.get(cli, 'c1', 60)
+        sweeper.forget('c1')
+        eq_(sweeper.get(cli, 'c1', 60), None)
+        ok_(sweeper.get(cli, 'c2', 60) is not None)
+        eq_(len(cli.listings), 1)
+
+class Response(object):
+    def __init__(self, status_code, headers=None, body=b''):
+        self.status_code = status_code
+        self.headers = headers or dict()
+        self.body = body
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(str(self.status_code))
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+class FakeRequests(object):
+    """ Serves one tarball; ``head_status`` is returned for HEAD requests. """
+    exceptions = requests.exceptions
+    def __init__(self, head_status=200, etag='"v1"'):
+        self.head_status = head_status
+        self.etag = etag
+        self.gets = 0
+    def head(self, url, allow_redirects, timeout):
+        return Response(self.head_status, dict(ETag=self.etag))
+    def get(self, url, stream, timeout):
+        self.gets += 1
+        return Response(200, body=b'tarball ' + self.etag.encode('utf-8'))
+
+class TarballCacheTest(unittest.TestCase):
+    URL = 'http://example.com/ubuntu.tar'
+    def setUp(self):
+        self.requests = dockerrh.requests
+        self.directory = os.path.join(tempfile.mkdtemp(), 'cache')
+    def tearDown(self):
+        dockerrh.requests = self.requests
+        shutil.rmtree(os.path.dirname(self.directory))
+    def fetch(self, cache):
+        with cache.fetch(self.URL) as path:
+            with open(path, 'rb') as f:
+                return path, f.read()
+    def test_cached(self):
+        fake = dockerrh.requests = FakeRequests()
+        cache = TarballCache(self.directory, 1024)
+        path, data = self.fetch(cache)
+        eq_(data, b'tarball "v1"')
+        eq_(self.fetch(cache), (path, data))
+        eq_(fake.gets, 1)
+        eq_(os.stat(self.directory).st_mode & 0o777, 0o700)
+    def test_changed(self):
+        fake = dockerrh.requests = FakeRequests()
+        cache = TarballCache(self.directory, 1024)
+        self.fetch(cache)
+        fake.etag = '"v2"'
+        eq_(self.fetch(cache)[1], b'tarball "v2"')
+        eq_(fake.gets, 2)
+    def test_head_rejected(self):
+        fake = dockerrh.requests = FakeRequests(head_status=405)
+        cache = TarballCache(self.directory, 1024)
+        path, data = self.fetch(cache)
+        eq_(data, b'tarball "v1"')
+        ok_(not os.path.exists(path))
+        self.fetch(cache)
+        eq_(fake.gets, 2)
+        eq_(os.listdir(self.directory), [])
+    def test_shared_directory(self):
+        dockerrh.requests = FakeRequests()
+        os.makedirs(self.directory)
+        os.chmod(self.directory, 0o777)
+        self.assertRaises(Exception, self.fetch, TarballCache(self.directory, 1024))
@@ -0,0 +1,409 @@
+### Copyright 2014, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+
+""" Local fake Keystone v3 and Nova compute API.
+
+Implements the subset of the OpenStack APIs used by the nova resource handler
+plugin, with configurable latency and floating IP contention, and counts the
+API calls it serves.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+__all__ = ['FakeOpenStack']
+
+PROJECT_ID = 'fakeproject'
+COMPUTE_PREFIX = '/compute/v2.1'
+SERVICES = [('compute', 'nova', COMPUTE_PREFIX),
+            ('image', 'glance', '/image'),
+            ('network', 'neutron', '/network')]
+
+FLAVORS = [dict(id='1', name='m1.tiny', ram=512, vcpus=1, disk=1),
+           dict(id='2', name='m1.small', ram=2048, vcpus=1, disk=20),
+           dict(id='3', name='m1.medium', ram=4096, vcpus=2, disk=40)]
+IMAGES = [dict(id='9f6a1c3e-0000-4000-8000-000000000001', name='ubuntu-20.04'),
+          dict(id='9f6a1c3e-0000-4000-8000-000000000002', name='centos-8')]
+NETWORKS = [dict(id='4e8e5957-0000-4000-8000-000000000001', name='private')]
+
+# Routes are matched in order; the name of the route is what the call
+# counters are keyed by.
+ROUTES = [
+    ('POST', r'/v3/auth/tokens', 'keystone.tokens'),
+    ('GET', r'/compute/?', 'nova.versions'),
+    ('GET', r'/compute/v2\.1/?', 'nova.version'),
+    ('POST', r'/compute/v2\.1/servers', 'servers.create'),
+    ('GET', r'/compute/v2\.1/servers(/detail)?', 'servers.list'),
+    ('GET', r'/compute/v2\.1/servers/(?P<id>[^/]+)', 'servers.get'),
+    ('PUT', r'/compute/v2\.1/servers/(?P<id>[^/]+)', 'servers.update'),
+    ('DELETE', r'/compute/v2\.1/servers/(?P<id>[^/]+)', 'servers.delete'),
+    ('GET', r'/compute/v2\.1/servers/(?P<id>[^/]+)/ips', 'servers.ips'),
+    ('POST', r'/compute/v2\.1/servers/(?P<id>[^/]+)/action', 'servers.action'),
+    ('GET', r'/compute/v2\.1/os-floating-ips', 'floating_ips.list'),
+    ('POST', r'/compute/v2\.1/os-floating-ips', 'floating_ips.create'),
+    ('GET', r'/compute/v2\.1/os-floating-ips/(?P<id>[^/]+)', 'floating_ips.get'),
+    ('GET', r'/compute/v2\.1/flavors(/detail)?', 'flavors.list'),
+    ('GET', r'/compute/v2\.1/flavors/(?P<id>[^/]+)', 'flavors.get'),
+    ('GET', r'/image/v2/images', 'images.list'),
+    ('GET', r'/image/v2/images/(?P<id>[^/]+)', 'images.get'),
+    ('GET', r'/network/v2\.0/networks', 'networks.list'),
+]
+ROUTES = [(method, re.compile(pattern + '$'), name)
+          for method, pattern, name in ROUTES]
+
+class HTTPError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+        self.message = message
+
+def isotime(t):
+    return datetime.utcfromtimestamp(t).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+class FakeOpenStack(object):
+    """
+    In-process fake OpenStack cloud.
+
+    :param float latency: Seconds added to every API call.
+    :param float jitter: Upper bound of a random delay added to ``latency``.
+    :param float build_time: Seconds a server spends in ``BUILD`` state.
+    :param int floating_ips: Number of free floating IPs in pool ``public``.
+    :param int pool_capacity: Number of floating IPs that can be allocated
+        from pool ``public`` in total (including the initial ones).
+    :param float contention: Probability that a free floating IP turns out
+        to be taken by someone else when it is read.
+    :param float token_lifetime: Seconds the issued Keystone tokens are
+        valid for.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, build_time=0.5,
+                 floating_ips=10, pool_capacity=None, contention=0.0,
+                 token_lifetime=3600, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.build_time = build_time
+        self.pool_capacity = pool_capacity \
+            if pool_capacity is not None else floating_ips
+        self.contention = contention
+        self.token_lifetime = token_lifetime
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.servers = dict()
+        self.server_order = list()
+        self.floating_ips = dict()
+        self.next_fixed = 1
+        for i in range(floating_ips):
+            self._new_floating_ip()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    @property
+    def auth_url(self):
+        return self.url + '/v3'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       name='fake-openstack')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def call_counts(self):
+        with self.lock:
+            return Counter(self.calls)
+
+    def _handler_class(self):
+        cloud = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def log_message(self, *args):
+                pass
+            def _dispatch(self):
+                cloud._serve(self)
+            do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+        return Handler
+
+    def _serve(self, request):
+        url = urlparse(request.path)
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+        headers = dict()
+        for method, pattern, name in ROUTES:
+            match = pattern.match(url.path)
+            if method == request.command and match:
+                break
+        else:
+            name, match = None, None
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        try:
+            if name is None:
+                raise HTTPError(404, 'No route for {0} {1}'.format(
+                    request.command, url.path))
+            with self.lock:
+                self.calls[name] += 1
+            data = json.loads(body.decode('utf-8')) if body else dict()
+            query = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+            handler = getattr(self, 'do_' + name.replace('.', '_'))
+            code, response = handler(data, query, headers, **match.groupdict())
+        except HTTPError as ex:
+            code, response = ex.code, dict(error=dict(code=ex.code,
+                                                      message=ex.message))
+        payload = json.dumps(response).encode('utf-8') \
+            if response is not None else b''
+        request.send_response(code)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(payload)))
+        for k, v in headers.items():
+            request.send_header(k, v)
+        request.end_headers()
+        request.wfile.write(payload)
+
+    ### Keystone
+
+    def do_keystone_tokens(self, data, query, headers):
+        methods = data.get('auth', dict()).get('identity', dict()).get('methods', [])
+        now = time.time()
+        headers['X-Subject-Token'] = uuid.uuid4().hex
+        return 201, dict(token=dict(
+            methods=methods,
+            issued_at=isotime(now),
+            expires_at=isotime(now + self.token_lifetime),
+            user=dict(id='fakeuser', name='fakeuser',
+                      domain=dict(id='default', name='Default')),
+            project=dict(id=PROJECT_ID, name=PROJECT_ID,
+                         domain=dict(id='default', name='Default')),
+            roles=[dict(id='member', name='member')],
+            catalog=[dict(
+                type=service_type, name=name, id=service_type,
+                endpoints=[dict(id=service_type + '-' + interface,
+                                interface=interface,
+                                region='RegionOne', region_id='RegionOne',
+                                url=self.url + prefix)
+                           for interface in ('public', 'internal', 'admin')])
+                for service_type, name, prefix in SERVICES]))
+
+    ### Nova
+
+    def _version(self):
+        return dict(id='v2.1', status='CURRENT', version='2.1',
+                    min_version='2.1', updated='2013-07-23T11:33:21Z',
+                    links=[dict(rel='self', href=self.url + COMPUTE_PREFIX + '/')])
+
+    def do_nova_versions(self, data, query, headers):
+        return 200, dict(versions=[self._version()])
+
+    def do_nova_version(self, data, query, headers):
+        return 200, dict(version=self._version())
+
+    def _new_floating_ip(self):
+        flip_id = str(uuid.uuid4())
+        n = len(self.floating_ips) + 1
+        self.floating_ips[flip_id] = dict(
+            id=flip_id, ip='192.0.2.{0}'.format(n) if n < 255 else
+            '198.51.100.{0}'.format(n - 254),
+            pool='public', instance_id=None, fixed_ip=None)
+        return self.floating_ips[flip_id]
+
+    def _get_server(self, server_id):
+        try:
+            return self.servers[server_id]
+        except KeyError:
+            raise HTTPError(404, 'Instance {0} could not be found.'.format(server_id))
+
+    def _server_json(self, srv):
+        ready = time.time() - srv['created'] >= self.build_time
+        addresses = dict()
+        if ready:
+            addresses['private'] = [{
+                'addr': srv['fixed_ip'], 'version': 4,
+                'OS-EXT-IPS:type': 'fixed'}] + [{
+                'addr': flip['ip'], 'version': 4,
+                'OS-EXT-IPS:type': 'floating'}
+                for flip in self.floating_ips.values()
+                if flip['instance_id'] == srv['id']]
+        return dict(id=srv['id'], name=srv['name'],
+                    status='ACTIVE' if ready else 'BUILD',
+                    addresses=addresses,
+                    image=dict(id=srv['image']), flavor=dict(id=srv['flavor']),
+                    key_name=srv['key_name'], metadata=dict(srv['metadata']),
+                    tenant_id=PROJECT_ID, user_id='fakeuser',
+                    created=isotime(srv['created']),
+                    updated=isotime(srv['created']), links=[])
+
+    def do_servers_create(self, data, query, headers):
+        spec = data['server']
+        count = int(spec.get('max_count', spec.get('min_count', 1)) or 1)
+        flavors = dict((f['id'], f) for f in FLAVORS)
+        images = dict((i['id'], i) for i in IMAGES)
+        if spec.get('flavorRef') not in flavors:
+            raise HTTPError(400, 'Flavor {0} could not be found.'.format(spec.get('flavorRef')))
+        if spec.get('imageRef') not in images:
+            raise HTTPError(400, 'Image {0} could not be found.'.format(spec.get('imageRef')))
+        reservation_id = 'r-' + uuid.uuid4().hex[:8]
+        created = list()
+        with self.lock:
+            for i in range(count):
+                srv_id = str(uuid.uuid4())
+                name = spec['name'] if count == 1 \
+                    else '{0}-{1}'.format(spec['name'], i + 1)
+                self.servers[srv_id] = dict(
+                    id=srv_id, name=name, created=time.time(),
+                    image=spec['imageRef'], flavor=spec['flavorRef'],
+                    key_name=spec.get('key_name'),
+                    metadata=dict(spec.get('metadata') or dict()),
+                    reservation_id=reservation_id,
+                    fixed_ip='10.0.{0}.{1}'.format(self.next_fixed // 250,
+                                                   self.next_fixed % 250 + 2))
+                self.next_fixed += 1
+                self.server_order.append(srv_id)
+                created.append(srv_id)
+        if spec.get('return_reservation_id'):
+            return 202, dict(reservation_id=reservation_id)
+        return 202, dict(server=dict(id=created[0], links=[],
+                                     adminPass='fakepassword'))
+
+    def do_servers_list(self, data, query, headers):
+        with self.lock:
+            servers = [self.servers[i] for i in self.server_order
+                       if i in self.servers]
+            if 'name' in query:
+                servers = [s for s in servers
+                           if re.search(query['name'], s['name'])]
+            if 'reservation_id' in query:
+                servers = [s for s in servers
+                           if s['reservation_id'] == query['reservation_id']]
+            if 'marker' in query:
+                ids = [s['id'] for s in servers]
+                if query['marker'] not in ids:
+                    raise HTTPError(400, 'marker [{0}] not found'.format(query['marker']))
+                servers = servers[ids.index(query['marker']) + 1:]
+            if 'limit' in query:
+                servers = servers[:int(query['limit'])]
+            return 200, dict(servers=[self._server_json(s) for s in servers])
+
+    def do_servers_get(self, data, query, headers, id):
+        with self.lock:
+            return 200, dict(server=self._server_json(self._get_server(id)))
+
+    def do_servers_update(self, data, query, headers, id):
+        with self.lock:
+            srv = self._get_server(id)
+            srv['name'] = data.get('server', dict()).get('name', srv['name'])
+            return 200, dict(server=self._server_json(srv))
+
+    def do_servers_delete(self, data, query, headers, id):
+        with self.lock:
+            self._get_server(id)
+            del self.servers[id]
+            for flip in self.floating_ips.values():
+                if flip['instance_id'] == id:
+                    flip['instance_id'] = flip['fixed_ip'] = None
+        return 204, None
+
+    def do_servers_ips(self, data, query, headers, id):
+        with self.lock:
+            srv = self._server_json(self._get_server(id))
+        return 200, dict(addresses=srv['addresses'])
+
+    def do_servers_action(self, data, query, headers, id):
+        if 'addFloatingIp' not in data:
+            raise HTTPError(400, 'Unsupported action {0!r}'.format(list(data)))
+        address = data['addFloatingIp']['address']
+        with self.lock:
+            self.calls['servers.action.addFloatingIp'] += 1
+            srv = self._get_server(id)
+            flips = [f for f in self.floating_ips.values() if f['ip'] == address]
+            if not flips:
+                raise HTTPError(404, 'Floating IP {0} not found'.format(address))
+            flip = flips[0]
+            if flip['instance_id'] not in (None, id):
+                # Like Nova, move the address instead of refusing
+                self.calls['servers.action.addFloatingIp.stolen'] += 1
+            flip['instance_id'] = id
+            flip['fixed_ip'] = srv['fixed_ip']
+        return 202, None
+
+    def do_floating_ips_list(self, data, query, headers):
+        with self.lock:
+            return 200, dict(floating_ips=[dict(f) for f in self.floating_ips.values()])
+
+    def do_floating_ips_get(self, data, query, headers, id):
+        with self.lock:
+            if id not in self.floating_ips:
+                raise HTTPError(404, 'Floating IP {0} not found'.format(id))
+            flip = self.floating_ips[id]
+            if flip['instance_id'] is None and random.random() < self.contention:
+                self.calls['floating_ips.get.taken'] += 1
+                flip['instance_id'] = 'foreign-' + uuid.uuid4().hex[:8]
+            return 200, dict(floating_ip=dict(flip))
+
+    def do_floating_ips_create(self, data, query, headers):
+        with self.lock:
+            if len(self.floating_ips) >= self.pool_capacity:
+                raise HTTPError(404, 'No more floating IPs in pool public.')
+            return 200, dict(floating_ip=dict(self._new_floating_ip()))
+
+    def do_flavors_list(self, data, query, headers):
+        return 200, dict(flavors=[dict(f, links=[]) for f in FLAVORS])
+
+    def do_flavors_get(self, data, query, headers, id):
+        for f in FLAVORS:
+            if f['id'] == id:
+                return 200, dict(flavor=dict(f, links=[]))
+        raise HTTPError(404, 'Flavor {0} could not be found.'.format(id))
+
+    ### Glance and Neutron
+
+    def do_images_list(self, data, query, headers):
+        return 200, dict(images=[dict(i, status='active') for i in IMAGES
+                                 if query.get('name', i['name']) == i['name']])
+
+    def do_images_get(self, data, query, headers, id):
+        for i in IMAGES:
+            if i['id'] == id:
+                return 200, dict(i, status='active')
+        raise HTTPError(404, 'Image {0} could not be found.'.format(id))
+
+    def do_networks_list(self, data, query, headers):
+        return 200, dict(networks=[dict(n) for n in NETWORKS
+                                   if query.get('name', n['name']) == n['name']])
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run a fake OpenStack cloud')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--contention', type=float, default=0.0)
+    args = parser.parse_args()
+    cloud = FakeOpenStack(latency=args.latency, contention=args.contention,
+                          port=args.port)
+    print('Keystone v3 auth_url: {0}'.format(cloud.auth_url))
+    cloud.httpd.serve_forever()
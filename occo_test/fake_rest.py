@@ -0,0 +1,405 @@
+### Copyright 2014, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+
+""" Local fake CloudSigma and CloudBroker REST APIs.
+
+Implement the subsets of the CloudSigma JSON API and the CloudBroker XML API
+used by the cloudsigma and cloudbroker resource handler plugins, with
+configurable latency and injected errors, and count the API calls they
+serve.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+__all__ = ['FakeCloudSigma', 'FakeCloudBroker']
+
+class HTTPError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+        self.message = message
+
+class FakeRestServer(object):
+    """
+    Base of the in-process fake REST services.
+
+    Subclasses list their ``ROUTES`` as ``(method, regex, name)``; a call
+    of route ``name`` is served by method ``do_<name>`` (dots replaced by
+    underscores), which returns the HTTP status code and a JSON-able object,
+    an XML string or ``None``.
+
+    :param float latency: Seconds added to every API call.
+    :param float jitter: Upper bound of a random delay added to ``latency``.
+    :param float error_rate: Probability that a call fails with ``503``
+        before reaching its handler. Injected errors are counted as
+        ``<name>.error``.
+    """
+    ROUTES = []
+    thread_name = 'fake-rest'
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0,
+                 host='127.0.0.1', port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.routes = [(method, re.compile(pattern + '$'), name)
+                       for method, pattern, name in self.ROUTES]
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       name=self.thread_name)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def call_counts(self):
+        with self.lock:
+            return Counter(self.calls)
+
+    def _handler_class(self):
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def log_message(self, *args):
+                pass
+            def _dispatch(self):
+                server._serve(self)
+            do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+        return Handler
+
+    def _error(self, code, message):
+        return dict(error=dict(code=code, message=message))
+
+    def _serve(self, request):
+        url = urlparse(request.path)
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+        for method, pattern, name in self.routes:
+            match = pattern.match(url.path)
+            if method == request.command and match:
+                break
+        else:
+            name, match = None, None
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        try:
+            if name is None:
+                raise HTTPError(404, 'No route for {0} {1}'.format(
+                    request.command, url.path))
+            with self.lock:
+                self.calls[name] += 1
+                if random.random() < self.error_rate:
+                    self.calls[name + '.error'] += 1
+                    raise HTTPError(503, 'Service temporarily unavailable')
+            query = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+            handler = getattr(self, 'do_' + name.replace('.', '_'))
+            code, response = handler(body, query, **match.groupdict())
+        except HTTPError as ex:
+            code, response = ex.code, self._error(ex.code, ex.message)
+        if response is None:
+            payload, content_type = b'', 'text/plain'
+        elif isinstance(response, str):
+            payload, content_type = response.encode('utf-8'), 'application/xml'
+        else:
+            payload = json.dumps(response).encode('utf-8')
+            content_type = 'application/json'
+        request.send_response(code)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+def page(objects, query, default_limit=20):
+    limit = int(query.get('limit', default_limit))
+    offset = int(query.get('offset', 0))
+    return dict(meta=dict(limit=limit, offset=offset, total_count=len(objects)),
+                objects=objects[offset:offset + limit] if limit else objects[offset:])
+
+class FakeCloudSigma(FakeRestServer):
+    """
+    In-process fake CloudSigma API 2.0; its endpoint is :attr:`endpoint`.
+
+    :param float clone_time: Seconds a cloned drive spends in
+        ``cloning_dst`` state before becoming ``unmounted``.
+    :param float boot_time: Seconds a server spends ``starting``.
+    :param float stop_time: Seconds a server spends ``stopping``.
+
+    See :class:`FakeRestServer` for the other parameters.
+    """
+    PREFIX = '/api/2.0'
+    ROUTES = [
+        ('POST', PREFIX + r'/libdrives/(?P<id>[^/]+)/action/', 'libdrives.action'),
+        ('GET', PREFIX + r'/drives/detail/', 'drives.list'),
+        ('GET', PREFIX + r'/drives/(?P<id>[^/]+)/', 'drives.get'),
+        ('DELETE', PREFIX + r'/drives/(?P<id>[^/]+)/', 'drives.delete'),
+        ('POST', PREFIX + r'/servers/', 'servers.create'),
+        ('GET', PREFIX + r'/servers/detail/', 'servers.list'),
+        ('GET', PREFIX + r'/servers/(?P<id>[^/]+)/', 'servers.get'),
+        ('DELETE', PREFIX + r'/servers/(?P<id>[^/]+)/', 'servers.delete'),
+        ('POST', PREFIX + r'/servers/(?P<id>[^/]+)/action/', 'servers.action'),
+    ]
+    thread_name = 'fake-cloudsigma'
+
+    def __init__(self, clone_time=0.5, boot_time=0.5, stop_time=0.2, **kwargs):
+        FakeRestServer.__init__(self, **kwargs)
+        self.clone_time = clone_time
+        self.boot_time = boot_time
+        self.stop_time = stop_time
+        self.drives = dict()
+        self.servers = dict()
+        self.next_ip = 1
+
+    @property
+    def endpoint(self):
+        return self.url + self.PREFIX
+
+    def _update(self, obj):
+        if obj.get('target') and time.time() >= obj['transition_at']:
+            obj['status'], obj['target'] = obj['target'], None
+        return obj
+
+    def _transition(self, obj, current, target, duration):
+        obj['status'], obj['target'] = current, target
+        obj['transition_at'] = time.time() + duration
+
+    def _get(self, objects, kind, obj_id):
+        try:
+            return self._update(objects[obj_id])
+        except KeyError:
+            raise HTTPError(404, '{0} {1} does not exist'.format(kind, obj_id))
+
+    def _drive_json(self, drv):
+        return dict((k, drv[k]) for k in ('uuid', 'name', 'size', 'status'))
+
+    def _server_json(self, srv):
+        runtime = dict(nics=[dict(ip_v4=dict(uuid=srv['ip']))]) \
+            if srv['status'] == 'running' else None
+        return dict(uuid=srv['uuid'], name=srv['name'],
+                    cpu=srv['cpu'], mem=srv['mem'], status=srv['status'],
+                    drives=srv['drives'], meta=srv['meta'], runtime=runtime)
+
+    def do_libdrives_action(self, body, query, id):
+        if query.get('do') != 'clone':
+            raise HTTPError(400, 'Unsupported action {0!r}'.format(query.get('do')))
+        drv_id = str(uuid.uuid4())
+        drv = dict(uuid=drv_id, name='clone of ' + id, size=10 * 1024 ** 3)
+        self._transition(drv, 'cloning_dst', 'unmounted', self.clone_time)
+        with self.lock:
+            self.drives[drv_id] = drv
+        return 202, dict(objects=[self._drive_json(drv)])
+
+    def do_drives_list(self, body, query):
+        with self.lock:
+            return 200, page([self._drive_json(self._update(d))
+                              for d in self.drives.values()], query)
+
+    def do_drives_get(self, body, query, id):
+        with self.lock:
+            return 200, self._drive_json(self._get(self.drives, 'Drive', id))
+
+    def do_drives_delete(self, body, query, id):
+        with self.lock:
+            self._get(self.drives, 'Drive', id)
+            del self.drives[id]
+        return 204, None
+
+    def do_servers_create(self, body, query):
+        created = list()
+        with self.lock:
+            for descr in json.loads(body.decode('utf-8'))['objects']:
+                for nd in descr.get('drives', []):
+                    self._get(self.drives, 'Drive', nd['drive'])
+                srv_id = str(uuid.uuid4())
+                self.servers[srv_id] = dict(
+                    uuid=srv_id, name=descr.get('name'), cpu=descr.get('cpu'),
+                    mem=descr.get('mem'), drives=descr.get('drives', []),
+                    meta=descr.get('meta', dict()), status='stopped',
+                    target=None, ip='198.51.100.{0}'.format(self.next_ip % 250 + 1))
+                self.next_ip += 1
+                created.append(self._server_json(self.servers[srv_id]))
+        return 201, dict(objects=created)
+
+    def do_servers_list(self, body, query):
+        with self.lock:
+            return 200, page([self._server_json(self._update(s))
+                              for s in self.servers.values()], query)
+
+    def do_servers_get(self, body, query, id):
+        with self.lock:
+            return 200, self._server_json(self._get(self.servers, 'Server', id))
+
+    def do_servers_delete(self, body, query, id):
+        with self.lock:
+            srv = self._get(self.servers, 'Server', id)
+            if srv['status'] != 'stopped':
+                raise HTTPError(403, 'Server {0} is {1}'.format(id, srv['status']))
+            del self.servers[id]
+            if query.get('recurse') == 'all_drives':
+                for nd in srv['drives']:
+                    self.drives.pop(nd['drive'], None)
+        return 204, None
+
+    def do_servers_action(self, body, query, id):
+        with self.lock:
+            srv = self._get(self.servers, 'Server', id)
+            action = query.get('do')
+            if action == 'start' and srv['status'] == 'stopped':
+                self._transition(srv, 'starting', 'running', self.boot_time)
+            elif action == 'stop' and srv['status'] == 'running':
+                self._transition(srv, 'stopping', 'stopped', self.stop_time)
+            else:
+                raise HTTPError(403, 'Cannot {0} server {1} in {2} state'.format(
+                    action, id, srv['status']))
+            return 202, dict(action=action, result='success', uuid=id)
+
+INSTANCE_FIELDS = ['id', 'name', 'status', 'deployment-id', 'instance-type-id',
+                   'internal-ip-address', 'external-ip-address',
+                   'internal-hostname', 'external-hostname', 'created-at',
+                   'updated-at', 'disable-autostop', 'isolated']
+
+class FakeCloudBroker(FakeRestServer):
+    """
+    In-process fake CloudBroker XML API; its endpoint is :attr:`url`.
+
+    :param float boot_time: Seconds an instance spends ``starting``.
+    :param float stop_time: Seconds an instance spends ``stopping``.
+
+    See :class:`FakeRestServer` for the other parameters.
+    """
+    ROUTES = [
+        ('POST', r'/instances\.xml', 'instances.create'),
+        ('GET', r'/instances\.xml', 'instances.list'),
+        ('GET', r'/instances/(?P<id>[^/]+)\.xml', 'instances.get'),
+        ('PUT', r'/instances/(?P<id>[^/]+)/stop', 'instances.stop'),
+    ]
+    thread_name = 'fake-cloudbroker'
+
+    def __init__(self, boot_time=0.5, stop_time=0.2, **kwargs):
+        FakeRestServer.__init__(self, **kwargs)
+        self.boot_time = boot_time
+        self.stop_time = stop_time
+        self.instances = dict()
+        self.order = list()
+
+    def _error(self, code, message):
+        return '<errors><error>{0}</error></errors>'.format(escape(message))
+
+    def _update(self, inst):
+        if inst['status'] == 'starting' and time.time() >= inst['transition_at']:
+            n = inst['n']
+            inst.update({
+                'status': 'running',
+                'internal-ip-address': '10.1.{0}.{1}'.format(n // 250, n % 250 + 2),
+                'external-ip-address': '203.0.113.{0}'.format(n % 250 + 1),
+                'internal-hostname': 'ip-10-1-{0}-{1}.internal'.format(n // 250, n % 250 + 2),
+                'external-hostname': 'node-{0}.cloudbroker.example'.format(n)})
+        elif inst['status'] == 'stopping' and time.time() >= inst['transition_at']:
+            inst['status'] = 'halted'
+        return inst
+
+    def _get(self, inst_id):
+        try:
+            return self._update(self.instances[inst_id])
+        except KeyError:
+            raise HTTPError(404, 'Instance {0} not found'.format(inst_id))
+
+    def _instance_xml(self, inst):
+        return '<instance>{0}</instance>'.format(''.join(
+            '<{0}>{1}</{0}>'.format(field, escape(str(inst.get(field) or '')))
+            for field in INSTANCE_FIELDS))
+
+    def do_instances_create(self, body, query):
+        descr = ElementTree.fromstring(body.decode('utf-8'))
+        with self.lock:
+            n = len(self.instances) + 1
+            inst_id = str(uuid.uuid4())
+            now = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            self.instances[inst_id] = {
+                'id': inst_id, 'n': n, 'name': 'instance-{0}'.format(n),
+                'status': 'starting', 'transition_at': time.time() + self.boot_time,
+                'deployment-id': descr.findtext('deployment_id'),
+                'instance-type-id': descr.findtext('instance_type_id'),
+                'created-at': now, 'updated-at': now,
+                'disable-autostop': descr.findtext('disable_autostop'),
+                'isolated': descr.findtext('isolated')}
+            self.order.append(inst_id)
+            return 201, self._instance_xml(self.instances[inst_id])
+
+    def do_instances_list(self, body, query):
+        with self.lock:
+            instances = [self._update(self.instances[i]) for i in self.order]
+            if 'per_page' in query:
+                per_page = int(query['per_page'])
+                start = (int(query.get('page', 1)) - 1) * per_page
+                instances = instances[start:start + per_page]
+            return 200, '<?xml version="1.0" encoding="UTF-8"?>' \
+                '<instances type="array">{0}</instances>'.format(
+                    ''.join(self._instance_xml(i) for i in instances))
+
+    def do_instances_get(self, body, query, id):
+        with self.lock:
+            return 200, '<?xml version="1.0" encoding="UTF-8"?>' + \
+                self._instance_xml(self._get(id))
+
+    def do_instances_stop(self, body, query, id):
+        with self.lock:
+            inst = self._get(id)
+            if inst['status'] not in ('stopping', 'halted'):
+                inst['status'] = 'stopping'
+                inst['transition_at'] = time.time() + self.stop_time
+            return 200, self._instance_xml(inst)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run fake CloudSigma and CloudBroker APIs')
+    parser.add_argument('--cloudsigma-port', type=int, default=8081)
+    parser.add_argument('--cloudbroker-port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    cloudsigma = FakeCloudSigma(latency=args.latency, error_rate=args.error_rate,
+                                port=args.cloudsigma_port).start()
+    cloudbroker = FakeCloudBroker(latency=args.latency, error_rate=args.error_rate,
+                                  port=args.cloudbroker_port).start()
+    print('CloudSigma endpoint: {0}'.format(cloudsigma.endpoint))
+    print('CloudBroker endpoint: {0}'.format(cloudbroker.url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        cloudsigma.stop()
+        cloudbroker.stop()
@@ -0,0 +1,148 @@
+### Copyright 2014, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+
+""" Offline benchmark of the nova resource handler plugin.
+
+Runs parallel create, state, address and drop operations through
+:class:`~occo.resourcehandler.ResourceHandler` against a local
+:class:`~fake_openstack.FakeOpenStack`, and reports throughput, latency
+percentiles and the API calls made per operation.
+
+Example::
+
+    python occo_test/nova_bench.py --nodes 50 --workers 10 \\
+        --latency 0.02 --contention 0.2
+"""
+
+import argparse
+import logging
+import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import occo.infobroker as ib
+import occo.plugins.resourcehandler.nova
+from occo.resourcehandler import ResourceHandler
+from fake_openstack import FakeOpenStack, PROJECT_ID
+import bench_util
+from bench_util import AuthDataProvider
+
+log = logging.getLogger('occo_test.nova_bench')
+
+class Phase(bench_util.Phase):
+    def report(self):
+        bench_util.Phase.report(self)
+        if self.calls.get('servers.action.addFloatingIp'):
+            print('    floating ips found taken under contention: {0}'.format(
+                self.calls.get('floating_ips.get.taken', 0)))
+            print('    floating ips taken from other instances: {0}'.format(
+                self.calls.get('servers.action.addFloatingIp.stolen', 0)))
+
+def node_definition(cloud, infra_id, args):
+    resource = dict(type='nova', endpoint=cloud.auth_url, project_id=PROJECT_ID,
+                    image_id='ubuntu-20.04', flavor_name='m1.small',
+                    network_id='private', floating_ip=True)
+    if args.sweep:
+        resource['status_sweep_interval'] = args.sweep
+    return dict(name='bench', infra_id=infra_id, node_id=str(uuid.uuid4()),
+                context='#cloud-config\n', resource=resource)
+
+def instance_data(node_def, instance_id):
+    return dict(instance_id=instance_id, node_id=node_def['node_id'],
+                resource=node_def['resource'],
+                resolved_node_definition=node_def)
+
+def run(args):
+    cloud = FakeOpenStack(latency=args.latency, jitter=args.jitter,
+                          build_time=args.build_time,
+                          floating_ips=args.floating_ips,
+                          pool_capacity=args.pool_capacity,
+                          contention=args.contention).start()
+    ib.real_main_info_broker = ib.InfoRouter(sub_providers=[
+        AuthDataProvider(dict(username='bench', password='bench'))])
+    rh = ResourceHandler()
+    infra_id = str(uuid.uuid4())
+    node_defs = [node_definition(cloud, infra_id, args) for i in range(args.nodes)]
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    phases = list()
+    try:
+        with Phase('create', cloud) as phase:
+            if args.batch:
+                instance_ids = phase.timed(rh.create_nodes, node_defs) or list()
+            else:
+                instance_ids = list(executor.map(
+                    lambda nd: phase.timed(rh.create_node, nd), node_defs))
+        phases.append(phase)
+        nodes = [instance_data(nd, iid)
+                 for nd, iid in zip(node_defs, instance_ids) if iid]
+
+        with Phase('get_state', cloud) as phase:
+            for i in range(args.polls):
+                list(executor.map(lambda n: phase.timed(rh.get_state, n), nodes))
+        phases.append(phase)
+
+        with Phase('get_address', cloud) as phase:
+            list(executor.map(lambda n: phase.timed(rh.get_address, n), nodes))
+        phases.append(phase)
+
+        with Phase('get_ip_address', cloud) as phase:
+            list(executor.map(lambda n: phase.timed(rh.get_ip_address, n), nodes))
+        phases.append(phase)
+
+        with Phase('drop', cloud) as phase:
+            list(executor.map(lambda n: phase.timed(rh.drop_node, n), nodes))
+        phases.append(phase)
+    finally:
+        executor.shutdown()
+        cloud.stop()
+
+    print('nodes={0} workers={1} latency={2}s contention={3} batch={4} sweep={5}'.format(
+        args.nodes, args.workers, args.latency, args.contention,
+        args.batch, args.sweep))
+    for phase in phases:
+        phase.report()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the nova plugin against a local fake OpenStack')
+    parser.add_argument('--nodes', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=10)
+    parser.add_argument('--polls', type=int, default=5,
+                        help='state queries per node')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='seconds added to every API call')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--build-time', type=float, default=0.2)
+    parser.add_argument('--floating-ips', type=int, default=None,
+                        help='free floating IPs at start (default: nodes)')
+    parser.add_argument('--pool-capacity', type=int, default=None,
+                        help='floating IPs allocatable in total (default: 2*nodes)')
+    parser.add_argument('--contention', type=float, default=0.0,
+                        help='probability that a free floating IP is found '
+                        'taken by someone else')
+    parser.add_argument('--batch', action='store_true',
+                        help='create all nodes with one create_nodes call')
+    parser.add_argument('--sweep', type=float, default=None,
+                        help='enable status sweeps with this interval')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args()
+    if args.floating_ips is None:
+        args.floating_ips = args.nodes
+    if args.pool_capacity is None:
+        args.pool_capacity = 2 * args.nodes
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+    run(args)
@@ -0,0 +1,247 @@
+### Copyright 2014, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+#!/dev/null
+
+import unittest
+import re
+import copy
+import threading
+from nose.tools import ok_, eq_
+import occo.plugins.resourcehandler.nova as nova
+from occo.plugins.resourcehandler.nova import FloatingIpAllocator, \
+    NovaStatusSweeper, CancellationToken, CreateCancelled, tracked_token, \
+    cancel_all_creates, delete_servers_named
+from occo.exceptions import NodeCreationError
+
+class FloatingIp(object):
+    def __init__(self, n, pool='public', instance_id=None):
+        self.id = 'flip-{0}'.format(n)
+        self.ip = '192.0.2.{0}'.format(n)
+        self.pool = pool
+        self.instance_id = instance_id
+
+class FloatingIps(object):
+    """ The ``floating_ips`` manager of a fake Nova client. """
+    def __init__(self, ips, capacity=0):
+        self.lock = threading.Lock()
+        self.ips = dict((flip.id, flip) for flip in ips)
+        self.capacity = capacity
+        self.lists = 0
+        self.contended = set()
+        self.moved = list()
+    def list(self):
+        with self.lock:
+            self.lists += 1
+            return [copy.copy(flip) for flip in self.ips.values()]
+    def get(self, flip_id):
+        with self.lock:
+            flip = self.ips[flip_id]
+            if flip_id in self.contended:
+                # Someone else associated it since it was listed
+                self.contended.discard(flip_id)
+                flip.instance_id = 'someone-else'
+            return copy.copy(flip)
+    def create(self, pool=None):
+        with self.lock:
+            if not self.capacity:
+                raise Exception('Quota exceeded')
+            self.capacity -= 1
+            flip = FloatingIp(len(self.ips) + 1, pool)
+            self.ips[flip.id] = flip
+            return copy.copy(flip)
+    def associate(self, flip_id, server_id):
+        with self.lock:
+            flip = self.ips[flip_id]
+            if flip.instance_id is not None:
+                # Nova moves the address instead of refusing
+                self.moved.append(flip_id)
+            flip.instance_id = server_id
+
+class Server(object):
+    def __init__(self, conn, server_id):
+        self.conn = conn
+        self.id = server_id
+    def add_floating_ip(self, floating_ip):
+        self.conn.floating_ips.associate(floating_ip.id, self.id)
+
+class Connection(object):
+    def __init__(self, floating_ips):
+        self.floating_ips = floating_ips
+
+class ResourceHandler(object):
+    name = 'fake-nova'
+
+class FloatingIpAllocatorTest(unittest.TestCase):
+    def setUp(self):
+        self.retry_wait = nova.floating_ip_retry_wait
+        nova.floating_ip_retry_wait = 0
+        self.rh = ResourceHandler()
+    def tearDown(self):
+        nova.floating_ip_retry_wait = self.retry_wait
+    def conn(self, free, capacity=0, used=0):
+        ips = [FloatingIp(n) for n in range(1, free + 1)] + \
+              [FloatingIp(n, instance_id='vm-x') for n in range(free + 1, free + used + 1)]
+        return Connection(FloatingIps(ips, capacity))
+    def test_allocate(self):
+        conn = self.conn(free=1, used=2)
+        flip = FloatingIpAllocator().allocate(self.rh, conn, Server(conn, 'vm-1'))
+        eq_(flip.id, 'flip-1')
+        eq_(flip.instance_id, 'vm-1')
+    def test_parallel_allocations_differ(self):
+        conn = self.conn(free=10)
+        allocator = FloatingIpAllocator()
+        results = list()
+        threads = [threading.Thread(target=lambda i=i: results.append(
+                       allocator.allocate(self.rh, conn, Server(conn, 'vm-{0}'.format(i)))))
+                   for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        eq_(len(set(flip.id for flip in results)), 10)
+        eq_(conn.floating_ips.lists, 1)
+    def test_allocate_new_ip(self):
+        conn = self.conn(free=0, used=1, capacity=1)
+        flip = FloatingIpAllocator('public').allocate(self.rh, conn, Server(conn, 'vm-1'))
+        eq_(flip.instance_id, 'vm-1')
+        eq_(len(conn.floating_ips.ips), 2)
+    def test_contention(self):
+        conn = self.conn(free=2)
+        conn.floating_ips.contended = set(['flip-1', 'flip-2'])
+        conn.floating_ips.capacity = 1
+        flip = FloatingIpAllocator().allocate(self.rh, conn, Server(conn, 'vm-1'))
+        eq_(flip.id, 'flip-3')
+        eq_(flip.instance_id, 'vm-1')
+        eq_(conn.floating_ips.moved, [])
+    def test_stale_list(self):
+        conn = self.conn(free=2)
+        allocator = FloatingIpAllocator()
+        first = allocator.allocate(self.rh, conn, Server(conn, 'vm-1'))
+        # Associated by someone else after it has been listed
+        other = 'flip-2' if first.id == 'flip-1' else 'flip-1'
+        conn.floating_ips.ips[other].instance_id = 'someone-else'
+        conn.floating_ips.capacity = 1
+        flip = allocator.allocate(self.rh, conn, Server(conn, 'vm-2'))
+        eq_(flip.id, 'flip-3')
+        eq_(conn.floating_ips.ips[other].instance_id, 'someone-else')
+        eq_(conn.floating_ips.moved, [])
+    def test_pool(self):
+        conn = self.conn(free=0)
+        flip = FloatingIp(9, pool='other')
+        conn.floating_ips.ips[flip.id] = flip
+        self.assertRaises(NodeCreationError,
+                          FloatingIpAllocator('public').allocate,
+                          self.rh, conn, Server(conn, 'vm-1'))
+    def test_no_free_ip(self):
+        conn = self.conn(free=0, used=3)
+        self.assertRaises(NodeCreationError, FloatingIpAllocator().allocate,
+                          self.rh, conn, Server(conn, 'vm-1'))
+
+class ListedServer(object):
+    def __init__(self, server_id, status='ACTIVE', name=None, metadata=None):
+        self.id = server_id
+        self.status = status
+        self.name = name or server_id
+        self.metadata = metadata or dict()
+
+class Servers(object):
+    """ The ``servers`` manager of a fake Nova client, returning at most
+    ``max_limit`` servers per page like ``osapi_max_limit``. """
+    def __init__(self, count, max_limit):
+        self.servers = [ListedServer('vm-{0:03}'.format(i)) for i in range(count)]
+        self.max_limit = max_limit
+        self.lists = 0
+    def list(self, detailed, search_opts, marker, limit):
+        self.lists += 1
+        ids = [srv.id for srv in self.servers]
+        start = ids.index(marker) + 1 if marker is not None else 0
+        return self.servers[start:start + min(limit, self.max_limit)]
+
+class ServerConnection(object):
+    def __init__(self, servers):
+        self.servers = servers
+
+class NovaStatusSweeperTest(unittest.TestCase):
+    def test_short_pages(self):
+        conn = ServerConnection(Servers(25, max_limit=10))
+        sweeper = NovaStatusSweeper()
+        eq_(sweeper.get(conn, 'vm-024', 60).id, 'vm-024')
+        eq_(len(sweeper.servers), 25)
+        eq_(conn.servers.lists, 4)
+    def test_empty(self):
+        conn = ServerConnection(Servers(0, max_limit=10))
+        eq_(NovaStatusSweeper().get(conn, 'vm-000', 60), None)
+        eq_(conn.servers.lists, 1)
+    def test_snapshot_reused(self):
+        conn = ServerConnection(Servers(5, max_limit=10))
+        sweeper = NovaStatusSweeper()
+        sweeper.get(conn, 'vm-000', 60)
+        sweeper.get(conn, 'vm-001', 60)
+        eq_(conn.servers.lists, 2)
+    def test_forget(self):
+        conn = ServerConnection(Servers(5, max_limit=10))
+        sweeper = NovaStatusSweeper()
+        sweeper.get(conn, 'vm-000', 60)
+        sweeper.forget('vm-000')
+        eq_(sweeper.get(conn, 'vm-000', 60), None)
+        eq_(sweeper.get(conn, 'vm-001', 60).id, 'vm-001')
+        eq_(conn.servers.lists, 2)
+
+class CancellationTest(unittest.TestCase):
+    def test_token(self):
+        token = CancellationToken()
+        token.raise_if_cancelled()
+        token.cancel()
+        ok_(token.cancelled)
+        self.assertRaises(KeyboardInterrupt, token.raise_if_cancelled)
+        self.assertRaises(CreateCancelled, token.raise_if_cancelled)
+    def test_cancel_all(self):
+        running, finished = CancellationToken(), CancellationToken()
+        with tracked_token(finished):
+            pass
+        with tracked_token(running):
+            cancel_all_creates()
+        ok_(running.cancelled)
+        ok_(not finished.cancelled)
+    def test_cancel_from_other_thread(self):
+        token = CancellationToken()
+        threading.Thread(target=token.cancel).start()
+        ok_(token.event.wait(1))
+
+class NamedServers(object):
+    def __init__(self, servers):
+        self.servers = servers
+        self.deleted = list()
+    def list(self, search_opts):
+        return [srv for srv in self.servers
+                if re.match(search_opts['name'], srv.name)]
+    def delete(self, server_id):
+        self.deleted.append(server_id)
+
+class DeleteServersNamedTest(unittest.TestCase):
+    def servers(self):
+        return NamedServers([
+            ListedServer('vm-1', name='occopus-node', metadata=dict(occopus_node_id='n1')),
+            ListedServer('vm-2', name='occopus-node', metadata=dict(occopus_node_id='n2')),
+            ListedServer('vm-3', name='occopus-node'),
+            ListedServer('vm-4', name='occopus-node-2', metadata=dict(occopus_node_id='n1'))])
+    def test_metadata(self):
+        servers = self.servers()
+        delete_servers_named(ServerConnection(servers), '^occopus-node$',
+                             dict(occopus_node_id='n1'))
+        eq_(servers.deleted, ['vm-1'])
+    def test_name_only(self):
+        servers = self.servers()
+        delete_servers_named(ServerConnection(servers), '^occopus-node$')
+        eq_(servers.deleted, ['vm-1', 'vm-2', 'vm-3'])
@@ -0,0 +1,219 @@
+### Copyright 2014, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+#!/dev/null
+
+import unittest
+import time
+from nose.tools import ok_, eq_
+import occo.constants.status as status
+import occo.resourcehandler as resourcehandler
+from occo.resourcehandler import ResourceHandler, Command, CreateNodes, \
+    InstanceNotFound, NotFoundCache, MissingTracker, translates_not_found
+
+class Answer(Command):
+    def __init__(self, answer):
+        Command.__init__(self)
+        self.answer = answer
+    def perform(self, resource_handler):
+        resource_handler.calls += 1
+        if isinstance(self.answer, BaseException):
+            raise self.answer
+        return self.answer
+
+class FakeResourceHandler(ResourceHandler):
+    """ Answers every query with ``answer`` and counts the queries; a list
+    of answers is used up one by one. """
+    def __init__(self, answer):
+        self.name = 'fake'
+        self.answers = answer if isinstance(answer, list) else None
+        self.answer = answer
+        self.calls = 0
+        self.created = list()
+        self.dropped = list()
+        self.cancels = 0
+    def instantiate_rh(self, data):
+        return self
+    def next_answer(self):
+        if self.answers is not None:
+            return self.answers.pop(0)
+        return self.answer
+    def cri_get_state(self, instance_data):
+        return Answer(self.next_answer())
+    def cri_get_address(self, instance_data):
+        return Answer(self.next_answer())
+    def cri_get_ip_address(self, instance_data):
+        return Answer(self.next_answer())
+    def cancel_creates(self):
+        self.cancels += 1
+    def cri_drop_node(self, instance_data):
+        self.dropped.append(instance_data['instance_id'])
+        return Answer(self.next_answer())
+    def cri_create_node(self, resolved_node_definition):
+        if resolved_node_definition.get('fail'):
+            return Answer(resolved_node_definition['fail'])
+        self.created.append(resolved_node_definition['node_id'])
+        return Answer('i-' + resolved_node_definition['node_id'])
+
+def instance_data(instance_id='i-1'):
+    return dict(instance_id=instance_id, node_id='node-1',
+                resource=dict(type='fake', endpoint='http://fake'))
+
+class NotFoundCacheTest(unittest.TestCase):
+    def test_add(self):
+        cache = NotFoundCache(ttl=60)
+        ok_('a' not in cache)
+        cache.add('a')
+        ok_('a' in cache)
+        ok_('b' not in cache)
+    def test_expiry(self):
+        cache = NotFoundCache(ttl=0.05)
+        cache.add('a')
+        time.sleep(0.1)
+        ok_('a' not in cache)
+        eq_(cache.expires, dict())
+
+class TranslatesNotFoundTest(unittest.TestCase):
+    def test_translate(self):
+        @translates_not_found(lambda ex: isinstance(ex, KeyError))
+        def lookup(ex):
+            raise ex
+        self.assertRaises(InstanceNotFound, lookup, KeyError('gone'))
+        self.assertRaises(ValueError, lookup, ValueError('other'))
+        self.assertRaises(InstanceNotFound, lookup, InstanceNotFound('i-1'))
+    def test_result(self):
+        @translates_not_found(lambda ex: True)
+        def lookup():
+            return 'ready'
+        eq_(lookup(), 'ready')
+
+class MissingTrackerTest(unittest.TestCase):
+    def test_grace(self):
+        tracker = MissingTracker(grace=0.05)
+        ok_(not tracker.missed('a'))
+        time.sleep(0.1)
+        ok_(tracker.missed('a'))
+        ok_(not tracker.missed('b'))
+    def test_found(self):
+        tracker = MissingTracker(grace=0.05)
+        tracker.missed('a')
+        time.sleep(0.1)
+        tracker.found('a')
+        ok_(not tracker.missed('a'))
+
+class QueryTest(unittest.TestCase):
+    def setUp(self):
+        self.retry_wait = resourcehandler.not_found_retry_wait
+        resourcehandler.not_found_retry_wait = 0.01
+        resourcehandler.not_found_cache = NotFoundCache()
+        resourcehandler.missing_tracker = MissingTracker(grace=0)
+    def tearDown(self):
+        resourcehandler.not_found_retry_wait = self.retry_wait
+    def test_found(self):
+        rh = FakeResourceHandler(status.READY)
+        eq_(rh.get_state(instance_data()), status.READY)
+        eq_(rh.get_state(instance_data()), status.READY)
+        eq_(rh.calls, 2)
+    def test_missing(self):
+        rh = FakeResourceHandler(InstanceNotFound('i-1'))
+        eq_(rh.get_state(instance_data()), status.SHUTDOWN)
+        eq_(rh.get_address(instance_data()), [])
+        eq_(rh.get_ip_address(instance_data()), None)
+        eq_(rh.calls, 1)
+    def test_drop_not_cached(self):
+        rh = FakeResourceHandler(InstanceNotFound('i-1'))
+        eq_(rh.get_state(instance_data()), status.SHUTDOWN)
+        eq_(rh.drop_node(instance_data()), None)
+        eq_(rh.drop_node(instance_data()), None)
+        eq_(rh.calls, 3)
+    def test_missing_within_grace(self):
+        resourcehandler.missing_tracker = MissingTracker(grace=60)
+        rh = FakeResourceHandler([InstanceNotFound('i-1'), status.PENDING,
+                                  InstanceNotFound('i-1')])
+        self.assertRaises(InstanceNotFound, rh.get_state, instance_data())
+        eq_(rh.get_state(instance_data()), status.PENDING)
+        self.assertRaises(InstanceNotFound, rh.get_state, instance_data())
+        eq_(rh.calls, 3)
+    def test_missing_after_grace(self):
+        resourcehandler.missing_tracker = MissingTracker(grace=0.05)
+        rh = FakeResourceHandler(InstanceNotFound('i-1'))
+        self.assertRaises(InstanceNotFound, rh.get_state, instance_data())
+        time.sleep(0.1)
+        eq_(rh.get_state(instance_data()), status.SHUTDOWN)
+    def test_drop_retried_within_grace(self):
+        resourcehandler.missing_tracker = MissingTracker(grace=60)
+        rh = FakeResourceHandler([InstanceNotFound('i-1'),
+                                  InstanceNotFound('i-1'), 'dropped'])
+        eq_(rh.drop_node(instance_data()), 'dropped')
+        eq_(rh.dropped, ['i-1'] * 3)
+    def test_drop_missing_after_grace(self):
+        resourcehandler.missing_tracker = MissingTracker(grace=0.05)
+        rh = FakeResourceHandler(InstanceNotFound('i-1'))
+        eq_(rh.drop_node(instance_data()), None)
+        ok_(rh.calls > 1)
+    def test_missing_is_per_instance(self):
+        rh = FakeResourceHandler(InstanceNotFound('i-1'))
+        rh.get_state(instance_data('i-1'))
+        rh.get_state(instance_data('i-2'))
+        eq_(rh.calls, 2)
+    def test_missing_expires(self):
+        resourcehandler.not_found_cache = NotFoundCache(ttl=0.05)
+        rh = FakeResourceHandler(InstanceNotFound('i-1'))
+        rh.get_state(instance_data())
+        time.sleep(0.1)
+        rh.get_state(instance_data())
+        eq_(rh.calls, 2)
+    def test_other_errors(self):
+        rh = FakeResourceHandler(ValueError('API down'))
+        self.assertRaises(ValueError, rh.get_state, instance_data())
+        self.assertRaises(ValueError, rh.get_state, instance_data())
+        eq_(rh.calls, 2)
+
+class CreateNodesTest(unittest.TestCase):
+    def node_defs(self, count, fail_at=None, error=None):
+        return [dict(node_id=str(i), resource=dict(type='fake'),
+                     fail=(error or Exception('create failed'))
+                          if i == fail_at else None)
+                for i in range(count)]
+    def test_create(self):
+        rh = FakeResourceHandler(None)
+        eq_(CreateNodes(self.node_defs(3)).perform(rh), ['i-0', 'i-1', 'i-2'])
+        eq_(rh.dropped, [])
+    def test_rollback(self):
+        rh = FakeResourceHandler(None)
+        self.assertRaises(Exception,
+                          CreateNodes(self.node_defs(3, fail_at=2)).perform, rh)
+        eq_(rh.dropped, ['i-0', 'i-1'])
+    def test_interrupted(self):
+        rh = FakeResourceHandler(None)
+        self.assertRaises(KeyboardInterrupt,
+                          CreateNodes(self.node_defs(3, fail_at=1,
+                                                     error=KeyboardInterrupt())).perform, rh)
+        eq_(rh.dropped, ['i-0'])
+    def test_rollback_continues_after_drop_failure(self):
+        rh = FakeResourceHandler(ValueError('drop failed'))
+        self.assertRaises(Exception,
+                          CreateNodes(self.node_defs(3, fail_at=2)).perform, rh)
+        eq_(rh.dropped, ['i-0', 'i-1'])
+    def test_interrupt_cancels_creates(self):
+        rh = FakeResourceHandler(None)
+        self.assertRaises(KeyboardInterrupt, rh.create_node,
+                          dict(node_id='0', resource=dict(type='fake'),
+                               fail=KeyboardInterrupt()))
+        self.assertRaises(KeyboardInterrupt, rh.create_nodes,
+                          self.node_defs(2, fail_at=1, error=KeyboardInterrupt()))
+        eq_(rh.cancels, 2)
+    def test_failure_does_not_cancel(self):
+        rh = FakeResourceHandler(None)
+        self.assertRaises(Exception, rh.create_nodes, self.node_defs(2, fail_at=1))
+        eq_(rh.cancels, 0)
@@ -0,0 +1,178 @@
+### Copyright 2014, MTA SZTAKI, www.sztaki.hu
+###
+### Licensed under the Apache License, Version 2.0 (the "License");
+### you may not use this file except in compliance with the License.
+### You may obtain a copy of the License at
+###
+###    http://www.apache.org/licenses/LICENSE-2.0
+###
+### Unless required by applicable law or agreed to in writing, software
+### distributed under the License is distributed on an "AS IS" BASIS,
+### WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+### See the License for the specific language governing permissions and
+### limitations under the License.
+
+""" Offline benchmark of the cloudsigma and cloudbroker resource handler
+plugins.
+
+Runs parallel create, state, address and drop operations through
+:class:`~occo.resourcehandler.ResourceHandler` against a local
+:class:`~fake_rest.FakeCloudSigma` and :class:`~fake_rest.FakeCloudBroker`,
+and reports throughput, latency percentiles, the API calls made per
+operation and the injected errors that were retried.
+
+Example::
+
+    python occo_test/rest_bench.py --plugin cloudsigma --nodes 50 \\
+        --workers 10 --latency 0.02 --error-rate 0.05
+"""
+
+import argparse
+import logging
+import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import occo.infobroker as ib
+import occo.plugins.resourcehandler.cloudsigma as cloudsigma
+import occo.plugins.resourcehandler.cloudbroker
+from occo.resourcehandler import ResourceHandler
+from fake_rest import FakeCloudSigma, FakeCloudBroker
+from bench_util import AuthDataProvider, Phase
+
+log = logging.getLogger('occo_test.rest_bench')
+
+LIBDRIVE_ID = 'f1c2a3b4-0000-4000-8000-000000000001'
+
+def cloudsigma_resource(cloud, args):
+    resource = dict(type='cloudsigma', endpoint=cloud.endpoint,
+                    libdrive_id=LIBDRIVE_ID,
+                    description=dict(cpu=1000, mem=1024 ** 3,
+                                     vnc_password='bench'),
+                    poll_floor=args.poll_floor, poll_ceiling=args.poll_ceiling)
+    if args.sweep:
+        resource['status_sweep_interval'] = args.sweep
+    if args.drive_pool:
+        resource['drive_pool_size'] = args.drive_pool
+    return resource
+
+def cloudbroker_resource(cloud, args):
+    resource = dict(type='cloudbroker', endpoint=cloud.url,
+                    description=dict(deployment_id='bench-deployment',
+                                     instance_type_id='bench-type'))
+    if args.sweep:
+        resource['status_sweep_interval'] = args.sweep
+    return resource
+
+def node_definition(resource, infra_id):
+    return dict(name='bench', infra_id=infra_id, node_id=str(uuid.uuid4()),
+                context='#cloud-config\n', resource=resource)
+
+def instance_data(node_def, instance_id):
+    return dict(instance_id=instance_id, node_id=node_def['node_id'],
+                resource=node_def['resource'],
+                resolved_node_definition=node_def)
+
+def run(plugin, cloud, make_resource, args):
+    rh = ResourceHandler()
+    infra_id = str(uuid.uuid4())
+    node_defs = [node_definition(make_resource(cloud, args), infra_id)
+                 for i in range(args.nodes)]
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    phases = list()
+    try:
+        with Phase('create', cloud) as phase:
+            if args.batch:
+                instance_ids = phase.timed(rh.create_nodes, node_defs) or list()
+            else:
+                instance_ids = list(executor.map(
+                    lambda nd: phase.timed(rh.create_node, nd), node_defs))
+        phases.append(phase)
+        nodes = [instance_data(nd, iid)
+                 for nd, iid in zip(node_defs, instance_ids) if iid]
+
+        with Phase('get_state', cloud) as phase:
+            for i in range(args.polls):
+                list(executor.map(lambda n: phase.timed(rh.get_state, n), nodes))
+        phases.append(phase)
+
+        with Phase('get_address', cloud) as phase:
+            list(executor.map(lambda n: phase.timed(rh.get_address, n), nodes))
+        phases.append(phase)
+
+        with Phase('get_ip_address', cloud) as phase:
+            list(executor.map(lambda n: phase.timed(rh.get_ip_address, n), nodes))
+        phases.append(phase)
+
+        with Phase('drop', cloud) as phase:
+            list(executor.map(lambda n: phase.timed(rh.drop_node, n), nodes))
+        phases.append(phase)
+    finally:
+        executor.shutdown()
+
+    print('{0}: nodes={1} workers={2} latency={3}s error_rate={4} batch={5}'.format(
+        plugin, args.nodes, args.workers, args.latency, args.error_rate,
+        args.batch))
+    for phase in phases:
+        phase.report()
+
+def main(args):
+    ib.real_main_info_broker = ib.InfoRouter(sub_providers=[
+        AuthDataProvider(dict(email='bench@example.com', password='bench'))])
+    # Retries after failed API calls would otherwise wait 6 s each
+    cloudsigma.wait_time_between_api_call_retries = args.retry_wait
+    fake_args = dict(latency=args.latency, jitter=args.jitter,
+                     error_rate=args.error_rate)
+    if args.plugin in ('cloudsigma', 'both'):
+        cloud = FakeCloudSigma(clone_time=args.clone_time,
+                               boot_time=args.boot_time,
+                               stop_time=args.stop_time, **fake_args).start()
+        try:
+            run('cloudsigma', cloud, cloudsigma_resource, args)
+        finally:
+            cloud.stop()
+    if args.plugin in ('cloudbroker', 'both'):
+        cloud = FakeCloudBroker(boot_time=args.boot_time,
+                                stop_time=args.stop_time, **fake_args).start()
+        try:
+            run('cloudbroker', cloud, cloudbroker_resource, args)
+        finally:
+            cloud.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the cloudsigma and cloudbroker plugins '
+        'against local fake REST APIs')
+    parser.add_argument('--plugin', choices=['cloudsigma', 'cloudbroker', 'both'],
+                        default='both')
+    parser.add_argument('--nodes', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=10)
+    parser.add_argument('--polls', type=int, default=5,
+                        help='state queries per node')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='seconds added to every API call')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='probability that an API call fails with 503')
+    parser.add_argument('--clone-time', type=float, default=0.5)
+    parser.add_argument('--boot-time', type=float, default=0.5)
+    parser.add_argument('--stop-time', type=float, default=0.2)
+    parser.add_argument('--poll-floor', type=float, default=0.05,
+                        help='shortest CloudSigma poll interval')
+    parser.add_argument('--poll-ceiling', type=float, default=1.0,
+                        help='longest CloudSigma poll interval')
+    parser.add_argument('--retry-wait', type=float, default=0.1,
+                        help='wait after a failed CloudSigma API call')
+    parser.add_argument('--batch', action='store_true',
+                        help='create all nodes with one create_nodes call')
+    parser.add_argument('--sweep', type=float, default=None,
+                        help='enable status sweeps with this interval')
+    parser.add_argument('--drive-pool', type=int, default=None,
+                        help='keep this many cloned CloudSigma drives ready')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+    main(args)
@@ -30,6 +30,7 @@ setuptools.setup(
         'occo.plugins.resourcehandler.nova',
         'occo.plugins.resourcehandler.azure_vm',
         'occo.plugins.resourcehandler.azure_aci',
+        'occo.plugins.resourcehandler.azure_common',
         'occo.plugins.resourcehandler.cloudbroker',
         'occo.plugins.resourcehandler.cloudsigma',
         'occo.plugins.resourcehandler.docker',